@@ -1,27 +1,43 @@
+import time
+STARTUP_BEGIN = time.perf_counter()  # 启动计时，包含下面的模块导入
 import sys
 import os
 import re
 import threading
 import subprocess
-import shutil
-import time
-import glob
+import hashlib
+import html
 import datetime
-from lxml import etree as ET
-from PyQt5.QtCore import QEvent, QObject, QUrl, Qt, pyqtSignal, pyqtSlot, QDir, QTimer
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtMultimediaWidgets import QVideoWidget
+import sqlite3
+from collections import OrderedDict, deque
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from retrobat_core import (CURRENT_VERSION, load_etree, ScanIndex, MediaIndex, GameTable, SearchIndex,
+                           fill_game_table, GamelistWriter, BulkDeleter, MetadataImporter,
+                           EXPORT_FIELDS, GameListExporter, video_key_lookup, EditSession,
+                           GlobalSearchIndex, LibraryScanner, LibraryAuditor, HashCache,
+                           DuplicateFinder, MEDIA_FOLDERS, rom_keys, diff_gamelist, EditJournal,
+                           tracer, TRACE_SPANS, SortIndex, SORT_KEYS, INFO_FIELDS)
+from PyQt5.QtCore import (QEvent, QObject, QUrl, Qt, pyqtSignal, pyqtSlot, QDir, QTimer,
+                          QAbstractListModel, QModelIndex, QSize, QFileSystemWatcher)
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout,
-                             QPushButton, QFileDialog, QListWidget,
+                             QPushButton, QFileDialog, QListWidget, QListView,
                              QHBoxLayout, QLabel, QComboBox, QCheckBox,
                              QSpacerItem, QSizePolicy, QDesktopWidget,
                              QTextBrowser, QDialog, QLineEdit,
-                             QDialogButtonBox, QMessageBox, QToolButton, QGroupBox)
-from PyQt5.QtGui import QTextCursor, QFont, QColor
-from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest
-from PyQt5.Qt import QDesktopServices
+                             QDialogButtonBox, QMessageBox, QToolButton, QGroupBox,
+                             QListWidgetItem, QShortcut, QTableWidget, QTableWidgetItem)
+from PyQt5.QtGui import (QTextCursor, QFont, QColor, QKeySequence, QDesktopServices,
+                         QImage, QImageReader, QPixmap)
 
-CURRENT_VERSION = "1.3.0"
+# QtMultimedia 加载较慢，第一次播放视频时才导入
+QMediaPlayer = QMediaContent = QVideoWidget = None
+
+def load_multimedia():
+    global QMediaPlayer, QMediaContent, QVideoWidget
+    if QMediaPlayer is None:
+        from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
+        from PyQt5.QtMultimediaWidgets import QVideoWidget
 
 class QListWidgetItemEvent(QEvent):
     EVENT_TYPE = QEvent.registerEventType()
@@ -30,6 +46,372 @@ class QListWidgetItemEvent(QEvent):
         super().__init__(QListWidgetItemEvent.EVENT_TYPE)
         self.category_name = category_name
 
+class GameRowsEvent(QEvent):
+    EVENT_TYPE = QEvent.registerEventType()
+
+    def __init__(self, generation, start, end, progress, done=False, error=None):
+        super().__init__(GameRowsEvent.EVENT_TYPE)
+        self.generation = generation
+        self.start = start
+        self.end = end
+        self.progress = progress
+        self.done = done
+        self.error = error
+
+class GameListModel(QAbstractListModel):
+    """基于 GameTable 的列表模型：按需分批暴露行，过滤与编辑只发出局部变更信号"""
+
+    FETCH_BATCH = 2000
+    MAX_REMOVE_RUNS = 64
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.table = GameTable()
+        self.ids = array('I')
+        self.highlight_id = None
+        self.detail_field = None
+        self._fetched = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._fetched
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._fetched < len(self.ids)
+
+    def fetchMore(self, parent):
+        count = min(self.FETCH_BATCH, len(self.ids) - self._fetched)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._fetched, self._fetched + count - 1)
+        self._fetched += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._fetched:
+            return None
+        game_id = self.ids[index.row()]
+        if role == Qt.DisplayRole:
+            name = self.table.names[game_id]
+            if self.detail_field is not None:
+                info = self.table.info[game_id]
+                value = info[INFO_FIELDS.index(self.detail_field)] if info else ""
+                if value:
+                    return f"{name}  [{self.detail_text(self.detail_field, value)}]"
+            return name
+        if game_id == self.highlight_id:
+            if role == Qt.BackgroundRole:
+                return QColor(76, 175, 80)
+            if role == Qt.ForegroundRole:
+                return QColor(255, 255, 255)
+        return None
+
+    @staticmethod
+    def detail_text(field, value):
+        """按排序字段显示在名称后的值"""
+        try:
+            if field == 'rating':
+                return f"★{float(value) * 5:.1f}"
+            if field == 'playcount':
+                return f"{int(value)}次"
+        except ValueError:
+            return value
+        if len(value) >= 8 and value[:8].isdigit():
+            return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+        return value
+
+    def game_id(self, row):
+        return self.ids[row] if 0 <= row < len(self.ids) else None
+
+    def row_of(self, game_id):
+        try:
+            return self.ids.index(game_id)
+        except ValueError:
+            return -1
+
+    def set_view(self, table, ids):
+        with tracer.span('list.rebuild', rows=len(ids)):
+            self.beginResetModel()
+            self.table = table
+            self.ids = ids
+            self._fetched = min(self.FETCH_BATCH, len(ids))
+            self.endResetModel()
+
+    def append_ids(self, new_ids):
+        """加载过程中追加行；全部行已暴露时直接插入，否则留给 fetchMore"""
+        fully_fetched = self._fetched == len(self.ids)
+        self.ids.extend(new_ids)
+        if fully_fetched and self._fetched < self.FETCH_BATCH:
+            self.fetchMore(QModelIndex())
+
+    @tracer.traced('list.narrow')
+    def narrow(self, ids):
+        """新视图是当前视图的子序列（如关键字变长）时只移除消失的行，否则整体重置"""
+        keep = set(ids)
+        runs = []
+        start = None
+        for row, game_id in enumerate(self.ids):
+            if game_id in keep:
+                if start is not None:
+                    runs.append((start, row - 1))
+                    start = None
+            elif start is None:
+                start = row
+        if start is not None:
+            runs.append((start, len(self.ids) - 1))
+
+        if len(runs) > self.MAX_REMOVE_RUNS \
+                or array('I', (game_id for game_id in self.ids if game_id in keep)) != ids:
+            self.set_view(self.table, ids)
+            return
+        self.remove_runs(runs)
+
+    def remove_rows(self, rows):
+        runs = []
+        for row in sorted(set(rows)):
+            if runs and runs[-1][1] == row - 1:
+                runs[-1] = (runs[-1][0], row)
+            else:
+                runs.append((row, row))
+        self.remove_runs(runs)
+
+    def remove_runs(self, runs):
+        for begin, end in reversed(runs):
+            if begin < self._fetched:
+                visible_end = min(end, self._fetched - 1)
+                self.beginRemoveRows(QModelIndex(), begin, visible_end)
+                del self.ids[begin:end + 1]
+                self._fetched -= visible_end - begin + 1
+                self.endRemoveRows()
+            else:
+                del self.ids[begin:end + 1]
+
+    def refresh_game(self, game_id):
+        row = self.row_of(game_id)
+        if 0 <= row < self._fetched:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def set_highlight(self, game_id):
+        old_id, self.highlight_id = self.highlight_id, game_id
+        if old_id is not None:
+            self.refresh_game(old_id)
+        self.refresh_game(game_id)
+
+class CallbackEvent(QEvent):
+    """把后台线程的结果交回界面线程处理"""
+    EVENT_TYPE = QEvent.registerEventType()
+
+    def __init__(self, callback, *args):
+        super().__init__(CallbackEvent.EVENT_TYPE)
+        self.callback = callback
+        self.args = args
+
+class LibraryWatcher(QObject):
+    """监视各机种目录、gamelist.xml 与当前机种的媒体目录，一段时间内的多次变化合并为
+    每个机种一次 changed(机种, 媒体目录是否变化) 信号；系统监视不可用的路径改为定期比较 mtime"""
+
+    changed = pyqtSignal(str, bool)
+    COALESCE_MS = 500
+    POLL_INTERVAL_MS = 5000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_path_changed)
+        self.watcher.directoryChanged.connect(self._on_path_changed)
+        self._owners = {}
+        self._media_paths = set()
+        self._polled = {}
+        self._pending = {}
+        self.coalesce_timer = QTimer(self)
+        self.coalesce_timer.setSingleShot(True)
+        self.coalesce_timer.timeout.connect(self._emit_pending)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self._poll)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _add(self, path, system):
+        self._owners[path] = system
+        if not os.path.exists(path) or not self.watcher.addPath(path):
+            self._polled[path] = self._mtime(path)
+            if not self.poll_timer.isActive():
+                self.poll_timer.start(self.POLL_INTERVAL_MS)
+
+    def _remove(self, paths):
+        paths = [path for path in paths if path in self._owners]
+        watched = set(self.watcher.files()) | set(self.watcher.directories())
+        if any(path in watched for path in paths):
+            self.watcher.removePaths([path for path in paths if path in watched])
+        for path in paths:
+            self._owners.pop(path, None)
+            self._polled.pop(path, None)
+        if not self._polled:
+            self.poll_timer.stop()
+
+    def watch_systems(self, category_dirs):
+        """监视每个机种的目录和 gamelist.xml，替换之前的监视列表"""
+        self._remove(list(self._owners))
+        self._media_paths.clear()
+        for system, xml_path in category_dirs.items():
+            self._add(os.path.dirname(xml_path), system)
+            self._add(xml_path, system)
+
+    def watch_media(self, system, system_dir):
+        """只监视当前机种的媒体目录，切换机种时替换"""
+        self._remove(self._media_paths)
+        self._media_paths = {os.path.join(system_dir, folder) for folder in MEDIA_FOLDERS}
+        for path in self._media_paths:
+            self._add(path, system)
+
+    def _on_path_changed(self, path):
+        system = self._owners.get(path)
+        if system is None:
+            return
+        # 原子替换会让文件监视失效，文件重新出现后要再加回来
+        if path not in self.watcher.files() and os.path.isfile(path):
+            self.watcher.addPath(path)
+        self._pending[system] = self._pending.get(system, False) or path in self._media_paths
+        self.coalesce_timer.start(self.COALESCE_MS)
+
+    def _poll(self):
+        for path, mtime_ns in list(self._polled.items()):
+            current = self._mtime(path)
+            if current != mtime_ns:
+                self._polled[path] = current
+                self._on_path_changed(path)
+
+    def _emit_pending(self):
+        pending, self._pending = self._pending, {}
+        for system in sorted(pending):
+            self.changed.emit(system, pending[system])
+
+class StatusLog:
+    """状态消息的环形缓冲：只保留最近 max_lines 条；各线程写入，界面线程按批取出"""
+
+    LEVELS = {'info': "信息", 'success': "成功", 'error': "错误"}
+
+    def __init__(self, max_lines=5000):
+        self.records = deque(maxlen=max_lines)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, message, level):
+        """线程安全；返回 True 表示这是新一批的第一条，调用方需安排一次刷新"""
+        record = (datetime.datetime.now(), level, message)
+        with self._lock:
+            self.records.append(record)
+            self._pending.append(record)
+            return len(self._pending) == 1
+
+    def take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def filtered(self, level=None):
+        with self._lock:
+            return [record for record in self.records if level is None or record[1] == level]
+
+    def export(self, file_path, level=None):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for timestamp, record_level, message in self.filtered(level):
+                f.write(f"{timestamp:%Y-%m-%d %H:%M:%S} [{self.LEVELS[record_level]}] {message}\n")
+
+class ImageCache:
+    """按字节数限制的 QImage LRU 缓存，解码线程与界面线程共用"""
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        cost = image.sizeInBytes()
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.sizeInBytes()
+            self._images[key] = image
+            self.total_bytes += cost
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.total_bytes -= evicted.sizeInBytes()
+
+class ThumbnailLoader:
+    """后台解码图片并缩放到预览尺寸：依次查内存 LRU、磁盘缩略图缓存，最后才解码原图"""
+
+    def __init__(self, size, cache, max_workers=2):
+        self.size = size
+        self.cache = cache
+        self.cache_dir = None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _disk_path(self, path, stat):
+        digest = hashlib.sha1(
+            f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{self.size.width()}x{self.size.height()}".encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.png")
+
+    def _decode(self, path):
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        source_size = reader.size()
+        # 只缩小不放大；让解码器直接输出目标尺寸，避免先解出整张原图
+        if source_size.isValid() and (source_size.width() > self.size.width()
+                                      or source_size.height() > self.size.height()):
+            reader.setScaledSize(source_size.scaled(self.size, Qt.KeepAspectRatio))
+        return reader.read()
+
+    @tracer.traced('media.thumbnail')
+    def load(self, path):
+        """在线程池中调用，返回缩放后的 QImage；文件不存在或无法解码时返回 None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_mtime_ns)
+        image = self.cache.get(key)
+        if image is not None:
+            tracer.count('media.thumbnail.hit')
+            return image
+
+        cache_dir = self.cache_dir
+        disk_path = self._disk_path(path, stat) if cache_dir else None
+        image = QImage(disk_path) if disk_path and os.path.exists(disk_path) else None
+        if image is None or image.isNull():
+            image = self._decode(path)
+            if image.isNull():
+                return None
+            if disk_path:
+                try:
+                    os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                    temp_path = f"{disk_path}.tmp"
+                    if image.save(temp_path, 'PNG'):
+                        os.replace(temp_path, disk_path)
+                except OSError:
+                    pass
+        self.cache.put(key, image)
+        return image
+
 class ModifyNameDialog(QDialog):
     def __init__(self, old_name, parent=None):
         super().__init__(parent)
@@ -55,32 +437,286 @@ class ModifyNameDialog(QDialog):
     def get_new_name(self):
         return self.name_edit.text().strip()
 
+class ExportDialog(QDialog):
+    SCOPES = (
+        ('view', "当前列表（含过滤结果）"),
+        ('category', "当前机种全部游戏"),
+        ('all', "所有机种"),
+    )
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("导出游戏列表")
+        self.setFixedSize(360, 300)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("导出范围:"))
+        self.scope_combo = QComboBox()
+        for scope, label in self.SCOPES:
+            self.scope_combo.addItem(label, scope)
+        layout.addWidget(self.scope_combo)
+
+        layout.addWidget(QLabel("导出格式:"))
+        self.format_combo = QComboBox()
+        for fmt, label in GameListExporter.FORMATS.items():
+            self.format_combo.addItem(f"{label} (*.{fmt})", fmt)
+        layout.addWidget(self.format_combo)
+
+        layout.addWidget(QLabel("导出字段:"))
+        self.field_checks = {}
+        fields_layout = QHBoxLayout()
+        for field, label in EXPORT_FIELDS.items():
+            if field == 'system':
+                continue
+            check = QCheckBox(label)
+            check.setChecked(field in ('rom', 'name'))
+            self.field_checks[field] = check
+            fields_layout.addWidget(check)
+        layout.addLayout(fields_layout)
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.Ok | QDialogButtonBox.Cancel,
+            Qt.Horizontal, self
+        )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+    def get_options(self):
+        fields = [field for field, check in self.field_checks.items() if check.isChecked()]
+        scope = self.scope_combo.currentData()
+        if scope == 'all':
+            fields.insert(0, 'system')
+        return scope, self.format_combo.currentData(), fields
+
+class DiagnosticsDialog(QDialog):
+    """隐藏的诊断面板（Ctrl+Shift+D）：查看最近的耗时与计数，导出 Chrome trace，
+    或用 cProfile 分析下一次指定的操作"""
+
+    REFRESH_MS = 1000
+    MAX_ROWS = 300
+    profile_done = pyqtSignal(str, object, str)
+
+    def __init__(self, report, parent=None):
+        super().__init__(parent)
+        self.report = report
+        self.setWindowTitle("诊断")
+        self.resize(760, 600)
+        self._profile = None
+        self._marker = None
+
+        layout = QVBoxLayout()
+        top_layout = QHBoxLayout()
+        self.enable_check = QCheckBox("启用计时")
+        self.enable_check.setChecked(tracer.enabled)
+        self.enable_check.toggled.connect(self._set_enabled)
+        top_layout.addWidget(self.enable_check)
+        top_layout.addStretch()
+        clear_button = QPushButton("清空")
+        clear_button.clicked.connect(self.clear)
+        top_layout.addWidget(clear_button)
+        export_button = QPushButton("导出 Trace")
+        export_button.setToolTip("导出为 Chrome trace JSON，可在 chrome://tracing 或 Perfetto 中查看")
+        export_button.clicked.connect(self.export_trace)
+        top_layout.addWidget(export_button)
+        layout.addLayout(top_layout)
+
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+        self.summary_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(self.summary_label)
+
+        self.span_table = QTableWidget(0, 5)
+        self.span_table.setHorizontalHeaderLabels(["操作", "耗时 (ms)", "开始 (s)", "线程", "参数"])
+        self.span_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.span_table.verticalHeader().setVisible(False)
+        self.span_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.span_table, stretch=2)
+
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(QLabel("用 cProfile 分析下一次:"))
+        self.profile_combo = QComboBox()
+        self.profile_combo.addItems(TRACE_SPANS)
+        profile_layout.addWidget(self.profile_combo)
+        profile_button = QPushButton("开始")
+        profile_button.clicked.connect(self.arm_profile)
+        profile_layout.addWidget(profile_button)
+        self.save_profile_button = QPushButton("保存 .prof")
+        self.save_profile_button.setEnabled(False)
+        self.save_profile_button.clicked.connect(self.save_profile)
+        profile_layout.addWidget(self.save_profile_button)
+        profile_layout.addStretch()
+        layout.addLayout(profile_layout)
+
+        self.profile_text = QTextBrowser()
+        self.profile_text.setFont(QFont("Consolas", 9))
+        self.profile_text.setLineWrapMode(QTextBrowser.NoWrap)
+        layout.addWidget(self.profile_text, stretch=1)
+        self.setLayout(layout)
+
+        self.profile_done.connect(self._show_profile)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start(self.REFRESH_MS)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def _set_enabled(self, checked):
+        tracer.enabled = checked
+        self.refresh()
+
+    def clear(self):
+        tracer.clear()
+        self.refresh()
+
+    def refresh(self):
+        spans = tracer.recent(self.MAX_ROWS)
+        marker = (len(tracer.spans), spans[-1] if spans else None, tuple(tracer.counters.items()))
+        if marker == self._marker:
+            return
+        self._marker = marker
+
+        lines = [f"{name} ×{count}，共 {total:.1f} ms，最长 {longest:.1f} ms"
+                 for name, (count, total, longest) in sorted(tracer.summary().items())]
+        counters = "，".join(f"{name}={value}" for name, value in sorted(tracer.counters.items()))
+        if counters:
+            lines.append(f"计数：{counters}")
+        self.summary_label.setText('\n'.join(lines) if lines else
+                                   ("暂无记录" if tracer.enabled else "计时未启用"))
+
+        self.span_table.setRowCount(len(spans))
+        for row, (name, _, thread_name, start_ns, duration_ns, args) in enumerate(reversed(spans)):
+            cells = (name, f"{duration_ns / 1e6:.2f}", f"{(start_ns - tracer.origin_ns) / 1e9:.3f}",
+                     thread_name, " ".join(f"{key}={value}" for key, value in args.items()))
+            for column, text in enumerate(cells):
+                self.span_table.setItem(row, column, QTableWidgetItem(text))
+
+    def export_trace(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出 Trace", f"retrobat-trace-{datetime.datetime.now():%Y%m%d%H%M%S}.json",
+            "Chrome Trace (*.json)")
+        if not file_path:
+            return
+        try:
+            count = tracer.dump_chrome_trace(file_path)
+        except OSError as e:
+            self.report(f"Trace 导出失败：{str(e)}", True)
+            return
+        self.report(f"已导出{count}个计时记录：{file_path}", False)
+
+    def arm_profile(self):
+        name = self.profile_combo.currentText()
+        tracer.profile_next(name, self._on_profiled)
+        self.save_profile_button.setEnabled(False)
+        self.profile_text.setPlainText(f"等待下一次「{name}」操作……")
+
+    def _on_profiled(self, name, profile):
+        """在执行该操作的线程中调用"""
+        import io
+        import pstats
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(40)
+        self.profile_done.emit(name, profile, stream.getvalue())
+
+    def _show_profile(self, name, profile, text):
+        self._profile = profile
+        self.save_profile_button.setEnabled(True)
+        self.profile_text.setPlainText(f"「{name}」的分析结果（按累计耗时排序）\n{text}")
+
+    def save_profile(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存分析结果", f"retrobat-{datetime.datetime.now():%Y%m%d%H%M%S}.prof", "cProfile (*.prof)")
+        if not file_path:
+            return
+        try:
+            self._profile.dump_stats(file_path)
+        except OSError as e:
+            self.report(f"分析结果保存失败：{str(e)}", True)
+            return
+        self.report(f"分析结果已保存：{file_path}", False)
+
 class XMLNameExtractor(QWidget):
     status_signal = pyqtSignal(str, bool)
+    AUTOSAVE_DELAY_MS = 3000
+    SELECTION_DELAY_MS = 150
+    LOG_FLUSH_MS = 100
+    LOG_MAX_LINES = 5000
+    PREVIEW_SIZE = QSize(300, 225)
+    IMAGE_KINDS = (
+        ('image', "图片", ('image', 'boxart')),
+        ('thumbnail', "缩略图", ('thumbnail', 'image')),
+        ('marquee', "标题图", ('marquee',)),
+    )
+    PREFETCH_BYTES = 1 << 20
 
     def __init__(self):
         super().__init__()
         self.enable_video_playback = False  # 新增播放控制状态
+        self._startup_reported = False
+        self._network_manager = None
         self.initUI()
         self.category_dirs = {}
-        self.name_video_mapping = {}
+        self.library_root = None
+        self.scan_index = None
+        self.media_index = MediaIndex()
+        self.current_category = None
         self.media_player = None
-        self.raw_results = []
-        self.sorted_results = []
-        self.current_tree = None
+        self.game_table = GameTable()
+        self.search_index = SearchIndex(self.game_table)
+        self.sort_index = SortIndex(self.search_index)
+        self.sort_key = 'file'
+        self._loaded_count = 0
         self.current_xml_path = None
+        self._load_generation = 0
+        self._load_cancel = None
+        self.global_index = GlobalSearchIndex()
+        self._global_cancel = None
+        self._global_stale = True
+        self._pending_select_rom = None
+        self._writers = {}
+        self.edit_session = EditSession(self.game_table, None)
+        self.journal = None
+        self.diagnostics_dialog = None
+        self.save_executor = ThreadPoolExecutor(max_workers=1)
+        self.autosave_timer = QTimer()
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.timeout.connect(self.save_xml)
         self.lock = threading.Lock()
-        self.status_signal.connect(self._append_status, Qt.QueuedConnection)
-        self.last_highlight = None
+        self.status_log = StatusLog(self.LOG_MAX_LINES)
+        self.log_timer = QTimer()
+        self.log_timer.setSingleShot(True)
+        self.log_timer.timeout.connect(self._flush_status_log)
+        # 直接在发送线程里写入环形缓冲，不再为每条消息排队一个事件
+        self.status_signal.connect(self._append_status, Qt.DirectConnection)
         self.export_button = None
         self.dir_link_button = None
         self.status_bar.installEventFilter(self)
         self._last_export_path = None
-        self.deleted_games = []
+        # 已标记、尚未保存的删除：{gamelist.xml 路径: [rom 路径]}，保存时只处理当前机种
+        self.deleted_games = {}
         self.search_timer = QTimer()
         self.search_timer.setSingleShot(True)
         self.search_timer.timeout.connect(self.filter_games)
-        self.check_update()
+        self.media_executor = ThreadPoolExecutor(max_workers=2)
+        self._video_checked = {}
+        self._pending_video = None
+        self._known_mtimes = {}
+        self._loading = False
+        self.library_watcher = LibraryWatcher(self)
+        self.library_watcher.changed.connect(self._on_library_changed)
+        self.image_cache = ImageCache()
+        self.thumbnail_loader = ThumbnailLoader(self.PREVIEW_SIZE, self.image_cache)
+        self.selection_timer = QTimer()
+        self.selection_timer.setSingleShot(True)
+        self.selection_timer.timeout.connect(self._play_pending_video)
+        self.selection_timer.timeout.connect(self._load_pending_image)
 
     def initUI(self):
         main_layout = QHBoxLayout()
@@ -107,22 +743,55 @@ class XMLNameExtractor(QWidget):
 
         result_group = QVBoxLayout()
         self.search_box = QLineEdit()
-        self.search_box.setPlaceholderText("输入关键字过滤游戏...")
+        self.search_box.setPlaceholderText("输入关键字过滤游戏，可用 name: desc: rom: 限定字段...")
         self.search_box.textChanged.connect(self.on_search_text_changed)
-        result_group.addWidget(self.search_box)
-
-        self.result_list = QListWidget(self)
-        self.result_list.itemClicked.connect(self.handle_item_click)
-        self.result_list.setSelectionMode(QListWidget.ExtendedSelection)
+        search_row = QHBoxLayout()
+        search_row.addWidget(self.search_box)
+        self.global_search_check = QCheckBox("全局搜索")
+        self.global_search_check.setToolTip("在所有机种的 gamelist.xml 中搜索")
+        self.global_search_check.stateChanged.connect(self.toggle_global_search)
+        search_row.addWidget(self.global_search_check)
+        result_group.addLayout(search_row)
+
+        sort_row = QHBoxLayout()
+        sort_row.addWidget(QLabel("排序:"))
+        self.sort_combo = QComboBox()
+        for key, label in SORT_KEYS.items():
+            self.sort_combo.addItem(label, key)
+        self.sort_combo.setToolTip("名称与 ROM 按自然顺序排序（数字按大小），中文按拼音（需要安装 pypinyin，"
+                                   "未安装时中文标题按字符编码排在英文之后）；没有该字段的游戏排在最后")
+        self.sort_combo.currentIndexChanged.connect(self.on_sort_changed)
+        sort_row.addWidget(self.sort_combo, stretch=1)
+        self.sort_order_button = QToolButton()
+        self.sort_order_button.setText("升序")
+        self.sort_order_button.setCheckable(True)
+        self.sort_order_button.toggled.connect(self.on_sort_changed)
+        sort_row.addWidget(self.sort_order_button)
+        result_group.addLayout(sort_row)
+
+        self.global_result_list = QListWidget(self)
+        self.global_result_list.setUniformItemSizes(True)
+        self.global_result_list.itemClicked.connect(self.open_global_result)
+        self.global_result_list.setVisible(False)
+        result_group.addWidget(self.global_result_list)
+
+        self.result_model = GameListModel(self)
+        self.result_list = QListView(self)
+        self.result_list.setModel(self.result_model)
+        self.result_list.setUniformItemSizes(True)
+        self.result_list.setEditTriggers(QListView.NoEditTriggers)
+        self.result_list.clicked.connect(self.handle_item_click)
+        self.result_list.selectionModel().currentChanged.connect(self._on_current_changed)
+        self.result_list.setSelectionMode(QListView.ExtendedSelection)
         self.result_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 border: 1px solid #ccc;
                 padding: 2px;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 3px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #4CAF50;
                 color: white;
             }
@@ -144,19 +813,39 @@ class XMLNameExtractor(QWidget):
         original_right_layout = QVBoxLayout()
 
         video_container = QHBoxLayout()
-        self.video_widget = QVideoWidget(self)
-        self.video_widget.setFixedSize(300, 225)
-        self.video_widget.setStyleSheet("""
-            QVideoWidget {
+        # 先放一个同尺寸的占位控件，第一次播放时再换成 QVideoWidget
+        self.video_container = video_container
+        self.video_widget = QLabel(self)
+        self._style_video_widget(self.video_widget)
+        video_container.addWidget(self.video_widget, 0, Qt.AlignCenter)
+
+        image_group = QVBoxLayout()
+        self.image_label = QLabel("暂无图片", self)
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.image_label.setObjectName("imageLabel")
+        self.image_label.setFixedSize(self.PREVIEW_SIZE)
+        self.image_label.setStyleSheet("""
+            #imageLabel {
                 border: 3px solid #4CAF50;
                 border-radius: 8px;
                 background: #333;
-            }
-            QVideoWidget:hover {
-                border-color: #45a049;
+                color: #aaa;
             }
         """)
-        video_container.addWidget(self.video_widget, 0, Qt.AlignCenter)
+        image_group.addWidget(self.image_label, 0, Qt.AlignCenter)
+
+        image_options = QHBoxLayout()
+        self.image_kind_combo = QComboBox(self)
+        for kind, label, _ in self.IMAGE_KINDS:
+            self.image_kind_combo.addItem(label, kind)
+        self.image_kind_combo.currentIndexChanged.connect(self._load_pending_image)
+        image_options.addWidget(self.image_kind_combo)
+        self.thumb_cache_check = QCheckBox("缓存缩略图到磁盘", self)
+        self.thumb_cache_check.setChecked(True)
+        self.thumb_cache_check.stateChanged.connect(self._update_thumb_cache_dir)
+        image_options.addWidget(self.thumb_cache_check)
+        image_group.addLayout(image_options)
+        video_container.addLayout(image_group)
         original_right_layout.addLayout(video_container)
 
         desc_group = QVBoxLayout()
@@ -196,6 +885,7 @@ class XMLNameExtractor(QWidget):
         self.status_bar.setReadOnly(True)
         self.status_bar.setMinimumHeight(100)
         self.status_bar.setOpenLinks(False)
+        self.status_bar.document().setMaximumBlockCount(self.LOG_MAX_LINES)
         self.status_bar.setStyleSheet("""
             QTextBrowser {
                 border: 1px solid #ccc;
@@ -207,6 +897,20 @@ class XMLNameExtractor(QWidget):
         """)
         desc_group.addWidget(self.status_bar)
 
+        log_options = QHBoxLayout()
+        log_options.addWidget(QLabel("日志级别:", self))
+        self.log_level_combo = QComboBox(self)
+        self.log_level_combo.addItem("全部", None)
+        for level, label in StatusLog.LEVELS.items():
+            self.log_level_combo.addItem(label, level)
+        self.log_level_combo.currentIndexChanged.connect(self._render_status_log)
+        log_options.addWidget(self.log_level_combo)
+        log_options.addStretch()
+        self.export_log_button = QPushButton("导出日志", self)
+        self.export_log_button.clicked.connect(self.export_status_log)
+        log_options.addWidget(self.export_log_button)
+        desc_group.addLayout(log_options)
+
         original_right_layout.addLayout(desc_group)
 
         button_layout = QVBoxLayout()
@@ -230,6 +934,11 @@ class XMLNameExtractor(QWidget):
         self.export_button.clicked.connect(self.export_game_list)
         button_layout.addWidget(self.export_button)
 
+        self.audit_button = QPushButton("检查孤立媒体")
+        self.audit_button.setFixedHeight(35)
+        self.audit_button.clicked.connect(self.audit_library)
+        button_layout.addWidget(self.audit_button)
+
         export_dir_group = QGroupBox("导出目录")
         export_dir_group.setStyleSheet("""
             QGroupBox {
@@ -311,11 +1020,33 @@ class XMLNameExtractor(QWidget):
         self.delete_button.clicked.connect(self.delete_game)
         button_layout.addWidget(self.delete_button)
 
+        self.duplicate_button = QPushButton("查找重复ROM")
+        self.duplicate_button.setFixedHeight(35)
+        self.duplicate_button.setToolTip("按文件内容查找所有机种中完全相同的ROM，可将当前机种中的重复项标记为删除")
+        self.duplicate_button.clicked.connect(self.find_duplicates)
+        button_layout.addWidget(self.duplicate_button)
+
         self.save_button = QPushButton("保存")
         self.save_button.setFixedHeight(70)
-        self.save_button.clicked.connect(self.save_deletions)
+        self.save_button.setToolTip("保存修改与删除（Ctrl+S），修改也会在停止编辑几秒后自动保存")
+        self.save_button.clicked.connect(self.on_save_clicked)
+        QShortcut(QKeySequence.Save, self, self.on_save_clicked)
+        QShortcut(QKeySequence("Ctrl+Z"), self, self.undo_edit)
+        QShortcut(QKeySequence("Ctrl+Y"), self, self.redo_edit)
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_diagnostics)
         button_layout.addWidget(self.save_button)
 
+        history_layout = QHBoxLayout()
+        self.undo_button = QPushButton("撤销")
+        self.undo_button.setToolTip("撤销上一次修改（Ctrl+Z）")
+        self.undo_button.clicked.connect(self.undo_edit)
+        history_layout.addWidget(self.undo_button)
+        self.redo_button = QPushButton("重做")
+        self.redo_button.setToolTip("重做撤销的修改（Ctrl+Y）")
+        self.redo_button.clicked.connect(self.redo_edit)
+        history_layout.addWidget(self.redo_button)
+        button_layout.addLayout(history_layout)
+
         self.delete_warning = QLabel("删除游戏后需点击保存才能生效")
         self.delete_warning.setStyleSheet("color: red;")
         self.delete_warning.setWordWrap(True)
@@ -331,7 +1062,9 @@ class XMLNameExtractor(QWidget):
 
         self.setLayout(main_layout)
         self.setWindowTitle(f'隔壁老K游戏小组 - RetroBat 工具箱 测试版 v{CURRENT_VERSION}')
-        self.setFixedSize(943, 809)
+        # 预览图片面板加宽了右侧，固定尺寸不能小于布局需要的最小尺寸，否则控件会被挤压重叠
+        minimum = self.minimumSizeHint()
+        self.setFixedSize(max(964, minimum.width()), max(809, minimum.height()))
         self.center_window()
         self.show()
 
@@ -351,85 +1084,267 @@ class XMLNameExtractor(QWidget):
             self.status_signal.emit("已停止视频播放", False)
 
     def _handle_selection(self, row):
-        if 0 <= row < len(self.sorted_results):
-            path_part, name_part, desc_part, game_elem = self.sorted_results[row]
-            video_path = self.name_video_mapping.get(path_part)
-
-            if self.last_highlight is not None:
-                old_item = self.result_list.item(self.last_highlight)
-                if old_item is not None:
-                    old_item.setBackground(QColor(255, 255, 255))
-                    old_item.setForeground(QColor(0, 0, 0))
-
-            current_item = self.result_list.item(row)
-            current_item.setBackground(QColor(76, 175, 80))
-            current_item.setForeground(QColor(255, 255, 255))
-            self.last_highlight = row
-
-            # 修改后的视频播放逻辑
-            if self.enable_video_playback:
-                if video_path and os.path.exists(video_path):
-                    self.play_video(video_path)
-                    self.status_signal.emit(f"正在播放：{name_part}", False)
-                else:
-                    self.status_signal.emit(f"未找到匹配视频：{path_part}", True)
-            else:
-                if video_path:
-                    self.status_signal.emit("提示：请先启用视频预览功能", True)
-
+        if 0 <= row < len(self.view_ids):
+            game_id = self.view_ids[row]
+            desc_part = self.game_table.descs[game_id]
+            self.result_model.set_highlight(game_id)
             self.desc_text.setPlainText(desc_part if desc_part else "暂无游戏描述")
 
+            # 视频等选择停下来后再加载，连续按方向键时只播放最后一个
+            self._pending_video = (self.current_category, self.game_table, game_id, row)
+            self.selection_timer.start(self.SELECTION_DELAY_MS)
+
+    def _on_current_changed(self, current, previous):
+        if current.isValid():
+            self._handle_selection(current.row())
+
+    def _check_video(self, video_path, prefetch=False):
+        """后台线程：确认视频存在；预取时读入文件开头，让系统缓存提前就绪"""
+        exists = self._video_checked.get(video_path)
+        if exists is None:
+            tracer.count('media.video.stat')
+            exists = os.path.exists(video_path)
+            self._video_checked[video_path] = exists
+        if exists and prefetch:
+            try:
+                with open(video_path, 'rb') as f:
+                    f.read(self.PREFETCH_BYTES)
+            except OSError:
+                pass
+        return exists
+
+    def _play_pending_video(self):
+        pending = self._pending_video
+        if pending is None:
+            return
+        category_name, table, game_id, row = pending
+        video_path = self.media_index.lookup(category_name, table.keys[game_id], 'video', table.loose_keys[game_id])
+        if not self.enable_video_playback:
+            if video_path:
+                self.status_signal.emit("提示：请先启用视频预览功能", True)
+            return
+        if not video_path:
+            self.status_signal.emit(f"未找到匹配视频：{table.keys[game_id]}", True)
+            return
+
+        def check():
+            exists = self._check_video(video_path)
+            QApplication.instance().postEvent(
+                self, CallbackEvent(self._on_video_checked, pending, video_path, exists))
+
+        self.media_executor.submit(check)
+        view_ids = self.view_ids
+        for neighbour in (row - 1, row + 1):
+            if 0 <= neighbour < len(view_ids):
+                neighbour_id = view_ids[neighbour]
+                neighbour_path = self.media_index.lookup(category_name, table.keys[neighbour_id], 'video',
+                                                         table.loose_keys[neighbour_id])
+                if neighbour_path:
+                    self.media_executor.submit(self._check_video, neighbour_path, True)
+
+    def _image_paths(self, category_name, table, game_id):
+        """候选图片：先是 gamelist.xml 里记录的路径，再是按文件名在媒体目录中匹配到的"""
+        kind = self.image_kind_combo.currentData()
+        paths = []
+        xml_path = self.category_dirs.get(category_name)
+        if xml_path:
+            image_path = table.media_path(game_id, kind, os.path.dirname(xml_path))
+            if image_path:
+                paths.append(image_path)
+        for fallback in next(kinds for name, _, kinds in self.IMAGE_KINDS if name == kind):
+            image_path = self.media_index.lookup(category_name, table.keys[game_id], fallback,
+                                                 table.loose_keys[game_id])
+            if image_path and image_path not in paths:
+                paths.append(image_path)
+        return paths
+
+    def _load_first_image(self, image_paths):
+        for image_path in image_paths:
+            image = self.thumbnail_loader.load(image_path)
+            if image is not None:
+                return image
+        return None
+
+    def _load_pending_image(self):
+        pending = self._pending_video
+        if pending is None:
+            return
+        category_name, table, game_id, row = pending
+        image_paths = self._image_paths(category_name, table, game_id)
+        if not image_paths:
+            self.image_label.clear()
+            self.image_label.setText("暂无图片")
+            return
+
+        def decode():
+            image = self._load_first_image(image_paths)
+            QApplication.instance().postEvent(self, CallbackEvent(self._on_image_loaded, pending, image))
+
+        self.thumbnail_loader.executor.submit(decode)
+        view_ids = self.view_ids
+        for neighbour in (row - 1, row + 1):
+            if 0 <= neighbour < len(view_ids):
+                neighbour_paths = self._image_paths(category_name, table, view_ids[neighbour])
+                if neighbour_paths:
+                    self.thumbnail_loader.executor.submit(self._load_first_image, neighbour_paths)
+
+    def _on_image_loaded(self, pending, image):
+        if pending is not self._pending_video:
+            return
+        if image is None:
+            self.image_label.clear()
+            self.image_label.setText("暂无图片")
+        else:
+            self.image_label.setPixmap(QPixmap.fromImage(image))
+
+    def _update_thumb_cache_dir(self):
+        if self.thumb_cache_check.isChecked() and self.scan_index is not None:
+            self.thumbnail_loader.cache_dir = os.path.join(os.path.dirname(self.scan_index.path), 'thumbs')
+        else:
+            self.thumbnail_loader.cache_dir = None
+
+    def _on_video_checked(self, pending, video_path, exists):
+        if pending is not self._pending_video or not self.enable_video_playback:
+            return
+        _, table, game_id, _ = pending
+        if exists:
+            self.play_video(video_path)
+            self.status_signal.emit(f"正在播放：{table.names[game_id]}", False)
+        else:
+            self.status_signal.emit(f"未找到匹配视频：{table.keys[game_id]}", True)
+
     # 其他方法保持原有实现
     def select_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "选择最上级文件夹")
         if folder_path:
             self.category_list.clear()
             self.category_dirs = {}
-            self.name_video_mapping = {}
             self.status_signal.emit("开始扫描目录...", False)
             threading.Thread(target=self.find_gamelist_xml, args=(folder_path,)).start()
 
     def find_gamelist_xml(self, folder_path):
         try:
             category_count = 0
-            for root, dirs, files in os.walk(folder_path):
-                depth = root[len(folder_path):].count(os.sep)
-                if 1 <= depth <= 2 and 'gamelist.xml' in files:
-                    category_count += 1
-                    category_name = os.path.basename(root)
-                    xml_path = os.path.join(root, 'gamelist.xml')
+
+            def on_system(category_name, xml_path):
+                nonlocal category_count
+                category_count += 1
+                with self.lock:
                     self.category_dirs[category_name] = xml_path
+                QApplication.instance().postEvent(self, QListWidgetItemEvent(category_name))
 
-                    videos_dir = os.path.join(root, 'videos')
-                    if os.path.exists(videos_dir):
-                        for video_file in os.listdir(videos_dir):
-                            video_path = os.path.join(videos_dir, video_file)
-                            base_name = self.clean_filename(video_file)
-                            with self.lock:
-                                self.name_video_mapping[base_name] = video_path
-                    QApplication.instance().postEvent(self, QListWidgetItemEvent(category_name))
+            index = ScanIndex(folder_path)
+            try:
+                index.load()
+            except sqlite3.Error as e:
+                self.status_signal.emit(f"扫描索引损坏，将重新扫描：{str(e)}", True)
+                index = ScanIndex(folder_path)
+
+            # 媒体索引在打开机种时才建立，并复用同一份目录索引
+            self.library_root = folder_path
+            self.scan_index = index
+            self.media_index = MediaIndex(index)
+            QApplication.instance().postEvent(self, CallbackEvent(self._update_thumb_cache_dir))
+            scanner = LibraryScanner(index=index)
+            scanner.scan(folder_path, on_system)
+
+            try:
+                index.save()
+            except (OSError, sqlite3.Error) as e:
+                self.status_signal.emit(f"扫描索引保存失败：{str(e)}", True)
 
             QApplication.instance().postEvent(self, QListWidgetItemEvent(f"COUNT_UPDATE|{category_count}"))
-            self.status_signal.emit(f"扫描完成，共找到{category_count}个机种", False)
+            self.status_signal.emit(
+                f"扫描完成，共找到{category_count}个机种（{index.hits}个目录未变化，直接使用索引）", False)
+            QApplication.instance().postEvent(self, CallbackEvent(self.invalidate_global_index))
+            with self.lock:
+                category_dirs = dict(self.category_dirs)
+            QApplication.instance().postEvent(
+                self, CallbackEvent(self.library_watcher.watch_systems, category_dirs))
         except Exception as e:
             self.status_signal.emit(f"扫描过程中发生错误：{str(e)}", True)
 
+    def invalidate_global_index(self):
+        """机种列表或 gamelist.xml 变化后标记全局索引过期；只有全局搜索打开时才立即刷新，
+        否则等到第一次全局搜索时再解析"""
+        self._global_stale = True
+        if self.global_search_check.isChecked():
+            self.refresh_global_index()
+
+    def refresh_global_index(self):
+        """后台刷新全局搜索索引，只重新解析有变化的 gamelist.xml；完成后重新执行当前的全局搜索"""
+        self._global_stale = False
+        if self._global_cancel is not None:
+            self._global_cancel.set()
+        cancel_event = threading.Event()
+        self._global_cancel = cancel_event
+        with self.lock:
+            category_dirs = dict(self.category_dirs)
+
+        def worker():
+            def on_error(category_name, error):
+                self.status_signal.emit(f"全局索引解析失败：{category_name} - {str(error)}", True)
+
+            rebuilt = self.global_index.refresh(category_dirs, cancel_event, on_error)
+            if rebuilt and not cancel_event.is_set():
+                self.status_signal.emit(
+                    f"全局索引已更新：{len(self.global_index.systems)}个机种，"
+                    f"{self.global_index.game_count()}个游戏", False)
+                QApplication.instance().postEvent(self, CallbackEvent(self._on_global_index_ready))
+
+        threading.Thread(target=worker, daemon=True).start()
+
     @pyqtSlot(str, bool)
     def _append_status(self, message, is_error):
-        if message.startswith("游戏列表导出成功"):
-            color = "#4CAF50"
+        """可能在任意线程调用：只写入缓冲，每批消息只向界面线程投递一次刷新"""
+        if is_error:
+            level = 'error'
+        elif message.startswith("游戏列表导出成功"):
+            level = 'success'
         else:
-            color = "#ff0000" if is_error else "#666"
-
-        html = f'<div style="color:{color};margin:2px;">{message}</div>'
-        self.status_bar.append(html)
+            level = 'info'
+        if self.status_log.add(message, level):
+            QApplication.instance().postEvent(self, CallbackEvent(self.log_timer.start, self.LOG_FLUSH_MS))
+
+    @staticmethod
+    def _status_html(records):
+        colors = {'info': "#666", 'success': "#4CAF50", 'error': "#ff0000"}
+        return ''.join(f'<div style="color:{colors[level]};margin:2px;">{html.escape(message)}</div>'
+                       for _, level, message in records)
+
+    def _flush_status_log(self):
+        level = self.log_level_combo.currentData()
+        records = [record for record in self.status_log.take_pending() if level is None or record[1] == level]
+        if records:
+            self.status_bar.append(self._status_html(records))
+            self.status_bar.moveCursor(QTextCursor.End)
+
+    def _render_status_log(self):
+        self.status_log.take_pending()
+        self.status_bar.clear()
+        records = self.status_log.filtered(self.log_level_combo.currentData())
+        if records:
+            self.status_bar.append(self._status_html(records))
         self.status_bar.moveCursor(QTextCursor.End)
 
-    def clean_filename(self, filename):
-        name = os.path.splitext(filename)[0].lower()
-        video_exts = {'video', 'mp4', 'avi', 'mkv', 'mov', 'flv'}
-        name = re.sub(r'-(?:' + '|'.join(video_exts) + r')$', '', name)
-        return re.sub(r'[^\w\s]', '', name).strip().replace(' ', '_')
+    def export_status_log(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出日志", f"retrobat-tool-{datetime.datetime.now():%Y%m%d%H%M%S}.log", "日志文件 (*.log *.txt)")
+        if not file_path:
+            return
+        try:
+            self.status_log.export(file_path, self.log_level_combo.currentData())
+        except OSError as e:
+            self.status_signal.emit(f"日志导出失败：{str(e)}", True)
+            return
+        self.status_signal.emit(f"日志已导出：{file_path}", False)
+
+    def show_diagnostics(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self.status_signal.emit, self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+        self.diagnostics_dialog.activateWindow()
 
     def show_category_info(self, item):
         category_name = item.text()
@@ -437,156 +1352,438 @@ class XMLNameExtractor(QWidget):
         if not xml_path:
             return
 
+        # 新的点击会取消仍在进行的加载
+        if self._load_cancel is not None:
+            self._load_cancel.set()
+        self._load_generation += 1
+        self._load_cancel = threading.Event()
+
+        # 切换机种前把上一个机种未保存的修改交给后台写入
+        self.save_xml()
+        pending_deletions = self.deleted_games.get(xml_path, ())
+        if self.current_xml_path != xml_path and self.deleted_games.get(self.current_xml_path):
+            self.status_signal.emit(
+                f"{self.current_category}：{len(self.deleted_games[self.current_xml_path])}个游戏已标记删除，"
+                f"切换回该机种后点击保存生效", False)
+
+        self.current_xml_path = xml_path
+        self.current_category = category_name
+        self.game_table = GameTable()
+        self.search_index = SearchIndex(self.game_table)
+        self.sort_index = SortIndex(self.search_index)
+        self.edit_session = EditSession(self.game_table, xml_path)
+        self.journal = EditJournal(xml_path)
+        self._loaded_count = 0
+        self._loading = True
+        self.library_watcher.watch_media(category_name, os.path.dirname(xml_path))
+        self._pending_video = None
+        self._video_checked.clear()
+        self.image_label.clear()
+        self.image_label.setText("暂无图片")
+        self.result_model.highlight_id = None
+        self.result_model.set_view(self.game_table, array('I'))
+        self.game_count_label.setText("正在加载游戏列表...")
+
+        threading.Thread(
+            target=self._load_gamelist,
+            args=(self._load_generation, category_name, xml_path, self.game_table,
+                  self.search_index, self.sort_index, self.journal, frozenset(pending_deletions),
+                  self._load_cancel),
+            daemon=True
+        ).start()
+
+    def _load_gamelist(self, generation, category_name, xml_path, table, search_index, sort_index, journal,
+                       pending_deletions, cancel_event):
+        """后台线程：流式解析 gamelist.xml 填充游戏表与搜索索引，分批通知界面；
+        该机种已标记删除、尚未保存的游戏载入后直接移除"""
+        app = QApplication.instance()
         try:
-            parser = ET.XMLParser(remove_blank_text=True)
-            self.current_tree = ET.parse(xml_path, parser)
-            root = self.current_tree.getroot()
-            self.current_xml_path = xml_path
+            # 记录解析前的 mtime，之后的外部修改才会触发增量刷新
+            self._known_mtimes[xml_path] = os.stat(xml_path).st_mtime_ns
+            try:
+                journal.load()
+            except (OSError, ValueError) as e:
+                self.status_signal.emit(f"修改日志读取失败，撤销记录不可用：{str(e)}", True)
+            if self.media_index.ensure_system(category_name, os.path.dirname(xml_path)):
+                self._save_scan_index()
+
+            batch_start = 0
+            progress = 0.0
+            last_post = time.monotonic()
+
+            def on_progress(value):
+                nonlocal progress
+                progress = value
+
+            def on_row(game_id):
+                nonlocal batch_start, last_post
+                if pending_deletions and table.roms[game_id] in pending_deletions:
+                    table.remove(game_id)
+                if game_id + 1 - batch_start >= 1000 or time.monotonic() - last_post > 0.1:
+                    app.postEvent(self, GameRowsEvent(generation, batch_start, game_id + 1, progress))
+                    batch_start = game_id + 1
+                    last_post = time.monotonic()
+
+            fill_game_table(xml_path, table, search_index, cancel_event, on_row, on_progress)
+            sort_key = self.sort_key
+            if not cancel_event.is_set():
+                sort_index.prepare(sort_key)
+
+            if not cancel_event.is_set():
+                app.postEvent(self, GameRowsEvent(generation, batch_start, len(table.names), 1.0, done=True))
+            # 其余列的排序键也在这里算好，切换排序方式时界面线程不再现算
+            for key in SORT_KEYS:
+                if cancel_event.is_set():
+                    break
+                if key != sort_key:
+                    sort_index.prepare(key)
+        except Exception as e:
+            app.postEvent(self, GameRowsEvent(generation, 0, 0, 1.0, done=True, error=str(e)))
 
-            self.raw_results = []
-            for game in root.findall('game'):
-                path_element = game.find('path')
-                path_text = self.clean_filename(
-                    os.path.basename(path_element.text)
-                ) if path_element is not None and path_element.text else ""
+    def _on_game_rows(self, event):
+        if event.generation != self._load_generation:
+            return
+        if event.done:
+            self._loading = False
+        if event.error:
+            self._pending_select_rom = None
+            self._update_game_count()
+            self.status_signal.emit(f"解析错误：{event.error}", True)
+            return
 
-                name_element = game.find('name')
-                name_text = name_element.text.strip() if name_element is not None and name_element.text else ""
+        query = self.search_box.text()
+        alive = self.game_table.alive
+        batch = [game_id for game_id in range(event.start, event.end) if alive[game_id]]
+        if query.strip():
+            visible = [game_id for game_id in batch if self.search_index.matches(game_id, query)]
+        else:
+            visible = batch
+        self._loaded_count = event.end
+        self.result_model.append_ids(visible)
+
+        if event.done:
+            # 加载过程中按文件顺序追加，全部载入后再整体排序
+            if self._sort_active():
+                self.filter_games()
+            self._update_game_count()
+            self.status_signal.emit(f"已加载分类：{self.current_category}", False)
+            if self._pending_select_rom is not None:
+                self._select_pending_game()
+        else:
+            self.game_count_label.setText(
+                f"正在加载... {event.progress:.0%}（已载入{event.end}个游戏）")
 
-                desc_element = game.find('desc')
-                desc_text = desc_element.text.strip() if desc_element is not None and desc_element.text else ""
+    def _on_library_changed(self, category_name, media_changed):
+        """监视到机种目录变化：媒体目录变化只重建媒体索引；gamelist.xml 被外部改写时
+        只对当前机种做按 path 的增量对比，其余机种交给全局索引按 mtime 刷新。
+        本程序自己保存 gamelist.xml（临时文件、备份、修改日志）引起的机种目录变化不会重建媒体索引"""
+        xml_path = self.category_dirs.get(category_name)
+        if not xml_path:
+            return
+        is_current = category_name == self.current_category
+        if media_changed:
+            self.media_index.invalidate(category_name)
+            if is_current:
+                self._video_checked.clear()
+                self.media_executor.submit(self.media_index.ensure_system, category_name, os.path.dirname(xml_path))
 
-                self.raw_results.append((path_text, name_text, desc_text, game))
+        try:
+            mtime_ns = os.stat(xml_path).st_mtime_ns
+        except OSError:
+            return
+        writer = self._writers.get(xml_path)
+        if mtime_ns == self._known_mtimes.get(xml_path) or (writer is not None and writer.mtime_ns == mtime_ns):
+            # 媒体/ROM 目录变化，或者是本程序自己保存的
+            self._known_mtimes[xml_path] = mtime_ns
+            return
+        self._known_mtimes[xml_path] = mtime_ns
+        self.invalidate_global_index()
+        if not is_current:
+            return
+        self._rebase_journal(self.journal, xml_path)
+        if self._loading:
+            self._reload_category(category_name)
+            return
 
-            self.sorted_results = self.raw_results.copy()
-            self.update_display()
-            self.status_signal.emit(f"已加载分类：{category_name}", False)
-        except Exception as e:
-            self.status_signal.emit(f"解析错误：{str(e)}", True)
+        generation = self._load_generation
+        table = self.game_table
+
+        def worker():
+            try:
+                diff = diff_gamelist(table, xml_path)
+            except Exception as e:
+                self.status_signal.emit(f"gamelist.xml 已被外部修改，但重新解析失败：{str(e)}", True)
+                return
+            QApplication.instance().postEvent(self, CallbackEvent(self._apply_gamelist_diff, generation, diff))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _rebase_journal(self, journal, xml_path):
+        """外部改写后以当前文件为修改日志的新快照，与保存排在同一个线程上"""
+        if journal is None:
+            return
+        writer = self._writer(xml_path)
+
+        def rebase():
+            try:
+                with writer.lock:
+                    journal.rebase()
+            except OSError as e:
+                self.status_signal.emit(f"修改日志快照更新失败：{str(e)}", True)
+
+        self.save_executor.submit(rebase)
 
-    def update_display(self):
-        self.result_list.clear()
-        display_text = [name for _, name, _, _ in self.sorted_results]
-        self.result_list.addItems(display_text)
-        self.game_count_label.setText(f"当前列表拥有游戏：{len(self.sorted_results)}")
+    def _apply_gamelist_diff(self, generation, diff):
+        if generation != self._load_generation or not diff:
+            return
+        table = self.game_table
+        session = self.edit_session
+        shown_desc = self.desc_text.toPlainText()
+
+        for game_id, ordinal in diff.moved:
+            table.ordinals[game_id] = ordinal
+        for game_id, ordinal, name_text, desc_text, media, info in diff.updated:
+            # 尚未保存的本地修改优先，保存时仍会写回
+            old_desc = table.descs[game_id]
+            table.ordinals[game_id] = ordinal
+            table.media[game_id] = media
+            table.info[game_id] = info
+            if (game_id, 'name') not in session:
+                table.names[game_id] = name_text
+            if (game_id, 'desc') not in session:
+                table.descs[game_id] = desc_text
+            self.search_index.update(game_id)
+            self.result_model.refresh_game(game_id)
+            if game_id == self.result_model.highlight_id and shown_desc == (old_desc or "暂无游戏描述"):
+                self.desc_text.setPlainText(table.descs[game_id] or "暂无游戏描述")
+
+        removed = set(diff.removed)
+        for game_id in removed:
+            table.remove(game_id)
+        if removed:
+            self.result_model.remove_rows([row for row, game_id in enumerate(self.view_ids) if game_id in removed])
+
+        query = self.search_box.text()
+        added_ids = []
+        for ordinal, rom_path, name_text, desc_text, media, info in diff.added:
+            key, loose = rom_keys(rom_path)
+            game_id = table.append(ordinal, rom_path, key, name_text, desc_text, media, info, loose)
+            self.search_index.add(game_id)
+            if not query.strip() or self.search_index.matches(game_id, query):
+                added_ids.append(game_id)
+        self._loaded_count = len(table.names)
+        if self._sort_active() and (diff.added or diff.updated) and not self.global_search_check.isChecked():
+            self.filter_games()
+        elif added_ids:
+            self.result_model.append_ids(added_ids)
+
+        self._update_game_count()
+        self.status_signal.emit(
+            f"检测到 {self.current_category} 的 gamelist.xml 被外部修改，已增量更新："
+            f"修改{len(diff.updated)}个，新增{len(diff.added)}个，移除{len(diff.removed)}个", False)
+
+    def _writer(self, xml_path=None):
+        xml_path = xml_path or self.current_xml_path
+        writer = self._writers.get(xml_path)
+        if writer is None:
+            writer = self._writers[xml_path] = GamelistWriter(xml_path)
+        return writer
+
+    def _save_scan_index(self):
+        if self.scan_index is None:
+            return
+        try:
+            self.scan_index.save(prune=False)
+        except (OSError, sqlite3.Error) as e:
+            self.status_signal.emit(f"扫描索引保存失败：{str(e)}", True)
 
-    def handle_item_click(self, item):
-        row = self.result_list.row(item)
-        self._handle_selection(row)
+    @property
+    def view_ids(self):
+        return self.result_model.ids
+
+    def _update_game_count(self):
+        self.game_count_label.setText(f"当前列表拥有游戏：{len(self.view_ids)}")
+
+    def _current_row(self):
+        index = self.result_list.currentIndex()
+        return index.row() if index.isValid() else -1
+
+    def handle_item_click(self, index):
+        self._handle_selection(index.row())
 
     def on_modify_name_clicked(self):
-        current_row = self.result_list.currentRow()
+        current_row = self._current_row()
         if current_row >= 0:
-            _, old_name, _, game_elem = self.sorted_results[current_row]
+            game_id = self.view_ids[current_row]
+            old_name = self.game_table.names[game_id]
             dialog = ModifyNameDialog(old_name, self)
             if dialog.exec_() == QDialog.Accepted:
                 new_name = dialog.get_new_name()
                 if new_name:
-                    name_element = game_elem.find('name')
-                    if name_element is not None:
-                        name_element.text = new_name
-                    else:
-                        name_element = ET.SubElement(game_elem, 'name')
-                        name_element.text = new_name
-
-                    self.raw_results[current_row] = (
-                        self.raw_results[current_row][0],
-                        new_name,
-                        self.raw_results[current_row][2],
-                        game_elem
-                    )
-                    self.sorted_results[current_row] = (
-                        self.sorted_results[current_row][0],
-                        new_name,
-                        self.sorted_results[current_row][2],
-                        game_elem
-                    )
-
-                    self.save_xml()
-                    self.update_display()
-                    self.status_signal.emit(f"成功修改并保存：{old_name} → {new_name}", False)
+                    self.game_table.names[game_id] = new_name
+                    self.search_index.update(game_id)
+                    self.result_model.refresh_game(game_id)
+                    self._record_edits([(game_id, 'name', old_name, new_name)])
+                    self.status_signal.emit(f"已修改：{old_name} → {new_name}（将自动保存）", False)
                 else:
                     QMessageBox.warning(self, "警告", "游戏名称不能为空！")
         else:
             QMessageBox.warning(self, "警告", "请先选择一个游戏！")
 
     def on_modify_desc_clicked(self):
-        current_row = self.result_list.currentRow()
+        current_row = self._current_row()
         if current_row >= 0:
             new_desc = self.desc_text.toPlainText().strip()
-            _, old_name, old_desc, game_elem = self.sorted_results[current_row]
+            game_id = self.view_ids[current_row]
+            old_desc = self.game_table.descs[game_id]
 
             if new_desc != old_desc:
-                try:
-                    desc_element = game_elem.find('desc')
-                    if desc_element is not None:
-                        desc_element.text = new_desc
-                    else:
-                        desc_element = ET.SubElement(game_elem, 'desc')
-                        desc_element.text = new_desc
-
-                    self.raw_results[current_row] = (
-                        self.raw_results[current_row][0],
-                        self.raw_results[current_row][1],
-                        new_desc,
-                        game_elem
-                    )
-                    self.sorted_results[current_row] = (
-                        self.sorted_results[current_row][0],
-                        self.sorted_results[current_row][1],
-                        new_desc,
-                        game_elem
-                    )
-
-                    self.save_xml()
-                    self.status_signal.emit("游戏描述修改已保存", False)
-                except Exception as e:
-                    self.status_signal.emit(f"保存描述失败：{str(e)}", True)
+                self.game_table.descs[game_id] = new_desc
+                self.search_index.update(game_id)
+                self._record_edits([(game_id, 'desc', old_desc, new_desc)])
+                self.status_signal.emit("游戏描述已修改（将自动保存）", False)
             else:
                 self.status_signal.emit("描述内容未修改", False)
         else:
             QMessageBox.warning(self, "警告", "请先选择一个游戏！")
 
-    def save_xml(self):
-        if self.current_tree is not None and self.current_xml_path:
+    def _record_edits(self, edits):
+        """edits: [(游戏 id, 字段, 旧值, 新值)]，作为一次可撤销的操作记入日志"""
+        table = self.game_table
+        for game_id, field, _, new in edits:
+            self.edit_session.set(game_id, field, new)
+        if self.journal is not None:
+            self.journal.record([(table.roms[game_id], field, old, new) for game_id, field, old, new in edits])
+        self.autosave_timer.start(self.AUTOSAVE_DELAY_MS)
+
+    def undo_edit(self):
+        changes = self.journal.undo() if self.journal is not None else None
+        if changes is None:
+            self.status_signal.emit("没有可撤销的修改", False)
+            return
+        self._apply_history(changes)
+        self.status_signal.emit(f"已撤销{len(changes)}项修改（将自动保存）", False)
+
+    def redo_edit(self):
+        changes = self.journal.redo() if self.journal is not None else None
+        if changes is None:
+            self.status_signal.emit("没有可重做的修改", False)
+            return
+        self._apply_history(changes)
+        self.status_signal.emit(f"已重做{len(changes)}项修改（将自动保存）", False)
+
+    def _apply_history(self, changes):
+        """把撤销/重做得到的字段值写回游戏表与编辑会话"""
+        table = self.game_table
+        columns = {'name': table.names, 'desc': table.descs}
+        game_ids = {table.roms[game_id]: game_id for game_id in table.ids()}
+        touched = set()
+        for rom_path, field, value in changes:
+            game_id = game_ids.get(rom_path)
+            if game_id is None or field not in columns:
+                continue
+            columns[field][game_id] = value
+            self.edit_session.set(game_id, field, value)
+            touched.add(game_id)
+        for game_id in touched:
+            self.search_index.update(game_id)
+            self.result_model.refresh_game(game_id)
+        if self.result_model.highlight_id in touched:
+            self.desc_text.setPlainText(table.descs[self.result_model.highlight_id] or "暂无游戏描述")
+        self.autosave_timer.start(self.AUTOSAVE_DELAY_MS)
+
+    def save_xml(self, wait=False):
+        """把编辑会话中的修改批量交给后台线程写回；wait 为真时等待写入完成"""
+        self.autosave_timer.stop()
+        session = self.edit_session
+        journal = self.journal
+        changes = session.take()
+        pending = journal.take_pending() if journal is not None else []
+        if not changes and not pending:
+            return None
+
+        writer = self._writer(session.xml_path)
+        rows = session.as_rows(changes)
+
+        def flush():
+            # 历史由修改日志保存，不再每次复制整个 gamelist.xml
             try:
-                backup_dir = os.path.join(os.path.dirname(self.current_xml_path), "backups")
-                os.makedirs(backup_dir, exist_ok=True)
-                base_name = os.path.basename(self.current_xml_path)
-
-                backups = sorted(glob.glob(os.path.join(backup_dir, f"{base_name}.bak*")))
-                while len(backups) >= 3:
-                    os.remove(backups.pop(0))
-
-                timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                shutil.copyfile(self.current_xml_path, 
-                              os.path.join(backup_dir, f"{base_name}.bak{timestamp}"))
-
-                self.current_tree.write(
-                    self.current_xml_path,
-                    encoding='utf-8',
-                    xml_declaration=True,
-                    pretty_print=True
-                )
-                self.status_signal.emit("配置文件保存成功（已创建备份）", False)
+                if journal is not None:
+                    missing = journal.commit(writer, rows, pending)
+                else:
+                    missing = writer.flush(rows) if rows else []
             except Exception as e:
+                session.restore(changes)
                 self.status_signal.emit(f"保存失败：{str(e)}", True)
-        else:
-            self.status_signal.emit("没有需要保存的配置文件", True)
+                return
+            for rom_path in missing:
+                self.status_signal.emit(f"gamelist.xml 中找不到游戏，修改未保存：{rom_path}", True)
+            if rows:
+                self.status_signal.emit(f"配置文件保存成功（{len(rows)}项修改，已记入修改日志）", False)
+            if journal is not None:
+                try:
+                    journal.compact_if_needed(writer)
+                except OSError as e:
+                    self.status_signal.emit(f"修改日志压缩失败：{str(e)}", True)
+
+        future = self.save_executor.submit(flush)
+        if wait:
+            future.result()
+        return future
+
+    def _style_video_widget(self, widget):
+        widget.setObjectName("videoWidget")
+        widget.setFixedSize(300, 225)
+        widget.setStyleSheet("""
+            #videoWidget {
+                border: 3px solid #4CAF50;
+                border-radius: 8px;
+                background: #333;
+            }
+            #videoWidget:hover {
+                border-color: #45a049;
+            }
+        """)
 
-    def play_video(self, video_path):
-        if self.media_player:
-            self.media_player.stop()
-            self.media_player.deleteLater()
+    def _ensure_video_widget(self):
+        if QVideoWidget is not None and isinstance(self.video_widget, QVideoWidget):
+            return
+        load_multimedia()
+        video_widget = QVideoWidget(self)
+        self._style_video_widget(video_widget)
+        self.video_container.replaceWidget(self.video_widget, video_widget)
+        self.video_widget.deleteLater()
+        self.video_widget = video_widget
 
-        self.media_player = QMediaPlayer(self, flags=QMediaPlayer.VideoSurface)
-        self.media_player.setVideoOutput(self.video_widget)
+    def play_video(self, video_path):
+        """整个会话只使用一个播放器，切换游戏时只替换媒体"""
+        self._ensure_video_widget()
+        if self.media_player is None:
+            self.media_player = QMediaPlayer(self, flags=QMediaPlayer.VideoSurface)
+            self.media_player.setVideoOutput(self.video_widget)
+            self.media_player.setVolume(50)
         self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(video_path)))
-        self.media_player.setVolume(50)
         self.media_player.play()
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self._startup_reported:
+            self._startup_reported = True
+            # 等第一帧绘制完成后再统计耗时，并开始非关键的初始化
+            QTimer.singleShot(0, self._after_first_paint)
+
+    def _after_first_paint(self):
+        elapsed_ms = (time.perf_counter() - STARTUP_BEGIN) * 1000
+        self.status_signal.emit(f"启动完成，耗时{elapsed_ms:.0f} ms（含模块导入与首次显示）", False)
+        threading.Thread(target=load_etree, daemon=True).start()
+        self.check_update()
+
     def customEvent(self, event):
-        if isinstance(event, QListWidgetItemEvent):
+        if isinstance(event, CallbackEvent):
+            event.callback(*event.args)
+        elif isinstance(event, GameRowsEvent):
+            self._on_game_rows(event)
+        elif isinstance(event, QListWidgetItemEvent):
             if event.category_name.startswith("COUNT_UPDATE"):
                 count = event.category_name.split("|")[1]
                 self.category_count_label.setText(f"当前列表的机种数量：{count}")
@@ -594,47 +1791,90 @@ class XMLNameExtractor(QWidget):
                 self.category_list.addItem(event.category_name)
 
     def closeEvent(self, event):
+        self.save_xml(wait=True)
+        self.save_executor.shutdown(wait=True)
+        self.selection_timer.stop()
+        self.media_executor.shutdown(wait=False)
+        self.thumbnail_loader.executor.shutdown(wait=False)
         if self.media_player:
             self.media_player.stop()
             self.media_player.deleteLater()
         event.accept()
 
     def export_game_list(self):
-        if not self.sorted_results:
-            self.status_signal.emit("当前没有游戏列表可供导出", True)
+        dialog = ExportDialog(self)
+        if not self.current_xml_path:
+            dialog.scope_combo.setCurrentIndex(len(ExportDialog.SCOPES) - 1)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        scope, fmt, fields = dialog.get_options()
+        if not fields:
+            QMessageBox.warning(self, "警告", "请至少选择一个导出字段！")
             return
 
-    try:
-        if self.current_xml_path:
-            dir_path = os.path.dirname(self.current_xml_path)
-            dir_path = os.path.normpath(dir_path)
-            file_path = os.path.join(dir_path, "gamelist.txt")
+        if scope == 'all':
+            with self.lock:
+                category_dirs = dict(self.category_dirs)
+            if not category_dirs:
+                self.status_signal.emit("当前没有机种可供导出", True)
+                return
+            default_dir = os.path.dirname(os.path.dirname(next(iter(category_dirs.values()))))
+            scan_index = self.scan_index
+            # 逐个机种生成数据源，同一时间只持有一个机种的视频名称集合
+            sources = (
+                (name, os.path.dirname(xml_path), video_key_lookup(os.path.dirname(xml_path), scan_index),
+                 GameListExporter.gamelist_rows(xml_path))
+                for name, xml_path in sorted(category_dirs.items())
+            )
+        else:
+            ids = self.view_ids if scope == 'view' else self.game_table.ids()
+            if not self.current_xml_path or not ids:
+                self.status_signal.emit("当前没有游戏列表可供导出", True)
+                return
+            system_dir = os.path.dirname(self.current_xml_path)
+            default_dir = system_dir
+            category_name = self.current_category
+            media_index = self.media_index
+            sources = [(
+                category_name, system_dir,
+                lambda rom_name: media_index.match(category_name, rom_name, 'video') is not None,
+                GameListExporter.table_rows(self.game_table, array('I', ids))
+            )]
+
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出游戏列表", os.path.join(default_dir, f"gamelist.{fmt}"),
+            f"{GameListExporter.FORMATS[fmt]} (*.{fmt})"
+        )
+        if not file_path:
+            return
 
-            # 确保目录存在
-            os.makedirs(dir_path, exist_ok=True)
+        try:
+            exporter = GameListExporter(file_path, fmt, fields)
+        except (ValueError, RuntimeError) as e:
+            self.status_signal.emit(f"导出失败：{str(e)}", True)
+            return
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for _, name, _, _ in self.sorted_results:
-                    f.write(name + '\n')
+        def on_progress(count):
+            self.status_signal.emit(f"正在导出：已写入{count}个游戏", False)
 
-            # 加强空值检查
-            if hasattr(self, 'dir_link_button') and self.dir_link_button is not None:
-                self.dir_link_button.setText(f"导出目录：\n{dir_path}")
-                self.dir_link_button.setVisible(True)
-            else:
-                self.status_signal.emit("导出路径显示控件未初始化", True)
-
-            self.status_signal.emit(f"成功导出{len(self.sorted_results)}个游戏", False)
-            self._last_export_path = dir_path
+        def worker():
+            try:
+                count = exporter.export(sources, on_progress)
+            except Exception as e:
+                self.status_signal.emit(f"导出失败：{str(e)}", True)
+                return
+            QApplication.instance().postEvent(self, CallbackEvent(self._on_export_done, file_path, count))
 
-        else:
-            self.status_signal.emit("无法确定XML文件路径", True)
+        self.status_signal.emit("开始导出游戏列表...", False)
+        threading.Thread(target=worker, daemon=True).start()
 
-    except Exception as e:
-        self.status_signal.emit(f"导出失败：{str(e)}", True)
-        
-    else:
-        self.status_signal.emit("没有找到当前XML文件路径，无法导出", True)
+    def _on_export_done(self, file_path, count):
+        dir_path = os.path.normpath(os.path.dirname(file_path))
+        if self.dir_link_button is not None:
+            self.dir_link_button.setText(f"导出目录：\n{dir_path}")
+            self.dir_link_button.setVisible(True)
+        self._last_export_path = dir_path
+        self.status_signal.emit(f"游戏列表导出成功：{count}个游戏 → {file_path}", False)
 
     def eventFilter(self, obj, event):
         if obj == self.status_bar and event.type() == QEvent.MouseButtonPress:
@@ -659,173 +1899,442 @@ class XMLNameExtractor(QWidget):
         except Exception as e:
             self.status_signal.emit(f"打开目录失败：{str(e)}", True)
 
-    def delete_matching_files(self, directory, base_name, depth=0):
-        if depth > 2:
+    def delete_game(self):
+        selected_rows = [index.row() for index in self.result_list.selectionModel().selectedRows()]
+        if not selected_rows:
+            QMessageBox.warning(self, "警告", "请先选择要删除的游戏")
+            return
+
+        # 删除确认对话框代码已移除
+        game_ids = [self.view_ids[row] for row in selected_rows if 0 <= row < len(self.view_ids)]
+        marked = self._mark_deleted(game_ids)
+        self.status_signal.emit(f"已标记删除 {marked} 个游戏（点击保存生效）", False)
+
+    def _mark_deleted(self, game_ids):
+        """把游戏加入待删除列表并从当前列表移除，点击保存后才真正删除；返回标记的数量"""
+        table = self.game_table
+        pending = self.deleted_games.setdefault(self.current_xml_path, [])
+        marked = set()
+        for game_id in game_ids:
+            rom_path = table.roms[game_id]
+            if rom_path and table.alive[game_id]:
+                pending.append(rom_path)
+                table.remove(game_id)
+                marked.add(game_id)
+
+        self.result_model.remove_rows([row for row, game_id in enumerate(self.view_ids) if game_id in marked])
+        self._update_game_count()
+        return len(marked)
+
+    def find_duplicates(self):
+        with self.lock:
+            category_dirs = dict(self.category_dirs)
+        if not category_dirs or self.library_root is None:
+            self.status_signal.emit("请先选择RetroBat所在目录", True)
             return
-        for entry in os.scandir(directory):
+
+        self.duplicate_button.setEnabled(False)
+        library_root = self.library_root
+        self.status_signal.emit(f"开始在{len(category_dirs)}个机种中查找重复ROM...", False)
+
+        def worker():
+            hash_cache = HashCache(library_root)
             try:
-                if entry.is_dir():
-                    if entry.name.startswith(base_name):
-                        shutil.rmtree(entry.path)
-                        self.status_signal.emit(f"已删除文件夹: {entry.path}", False)
-                    else:
-                        self.delete_matching_files(entry.path, base_name, depth + 1)
-                else:
-                    if entry.name.startswith(base_name):
-                        os.remove(entry.path)
-                        self.status_signal.emit(f"已删除文件: {entry.path}", False)
+                hash_cache.load()
+            except sqlite3.Error as e:
+                self.status_signal.emit(f"哈希缓存损坏，将重新计算：{str(e)}", True)
+                hash_cache = HashCache(library_root)
+            finder = DuplicateFinder(hash_cache)
+            started = time.monotonic()
+            try:
+                groups = finder.find(category_dirs, lambda message: self.status_signal.emit(message, False))
             except Exception as e:
-                self.status_signal.emit(f"删除失败: {entry.path} - {str(e)}", True)
+                self.status_signal.emit(f"查找重复ROM失败：{str(e)}", True)
+                groups = None
+            else:
+                self.status_signal.emit(
+                    f"哈希计算完成：读取{finder.hashed_bytes / 1048576:.1f} MB，"
+                    f"缓存命中{hash_cache.hits}次，耗时{time.monotonic() - started:.1f}秒", False)
+            QApplication.instance().postEvent(self, CallbackEvent(self._on_duplicates_found, groups))
 
-    def delete_game(self):
-        selected_items = self.result_list.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, "警告", "请先选择要删除的游戏")
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_duplicates_found(self, groups):
+        self.duplicate_button.setEnabled(True)
+        if groups is None:
+            return
+        redundant = sum(len(group) - 1 for group in groups)
+        wasted_bytes = sum(group[0][3] * (len(group) - 1) for group in groups)
+        self.status_signal.emit(
+            f"找到{len(groups)}组重复ROM，共{redundant}个多余文件（{wasted_bytes / 1048576:.1f} MB）", False)
+        if not groups:
             return
 
-        # 删除确认对话框代码已移除
-        rows = sorted([self.result_list.row(item) for item in selected_items], reverse=True)
-        for row in rows:
-            if 0 <= row < len(self.sorted_results):
-                _, name, _, game_elem = self.sorted_results[row]
-                path_element = game_elem.find('path')
-                if path_element is not None:
-                    rom_path = path_element.text
-                    base_name = os.path.splitext(os.path.basename(rom_path))[0]
-                    base_name = re.sub(r'[^\w\s]', '', base_name).strip()
-                    self.deleted_games.append((rom_path, base_name))
-
-                    del self.sorted_results[row]
-                    del self.raw_results[row]
-
-        self.update_display()
-        self.status_signal.emit(f"已标记删除 {len(rows)} 个游戏（点击保存生效）", False)
+        # 每组保留排在最前的一个，当前机种里的其余副本可以标记删除
+        table = self.game_table
+        game_ids_by_rom = {table.roms[game_id]: game_id for game_id in table.ids()}
+        to_mark = []
+        details = []
+        for group in groups:
+            kept = group[0]
+            details.append(f"保留 [{kept[0]}] {kept[1]}")
+            for category_name, rom_path, _, _, _ in group[1:]:
+                details.append(f"    重复 [{category_name}] {rom_path}")
+                if category_name == self.current_category and rom_path in game_ids_by_rom:
+                    to_mark.append(game_ids_by_rom[rom_path])
+
+        msg = QMessageBox(self)
+        msg.setIcon(QMessageBox.Information)
+        msg.setWindowTitle("重复ROM")
+        msg.setText(f"找到 {len(groups)} 组内容完全相同的ROM，共 {redundant} 个多余文件"
+                    f"（{wasted_bytes / 1048576:.1f} MB）。")
+        msg.setDetailedText('\n'.join(details))
+        if to_mark:
+            msg.setInformativeText(f"是否将当前机种中的 {len(to_mark)} 个重复项标记为删除？（点击保存后生效）")
+            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        else:
+            msg.setInformativeText("当前机种中没有可标记的重复项，请打开对应机种后再次查找。")
+            msg.setStandardButtons(QMessageBox.Ok)
+        if msg.exec_() == QMessageBox.Yes:
+            marked = self._mark_deleted(to_mark)
+            self.status_signal.emit(f"已标记删除 {marked} 个重复游戏（点击保存生效）", False)
+
+    def on_save_clicked(self):
+        if self.deleted_games.get(self.current_xml_path):
+            self.save_deletions()
+        elif self.save_xml() is None:
+            self.status_signal.emit("没有需要保存的修改", False)
 
     def save_deletions(self):
-        if not self.deleted_games:
+        if not self.deleted_games.get(self.current_xml_path):
             self.status_signal.emit("没有需要删除的游戏", True)
             return
 
-        xml_dir = os.path.dirname(self.current_xml_path)
-        success_count = 0
-        error_count = 0
+        self.save_xml(wait=True)
+        system_dir = os.path.dirname(self.current_xml_path)
+        deleter = BulkDeleter(system_dir, self._writer())
+        rom_paths = list(self.deleted_games[self.current_xml_path])
+        table = self.game_table
+        keep_rom_paths = [table.roms[game_id] for game_id in table.ids()]
+        self.status_signal.emit(f"正在统计待删除的文件（{len(rom_paths)}个游戏）...", False)
 
-        for rom_path, base_name in self.deleted_games:
+        def build_plan():
             try:
-                full_rom_path = os.path.join(xml_dir, rom_path)
-                if os.path.exists(full_rom_path):
-                    os.remove(full_rom_path)
-                    success_count += 1
-                else:
-                    self.status_signal.emit(f"文件不存在: {full_rom_path}", True)
-                    error_count += 1
-
-                self.delete_matching_files(xml_dir, base_name)
-
-                video_path = os.path.join(xml_dir, 'videos', f"{base_name}.mp4")
-                if self.media_player and os.path.exists(video_path):
-                    current_media = self.media_player.media().canonicalUrl().toLocalFile()
-                    if current_media == video_path:
-                        self.media_player.stop()
-                        self.media_player.deleteLater()
-                        self.media_player = None
-                        time.sleep(0.5)
-
-                max_retries = 3
-                for retry in range(max_retries):
-                    try:
-                        if os.path.exists(video_path):
-                            os.remove(video_path)
-                            success_count += 1
-                            break
-                    except Exception as e:
-                        if retry < max_retries - 1:
-                            time.sleep(0.2)
-                        else:
-                            self.status_signal.emit(f"删除视频失败: {video_path} - {str(e)}", True)
-                            error_count += 1
-
-                root = self.current_tree.getroot()
-                for game in root.findall('game'):
-                    if game.find('path').text == rom_path:
-                        root.remove(game)
-                        break
-                self.current_tree.write(self.current_xml_path, encoding='utf-8', xml_declaration=True, pretty_print=True)
+                plan = deleter.plan(rom_paths, keep_rom_paths)
+            except Exception as e:
+                self.status_signal.emit(f"删除失败: {str(e)}", True)
+                return
+            QApplication.instance().postEvent(self, CallbackEvent(self._confirm_deletions, deleter, plan))
+
+        threading.Thread(target=build_plan, daemon=True).start()
+
+    def _confirm_deletions(self, deleter, plan):
+        """先展示删除预览，确认后再在后台执行"""
+        msg = QMessageBox(self)
+        msg.setIcon(QMessageBox.Warning)
+        msg.setWindowTitle("确认删除")
+        msg.setText(f"将从 gamelist.xml 移除 {len(plan.rom_paths)} 个游戏，"
+                    f"并删除 {len(plan.files)} 个文件/文件夹（共 {plan.total_bytes / 1048576:.1f} MB）。")
+        msg.setInformativeText("此操作不可恢复，是否继续？")
+        msg.setDetailedText('\n'.join(path for path, _ in plan.files))
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        if msg.exec_() != QMessageBox.Yes:
+            self.status_signal.emit("已取消删除", False)
+            return
 
+        self._release_media(plan.files)
+        self.deleted_games.pop(deleter.writer.xml_path, None)
+        category_name = self.current_category
+        journal = self.journal
+
+        def execute():
+            last_reported = 0
+
+            def on_progress(done, total):
+                nonlocal last_reported
+                if done == total or done - last_reported >= max(1, total // 10):
+                    last_reported = done
+                    self.status_signal.emit(f"正在删除文件：{done}/{total}", False)
+
+            try:
+                removed, errors = deleter.execute(plan, on_progress, journal)
             except Exception as e:
                 self.status_signal.emit(f"删除失败: {str(e)}", True)
-                error_count += 1
+                return
+            for error in errors:
+                self.status_signal.emit(f"删除失败: {error}", True)
+            if deleter.journal_error:
+                self.status_signal.emit(deleter.journal_error, True)
+            self.status_signal.emit(
+                f"操作完成: 移除{len(plan.rom_paths)}个游戏，删除{removed}个文件，"
+                f"释放{plan.total_bytes / 1048576:.1f} MB，失败{len(errors)}项", False)
+            QApplication.instance().postEvent(self, CallbackEvent(self._reload_category, category_name))
+
+        threading.Thread(target=execute, daemon=True).start()
+
+    def _release_media(self, files):
+        """正在播放的视频会占用文件，删除前先释放"""
+        if self.media_player:
+            current_media = os.path.normpath(self.media_player.media().canonicalUrl().toLocalFile() or ".")
+            if any(current_media == path for path, _ in files):
+                self.media_player.stop()
+                self.media_player.setMedia(QMediaContent())
+
+    def audit_library(self):
+        with self.lock:
+            category_dirs = dict(self.category_dirs)
+        if not category_dirs:
+            self.status_signal.emit("请先选择RetroBat所在目录", True)
+            return
+
+        self.save_xml(wait=True)
+        self.audit_button.setEnabled(False)
+        self.status_signal.emit(f"开始检查{len(category_dirs)}个机种的ROM与媒体文件...", False)
+        writers = {name: self._writer(xml_path) for name, xml_path in category_dirs.items()}
+
+        def worker():
+            def on_system(audit):
+                if audit.error:
+                    self.status_signal.emit(f"检查失败：{audit.system} - {audit.error}", True)
+                elif audit:
+                    self.status_signal.emit(
+                        f"{audit.system}：缺失ROM {len(audit.missing_roms)}个，孤立媒体 {len(audit.orphaned_media)}个"
+                        f"（{audit.orphaned_bytes / 1048576:.1f} MB）", False)
+
+            try:
+                audits = LibraryAuditor().run(category_dirs, on_system)
+            except Exception as e:
+                self.status_signal.emit(f"检查失败：{str(e)}", True)
+                audits = []
+            # 确认框展示的就是之后实际执行的删除计划
+            cleanups = []
+            for audit in audits:
+                if not audit or audit.error:
+                    continue
+                deleter = BulkDeleter(os.path.dirname(audit.xml_path), writers[audit.system])
+                try:
+                    cleanups.append((audit, deleter, LibraryAuditor.plan_cleanup(audit, deleter)))
+                except OSError as e:
+                    self.status_signal.emit(f"生成清理计划失败：{audit.system} - {str(e)}", True)
+            QApplication.instance().postEvent(self, CallbackEvent(self._confirm_audit_cleanup, audits, cleanups))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _confirm_audit_cleanup(self, audits, cleanups):
+        self.audit_button.setEnabled(True)
+        missing_count = sum(len(audit.missing_roms) for audit in audits if not audit.error)
+        orphan_count = sum(len(audit.orphaned_media) for audit in audits if not audit.error)
+        orphan_bytes = sum(audit.orphaned_bytes for audit in audits if not audit.error)
+        self.status_signal.emit(
+            f"检查完成：{len(audits)}个机种，缺失ROM {missing_count}个，"
+            f"孤立媒体 {orphan_count}个（{orphan_bytes / 1048576:.1f} MB）", False)
+        if not cleanups:
+            return
+
+        game_count = sum(len(plan.rom_paths) for _, _, plan in cleanups)
+        file_count = sum(len(plan.files) for _, _, plan in cleanups)
+        total_bytes = sum(plan.total_bytes for _, _, plan in cleanups)
+        details = []
+        for audit, _, plan in cleanups:
+            details.extend(f"[{audit.system}] 移除游戏：{rom_path}" for rom_path in plan.rom_paths)
+            details.extend(f"[{audit.system}] 删除{'文件夹' if is_dir else '文件'}：{path}"
+                           for path, is_dir in plan.files)
+        msg = QMessageBox(self)
+        msg.setIcon(QMessageBox.Warning)
+        msg.setWindowTitle("清理孤立媒体")
+        msg.setText(f"将从 gamelist.xml 移除 {game_count} 个ROM已不存在的游戏，"
+                    f"并删除 {file_count} 个媒体文件（{total_bytes / 1048576:.1f} MB）。")
+        msg.setInformativeText("此操作不可恢复，是否继续？")
+        msg.setDetailedText('\n'.join(details))
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        if msg.exec_() != QMessageBox.Yes:
+            self.status_signal.emit("已取消清理", False)
+            return
 
-        self.deleted_games = []
-        self.status_signal.emit(f"操作完成: 成功删除{success_count}项，失败{error_count}项", False)
-        self.show_category_info(self.category_list.currentItem())
+        self._release_media([entry for _, _, plan in cleanups for entry in plan.files])
+        current_category, current_journal = self.current_category, self.journal
+
+        def execute():
+            for audit, deleter, plan in cleanups:
+                try:
+                    journal = current_journal if audit.system == current_category else None
+                    removed, errors = deleter.execute(plan, journal=journal)
+                except Exception as e:
+                    self.status_signal.emit(f"清理失败：{audit.system} - {str(e)}", True)
+                    continue
+                for error in errors:
+                    self.status_signal.emit(f"删除失败: {error}", True)
+                if deleter.journal_error:
+                    self.status_signal.emit(f"{audit.system}：{deleter.journal_error}", True)
+                self.status_signal.emit(
+                    f"{audit.system}：移除{len(plan.rom_paths)}个游戏，删除{removed}个文件，"
+                    f"释放{plan.total_bytes / 1048576:.1f} MB，失败{len(errors)}项", False)
+                QApplication.instance().postEvent(self, CallbackEvent(self._reload_category, audit.system))
+
+        threading.Thread(target=execute, daemon=True).start()
+
+    def _reload_category(self, category_name):
+        self.media_index.invalidate(category_name)
+        self._video_checked.clear()
+        matches = self.category_list.findItems(category_name, Qt.MatchExactly)
+        if matches and category_name == self.current_category:
+            self.show_category_info(matches[0])
+
+    def _on_global_index_ready(self):
+        if self.global_search_check.isChecked():
+            self.filter_games()
 
     def on_search_text_changed(self):
         self.search_timer.start(300)
 
+    def toggle_global_search(self, state):
+        global_mode = (state == Qt.Checked)
+        self.result_list.setVisible(not global_mode)
+        self.global_result_list.setVisible(global_mode)
+        if global_mode and self._global_stale:
+            self.refresh_global_index()
+        self.filter_games()
+
+    def filter_global(self, query):
+        self.global_result_list.clear()
+        results = self.global_index.search(query)
+        for category_name, _, name, rom_path in results:
+            item = QListWidgetItem(f"[{category_name}] {name}")
+            item.setData(Qt.UserRole, (category_name, rom_path))
+            self.global_result_list.addItem(item)
+        self.game_count_label.setText(f"全局搜索结果：{len(results)}")
+
+    def open_global_result(self, item):
+        """打开结果所在机种，加载完成后定位到对应游戏"""
+        category_name, rom_path = item.data(Qt.UserRole)
+        matches = self.category_list.findItems(category_name, Qt.MatchExactly)
+        if not matches:
+            return
+        self._pending_select_rom = rom_path
+        self.search_timer.stop()
+        self.global_search_check.setChecked(False)
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        self.category_list.setCurrentItem(matches[0])
+        self.show_category_info(matches[0])
+
+    def _select_pending_game(self):
+        rom_path, self._pending_select_rom = self._pending_select_rom, None
+        try:
+            game_id = self.game_table.roms.index(rom_path)
+        except ValueError:
+            return
+        row = self.result_model.row_of(game_id)
+        while row >= self.result_model.rowCount() and self.result_model.canFetchMore(QModelIndex()):
+            self.result_model.fetchMore(QModelIndex())
+        if row >= 0:
+            index = self.result_model.index(row)
+            self.result_list.setCurrentIndex(index)
+            self.result_list.scrollTo(index, QListView.PositionAtCenter)
+            self._handle_selection(row)
+
+    def _sort_active(self):
+        return self.sort_key != 'file' or self.sort_order_button.isChecked()
+
+    def _sorted_ids(self, query):
+        ids = self.search_index.search(query, self._loaded_count)
+        if self._sort_active():
+            ids = self.sort_index.sort(ids, self.sort_key, self.sort_order_button.isChecked())
+        return ids
+
+    def on_sort_changed(self):
+        # 供加载线程读取，决定预先计算哪一列的排序键
+        self.sort_key = key = self.sort_combo.currentData()
+        self.sort_order_button.setText("降序" if self.sort_order_button.isChecked() else "升序")
+        self.result_model.detail_field = key if key in INFO_FIELDS else None
+        if self.global_search_check.isChecked():
+            return
+        self.result_model.set_view(self.game_table, self._sorted_ids(self.search_box.text()))
+        self._update_game_count()
+
     def filter_games(self):
-        keyword = self.search_box.text().lower()
-        if not keyword:
-            self.sorted_results = self.raw_results.copy()
+        query = self.search_box.text()
+        if self.global_search_check.isChecked():
+            self.filter_global(query)
+            return
+        ids = self._sorted_ids(query)
+        if not query.strip():
+            self.result_model.set_view(self.game_table, ids)
         else:
-            self.sorted_results = [
-                item for item in self.raw_results 
-                if keyword in item[1].lower() or keyword in item[2].lower()
-            ]
-        self.update_display()
+            self.result_model.narrow(ids)
+        self._update_game_count()
 
     def import_metadata(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self, "选择导入文件", 
-            "", "CSV文件 (*.csv);;Excel文件 (*.xlsx)"
+            "", "表格文件 (*.csv *.xlsx);;CSV文件 (*.csv);;Excel文件 (*.xlsx)"
         )
 
         if not file_path:
             return
 
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                for line in lines[1:]:
-                    parts = line.strip().split(',')
-                    if len(parts) >= 3:
-                        rom_name, game_name, description = parts[0], parts[1], parts[2]
-                        for i, (r_name, _, _, elem) in enumerate(self.raw_results):
-                            if r_name == rom_name:
-                                if elem.find('name') is not None:
-                                    elem.find('name').text = game_name
-                                else:
-                                    ET.SubElement(elem, 'name').text = game_name
-
-                                if elem.find('desc') is not None:
-                                    elem.find('desc').text = description
-                                else:
-                                    ET.SubElement(elem, 'desc').text = description
-
-                                self.raw_results[i] = (r_name, game_name, description, elem)
-            self.save_xml()
-            self.filter_games()
-            self.status_signal.emit("成功导入并更新游戏数据", False)
-        except Exception as e:
-            self.status_signal.emit(f"导入失败：{str(e)}", True)
+        importer = MetadataImporter(self.game_table)
+        generation = self._load_generation
+        self.status_signal.emit(f"正在导入：{os.path.basename(file_path)}", False)
 
-    def check_update(self):
-        def update_check_finished(reply):
+        def worker():
             try:
-                data = reply.readAll().data().decode()
-                latest_ver = re.search(r'"tag_name":\s*"([\d.]+)"', data).group(1)
-                if latest_ver > CURRENT_VERSION:
-                    self.show_update_notification(latest_ver)
+                changes, summary = importer.run(file_path)
             except Exception as e:
-                print(f"更新检查失败: {str(e)}")
-            finally:
-                reply.deleteLater()
+                self.status_signal.emit(f"导入失败：{str(e)}", True)
+                return
+            QApplication.instance().postEvent(
+                self, CallbackEvent(self._apply_import, generation, changes, summary))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _apply_import(self, generation, changes, summary):
+        if generation != self._load_generation:
+            self.status_signal.emit("导入期间已切换机种，导入结果已丢弃", True)
+            return
 
-        manager = QNetworkAccessManager()
+        table = self.game_table
+        columns = {'name': table.names, 'desc': table.descs}
+        edits = []
+        for game_id, field, value in changes:
+            edits.append((game_id, field, columns[field][game_id], value))
+            columns[field][game_id] = value
+        if edits:
+            self._record_edits(edits)
+        for game_id in {game_id for game_id, _, _ in changes}:
+            self.search_index.update(game_id)
+
+        if changes:
+            self.save_xml()
+            self.filter_games()
+        self.status_signal.emit(
+            f"导入完成：共{summary.rows}行，匹配{summary.matched}行"
+            f"（其中{summary.loose_matched}行忽略区域/版本标签后匹配），未匹配{summary.unmatched}行，"
+            f"修改{summary.changed_games}个游戏（{summary.changed_fields}个字段）", False)
+        if summary.unmatched_samples:
+            self.status_signal.emit("未匹配的 ROM：" + "、".join(summary.unmatched_samples), True)
+
+    def check_update(self):
+        from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest
+        if self._network_manager is None:
+            self._network_manager = QNetworkAccessManager(self)
+            # 直接连到绑定方法，不用捕获 reply 的 lambda：闭包在其他线程 gc 时回收会导致崩溃
+            self._network_manager.finished.connect(self.update_check_finished)
         url = QUrl("https://api.github.com/repos/wincyd/retrobat-tool/releases/latest")
         request = QNetworkRequest(url)
-        reply = manager.get(request)
-        reply.finished.connect(lambda: update_check_finished(reply))
+        self._network_manager.get(request)
+
+    def update_check_finished(self, reply):
+        try:
+            data = reply.readAll().data().decode()
+            latest_ver = re.search(r'"tag_name":\s*"([\d.]+)"', data).group(1)
+            if latest_ver > CURRENT_VERSION:
+                self.show_update_notification(latest_ver)
+        except Exception as e:
+            print(f"更新检查失败: {str(e)}")
+        finally:
+            reply.deleteLater()
 
     def show_update_notification(self, new_version):
         msg = QMessageBox()
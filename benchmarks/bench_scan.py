@@ -0,0 +1,61 @@
+"""比较 os.walk 全量遍历与 LibraryScanner 剪枝扫描访问的目录项数量
+
+用法: python benchmarks/bench_scan.py [机种数] [每个机种的 ROM 数]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import retrobat_core as tool
+from synthetic_library import build_library
+
+
+def walk_entries(root):
+    visited = 0
+    for _, dirs, files in os.walk(root):
+        visited += len(dirs) + len(files)
+    return visited
+
+
+def main():
+    systems = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    roms = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as root:
+        # 扫描只看目录结构，描述取短一些以加快生成
+        build_library(root, systems, roms, desc_words=5, media_ratio=1.0)
+
+        start = time.perf_counter()
+        walk_visited = walk_entries(root)
+        walk_time = time.perf_counter() - start
+
+        scanner = tool.LibraryScanner()
+        start = time.perf_counter()
+        found = scanner.scan(root)
+        scan_time = time.perf_counter() - start
+
+        print(f"os.walk:        {walk_visited:>8} 项  {walk_time * 1000:8.1f} ms")
+        print(f"LibraryScanner: {scanner.entries_visited:>8} 项  {scan_time * 1000:8.1f} ms"
+              f"  ({len(found)} 个机种)")
+
+        # 第一次建立持久索引，第二次模拟重新打开同一目录
+        index = tool.ScanIndex(root)
+        tool.LibraryScanner(index=index).scan(root)
+        index.save()
+
+        index = tool.ScanIndex(root)
+        scanner = tool.LibraryScanner(index=index)
+        start = time.perf_counter()
+        index.load()
+        scanner.scan(root)
+        index.save()
+        cached_time = time.perf_counter() - start
+        print(f"索引增量扫描:   {scanner.entries_visited:>8} 项  {cached_time * 1000:8.1f} ms"
+              f"  ({index.hits} 个目录命中索引)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""在生成的假 RetroBat 目录上无界面地测量各热点路径，结果以 JSON 输出，便于不同版本间对比
+
+对应界面中的操作：
+  find_gamelist_xml   扫描根目录找出各机种（LibraryScanner，冷启动与命中扫描索引两种）
+  show_category_info  流式解析 gamelist.xml 并建立搜索索引
+  filter_games        模拟逐字输入的一组搜索
+  sort_first          首次按名称/ROM/评分等各列排序（含计算排序键）
+  sort_cached         排序键已缓存时全表降序与过滤后排序
+  import_metadata     从 CSV 匹配导入名称和描述
+  save_xml            把导入的修改写回并记入修改日志
+  save_deletions      预览并执行批量删除（10% 的游戏及其媒体）
+
+用法: python benchmarks/bench_suite.py [--systems N] [--games M] [--repeat R] [--output 结果.json] [--baseline 旧结果.json]
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import retrobat_core as tool
+from synthetic_library import build_library
+
+# 逐字输入时 filter_games 依次收到的查询，最后清空搜索框
+TYPED_QUERIES = ('s', 'su', 'sup', 'supe', 'super', 'super m', 'super ma', 'super mar',
+                 '', 'desc:dragon', 'desc:dragon quest', '', 'rom:japan', '', '超级', '')
+SORT_BENCH_KEYS = ('name', 'rom', 'rating', 'releasedate', 'playcount', 'lastplayed')
+
+
+def measure(func, repeat, setup=None):
+    """运行 repeat 次，setup 的耗时不计入；返回 (每次毫秒数, 最后一次的返回值)"""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = func(*args)
+        runs.append((time.perf_counter() - start) * 1000)
+    return runs, result
+
+
+def summarize(runs, **extra):
+    summary = {
+        'min_ms': round(min(runs), 3),
+        'median_ms': round(statistics.median(runs), 3),
+        'runs_ms': [round(value, 3) for value in runs],
+    }
+    summary.update(extra)
+    return summary
+
+
+def load_table(xml_path):
+    table = tool.GameTable()
+    search_index = tool.SearchIndex(table)
+    tool.fill_game_table(xml_path, table, search_index)
+    return table, search_index
+
+
+def write_import_csv(path, table, ratio=0.5):
+    """为一部分游戏生成新名称和描述，另加少量匹配不到的行"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rom', 'name', 'desc'])
+        step = max(1, int(1 / ratio))
+        for game_id in range(0, len(table.names), step):
+            writer.writerow([os.path.basename(table.roms[game_id]), table.names[game_id] + ' (导入)',
+                             table.descs[game_id][:200]])
+        for i in range(len(table.names) // 100):
+            writer.writerow([f"missing{i:05d}.zip", "不存在的游戏", ""])
+
+
+def bench_scan(root, repeat):
+    runs, found = measure(lambda: tool.LibraryScanner().scan(root), repeat)
+    results = {'find_gamelist_xml': summarize(runs, systems=len(found))}
+
+    index = tool.ScanIndex(root)
+    tool.LibraryScanner(index=index).scan(root)
+    index.save()
+
+    def indexed_scan():
+        index = tool.ScanIndex(root)
+        index.load()
+        scanner = tool.LibraryScanner(index=index)
+        scanner.scan(root)
+        return index.hits
+
+    runs, hits = measure(indexed_scan, repeat)
+    results['find_gamelist_xml_indexed'] = summarize(runs, index_hits=hits)
+    return results
+
+
+def bench_system(xml_path, scratch, repeat):
+    results = {}
+    runs, (table, search_index) = measure(lambda: load_table(xml_path), repeat)
+    results['show_category_info'] = summarize(runs, games=len(table))
+
+    def filter_games():
+        matched = 0
+        for query in TYPED_QUERIES:
+            matched += len(search_index.search(query, len(table.names)))
+        return matched
+
+    runs, matched = measure(filter_games, repeat)
+    results['filter_games'] = summarize(runs, queries=len(TYPED_QUERIES), matched=matched)
+
+    all_ids = search_index.search('')
+    filtered_ids = search_index.search('super')
+    runs, _ = measure(lambda: [tool.SortIndex(search_index).sort(all_ids, key) for key in SORT_BENCH_KEYS], repeat)
+    results['sort_first'] = summarize(runs, keys=len(SORT_BENCH_KEYS))
+    sort_index = tool.SortIndex(search_index)
+    for key in SORT_BENCH_KEYS:
+        sort_index.prepare(key)
+
+    def resort():
+        for key in SORT_BENCH_KEYS:
+            sort_index.sort(all_ids, key, descending=True)
+            sort_index.sort(filtered_ids, key)
+
+    runs, _ = measure(resort, repeat)
+    results['sort_cached'] = summarize(runs, keys=len(SORT_BENCH_KEYS), filtered=len(filtered_ids))
+
+    csv_path = os.path.join(scratch, 'import.csv')
+    write_import_csv(csv_path, table)
+    runs, (changes, summary) = measure(lambda: tool.MetadataImporter(table).run(csv_path), repeat)
+    results['import_metadata'] = summarize(runs, rows=summary.rows, matched=summary.matched,
+                                           changed_fields=summary.changed_fields)
+
+    system_dir = os.path.dirname(xml_path)
+    work_dir = os.path.join(scratch, 'work')
+
+    def fresh_copy():
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        shutil.copytree(system_dir, work_dir)
+        work_xml = os.path.join(work_dir, os.path.basename(xml_path))
+        work_table, _ = load_table(work_xml)
+        return work_xml, work_table
+
+    def prepare_save():
+        work_xml, work_table = fresh_copy()
+        session = tool.EditSession(work_table, work_xml)
+        journal = tool.EditJournal(work_xml)
+        columns = {'name': work_table.names, 'desc': work_table.descs}
+        for game_id, field, value in changes:
+            session.set(game_id, field, value)
+        journal.record([(work_table.roms[game_id], field, columns[field][game_id], value)
+                        for game_id, field, value in changes])
+        return tool.GamelistWriter(work_xml), session, journal
+
+    def save_xml(writer, session, journal):
+        # 与界面的 save_xml 相同的写入流程
+        rows = session.as_rows(session.take())
+        missing = journal.commit(writer, rows)
+        return len(rows) - len(missing)
+
+    runs, saved = measure(save_xml, repeat, prepare_save)
+    results['save_xml'] = summarize(runs, changed_fields=saved)
+
+    def prepare_delete():
+        work_xml, work_table = fresh_copy()
+        ids = work_table.ids()
+        deleted = [work_table.roms[game_id] for game_id in ids[::10]]
+        kept = set(ids) - set(ids[::10])
+        keep_rom_paths = [work_table.roms[game_id] for game_id in kept]
+        return tool.BulkDeleter(work_dir, tool.GamelistWriter(work_xml)), deleted, keep_rom_paths
+
+    def save_deletions(deleter, rom_paths, keep_rom_paths):
+        plan = deleter.plan(rom_paths, keep_rom_paths)
+        removed, errors = deleter.execute(plan)
+        return len(plan.rom_paths), removed, len(errors)
+
+    runs, (games, removed, errors) = measure(save_deletions, repeat, prepare_delete)
+    results['save_deletions'] = summarize(runs, games=games, files_removed=removed, errors=errors)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline_path):
+    """与旧结果逐项比较中位数，输出到 stderr"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    for name, current in results.items():
+        old = baseline.get(name)
+        if not old or not old['median_ms']:
+            continue
+        ratio = current['median_ms'] / old['median_ms']
+        print(f"{name:28} {old['median_ms']:10.2f} ms → {current['median_ms']:10.2f} ms  ×{ratio:.2f}",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RetroBat 工具热点路径基准测试")
+    parser.add_argument('--systems', type=int, default=5)
+    parser.add_argument('--games', type=int, default=5000, help="每个机种的游戏数")
+    parser.add_argument('--desc-words', type=int, default=120, help="每条描述的单词数")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="结果 JSON 文件，默认输出到 stdout")
+    parser.add_argument('--baseline', help="与之前保存的结果 JSON 比较")
+    args = parser.parse_args()
+
+    tool.load_etree()  # lxml 的导入时间不计入解析
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        category_dirs = build_library(root, args.systems, args.games, args.desc_words)
+        generate_seconds = time.perf_counter() - start
+
+        results = bench_scan(root, args.repeat)
+        xml_path = category_dirs[min(category_dirs)]
+        xml_bytes = os.path.getsize(xml_path)
+        scratch = os.path.join(root, 'scratch')
+        os.makedirs(scratch)
+        results.update(bench_system(xml_path, scratch, args.repeat))
+
+    report = {
+        'version': tool.CURRENT_VERSION,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'systems': args.systems,
+            'games': args.games,
+            'desc_words': args.desc_words,
+            'repeat': args.repeat,
+            'xml_bytes': xml_bytes,
+            'generate_seconds': round(generate_seconds, 2),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""生成用于基准测试的假 RetroBat 目录：若干机种，每个机种一个 gamelist.xml（带长描述）、
+ROM 文件以及 videos/images 媒体目录
+
+用法: python benchmarks/synthetic_library.py <目标目录> [--systems N] [--games M] [--desc-words W]
+"""
+import argparse
+import os
+import random
+from xml.sax.saxutils import escape
+
+WORDS = ('super', 'mario', 'world', 'street', 'fighter', 'final', 'fantasy', 'legend', 'zelda',
+         'dragon', 'quest', 'metal', 'slug', 'sonic', 'hedgehog', 'king', 'fighters', 'contra',
+         'castlevania', 'mega', 'man', 'bomber', 'puzzle', 'racing', 'turbo', 'star', 'force')
+CJK_WORDS = ('超级', '马里奥', '街头', '霸王', '最终', '幻想', '传说', '勇者', '斗恶龙', '合金',
+             '弹头', '拳皇', '魂斗罗', '恶魔城', '洛克人', '炸弹人', '赛车', '星际')
+REGIONS = ('(USA)', '(Japan)', '(Europe)', '(World)', '(China)')
+ROM_EXTENSIONS = ('.zip', '.7z', '.nes', '.sfc', '.md')
+
+
+def game_title(rng):
+    if rng.random() < 0.3:
+        return ''.join(rng.choice(CJK_WORDS) for _ in range(rng.randint(2, 4)))
+    return ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+
+
+def description(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def game_info(rng):
+    """评分、发行日期、游玩次数、最近游玩，部分游戏缺少这些字段"""
+    if rng.random() < 0.2:
+        return {}
+    info = {
+        'rating': f"{rng.randint(0, 10) / 10:.1f}",
+        'releasedate': f"{rng.randint(1980, 2010)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}T000000",
+    }
+    if rng.random() < 0.5:
+        info['playcount'] = str(rng.randint(1, 200))
+        info['lastplayed'] = f"2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}0000"
+    return info
+
+
+def write_gamelist(xml_path, games):
+    """games: [(rom 文件名, 名称, 描述, 图片相对路径或 None, {统计字段: 值})]"""
+    with open(xml_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0"?>\n<gameList>\n')
+        for rom_name, name, desc, image, info in games:
+            f.write('  <game>\n')
+            f.write(f'    <path>./{escape(rom_name)}</path>\n')
+            f.write(f'    <name>{escape(name)}</name>\n')
+            f.write(f'    <desc>{escape(desc)}</desc>\n')
+            if image:
+                f.write(f'    <image>{escape(image)}</image>\n')
+            for field, value in info.items():
+                f.write(f'    <{field}>{value}</{field}>\n')
+            f.write('  </game>\n')
+        f.write('</gameList>\n')
+
+
+def build_system(system_dir, games, desc_words=120, media_ratio=0.8, seed=0):
+    """生成一个机种目录，返回 gamelist.xml 路径"""
+    rng = random.Random(seed)
+    videos_dir = os.path.join(system_dir, 'videos')
+    images_dir = os.path.join(system_dir, 'images')
+    os.makedirs(videos_dir, exist_ok=True)
+    os.makedirs(images_dir, exist_ok=True)
+
+    entries = []
+    for i in range(games):
+        title = game_title(rng)
+        stem = f"{title} {rng.choice(REGIONS)} [{i:06d}]"
+        rom_name = stem + rng.choice(ROM_EXTENSIONS)
+        open(os.path.join(system_dir, rom_name), 'wb').close()
+        image = None
+        if rng.random() < media_ratio:
+            open(os.path.join(videos_dir, f"{stem}-video.mp4"), 'wb').close()
+            open(os.path.join(images_dir, f"{stem}-image.png"), 'wb').close()
+            image = f"./images/{stem}-image.png"
+        entries.append((rom_name, title, description(rng, desc_words), image, game_info(rng)))
+
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, entries)
+    return xml_path
+
+
+def build_library(root, systems=5, games=2000, desc_words=120, media_ratio=0.8, seed=0):
+    """在 root 下生成 roms/<机种>/ 及几个无关的大目录，返回 {机种: gamelist.xml}"""
+    category_dirs = {}
+    for i in range(systems):
+        name = f"system{i:03d}"
+        category_dirs[name] = build_system(os.path.join(root, 'roms', name), games,
+                                           desc_words, media_ratio, seed + i)
+    # 扫描时应被剪枝跳过的目录
+    for name in ('bios', 'emulators', 'saves'):
+        nested = os.path.join(root, name, 'a', 'b')
+        os.makedirs(nested, exist_ok=True)
+        for j in range(200):
+            open(os.path.join(nested, f"file{j:04d}.bin"), 'wb').close()
+    return category_dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成基准测试用的假 RetroBat 目录")
+    parser.add_argument('root', help="目标目录")
+    parser.add_argument('--systems', type=int, default=5)
+    parser.add_argument('--games', type=int, default=2000, help="每个机种的游戏数")
+    parser.add_argument('--desc-words', type=int, default=120, help="每条描述的单词数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    category_dirs = build_library(args.root, args.systems, args.games, args.desc_words, seed=args.seed)
+    print(f"已生成{len(category_dirs)}个机种，每个机种{args.games}个游戏：{args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2110 @@
+import sys
+import os
+import re
+import threading
+import shutil
+import time
+import glob
+import datetime
+import sqlite3
+import csv
+import json
+import hashlib
+import mmap
+import functools
+import difflib
+import heapq
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ET = None
+PINYIN = None
+
+def load_etree():
+    """lxml 在第一次解析 gamelist.xml 时才导入，不占用启动时间"""
+    global ET
+    if ET is None:
+        from lxml import etree as ET
+    return ET
+
+def load_pinyin():
+    """pypinyin 加载词典较慢，第一次遇到中文标题时才导入；未安装时返回 False"""
+    global PINYIN
+    if PINYIN is None:
+        try:
+            import pypinyin
+        except ImportError:
+            pypinyin = False
+        PINYIN = pypinyin
+    return PINYIN
+
+def load_openpyxl():
+    """openpyxl 导入较慢，只在读写 .xlsx 时才导入；未安装时返回 None"""
+    try:
+        import openpyxl
+    except ImportError:
+        return None
+    return openpyxl
+
+class _NullSpan:
+    """计时关闭时 span() 返回的共享空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'start_ns', 'profiler')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.profiler = None
+
+    def __enter__(self):
+        self.profiler = self.tracer._start_profile(self.name)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        if self.profiler is not None:
+            self.tracer._finish_profile(self.name, self.profiler)
+        self.tracer.spans.append((self.name, threading.get_ident(), threading.current_thread().name,
+                                  self.start_ns, duration_ns, self.args))
+        return False
+
+# 会打点的热点路径，诊断面板按这些名称选择要用 cProfile 分析的操作
+TRACE_SPANS = ('scan', 'parse', 'filter', 'sort', 'list.rebuild', 'list.narrow', 'media.index', 'media.thumbnail',
+               'import', 'save', 'backup', 'journal.append', 'delete.plan', 'delete', 'diff')
+
+class Tracer:
+    """热点路径的计时与计数。关闭时 span() 只返回共享的空上下文、count() 直接返回；
+    开启后最近的 span 保存在环形缓冲区中，可导出为 Chrome trace（chrome://tracing 或 Perfetto 打开）"""
+
+    MAX_SPANS = 20000
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = deque(maxlen=self.MAX_SPANS)
+        self.counters = {}
+        self.origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._profile_request = None
+
+    def span(self, name, **args):
+        if not self.enabled and self._profile_request is None:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def traced(self, name):
+        """装饰器形式的 span"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled and self._profile_request is None:
+                    return func(*args, **kwargs)
+                with Span(self, name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def recent(self, limit=200):
+        spans = list(self.spans)
+        return spans[-limit:]
+
+    def summary(self):
+        """按名称汇总缓冲区中的 span：{名称: (次数, 总耗时 ms, 最长 ms)}"""
+        totals = {}
+        for name, _, _, _, duration_ns, _ in list(self.spans):
+            count, total, longest = totals.get(name, (0, 0.0, 0.0))
+            ms = duration_ns / 1e6
+            totals[name] = (count + 1, total + ms, max(longest, ms))
+        return totals
+
+    def profile_next(self, name, on_done):
+        """用 cProfile 分析下一次名为 name 的操作，结束后在该线程中回调 on_done(name, profile)"""
+        with self._lock:
+            self._profile_request = (name, on_done)
+
+    def _start_profile(self, name):
+        with self._lock:
+            request = self._profile_request
+            if request is None or request[0] != name:
+                return None
+            self._profile_request = None
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None  # 其它线程的分析器仍在运行
+        return profiler, request[1]
+
+    def _finish_profile(self, name, profiling):
+        profiler, on_done = profiling
+        profiler.disable()
+        on_done(name, profiler)
+
+    def dump_chrome_trace(self, file_path):
+        """写出 Chrome trace 事件格式的 JSON，返回写出的 span 数"""
+        pid = os.getpid()
+        spans = list(self.spans)
+        events = []
+        threads = {}
+        for name, tid, thread_name, start_ns, duration_ns, args in spans:
+            threads[tid] = thread_name
+            events.append({'name': name, 'cat': 'retrobat', 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': (start_ns - self.origin_ns) / 1000, 'dur': duration_ns / 1000,
+                           'args': {key: str(value) for key, value in args.items()}})
+        for tid, thread_name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': thread_name}})
+        with self._lock:
+            counters = dict(self.counters)
+        if counters:
+            events.append({'name': 'counters', 'ph': 'C', 'pid': pid, 'tid': 0,
+                           'ts': (time.perf_counter_ns() - self.origin_ns) / 1000, 'args': counters})
+
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        os.replace(temp_path, file_path)
+        return len(spans)
+
+# 设置环境变量 RETROBAT_TRACE=1 时从启动开始计时，否则可在诊断面板中开启
+tracer = Tracer(enabled=bool(os.environ.get('RETROBAT_TRACE')))
+
+CURRENT_VERSION = "1.3.0"
+
+INDEX_DIR_NAME = '.retrobat-tool'
+
+class ScanIndex:
+    """持久化的目录索引：记录目录 mtime 与列表内容，未变化的目录无需重新扫描"""
+
+    FILE_NAME = 'scan_index.sqlite3'
+
+    def __init__(self, root):
+        self.path = os.path.join(root, INDEX_DIR_NAME, self.FILE_NAME)
+        self.entries = {}
+        self.hits = 0
+        self._dirty = set()
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE IF NOT EXISTS dirs ("
+                     "path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT, files TEXT)")
+        return conn
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        conn = self._connect()
+        try:
+            for path, mtime_ns, subdirs, files in conn.execute("SELECT path, mtime_ns, subdirs, files FROM dirs"):
+                self.entries[path] = (
+                    mtime_ns,
+                    subdirs.split('\n') if subdirs else [],
+                    files.split('\n') if files else []
+                )
+        finally:
+            conn.close()
+
+    def lookup(self, path, mtime_ns):
+        with self._lock:
+            self._seen.add(path)
+            cached = self.entries.get(path)
+            if cached is not None and cached[0] == mtime_ns:
+                self.hits += 1
+                return cached[1], cached[2]
+        return None
+
+    def store(self, path, mtime_ns, subdirs, files):
+        with self._lock:
+            self._seen.add(path)
+            self.entries[path] = (mtime_ns, subdirs, files)
+            self._dirty.add(path)
+
+    def _is_stale(self, path):
+        # 媒体目录只在打开机种时才会访问，只要所属机种目录仍在就保留
+        if path in self._seen:
+            return False
+        return os.path.basename(path) not in MEDIA_FOLDERS or os.path.dirname(path) not in self._seen
+
+    def save(self, prune=True):
+        """写回变化的条目；prune 为真时同时清理本次扫描未再出现的目录"""
+        with self._lock:
+            stale = [path for path in self.entries if self._is_stale(path)] if prune else []
+            dirty = {path: self.entries[path] for path in self._dirty}
+            self._dirty.clear()
+        if not dirty and not stale:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("DELETE FROM dirs WHERE path = ?", [(path,) for path in stale])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs, files) VALUES (?, ?, ?, ?)",
+                    [(path, mtime_ns, '\n'.join(subdirs), '\n'.join(files))
+                     for path, (mtime_ns, subdirs, files) in dirty.items()]
+                )
+        finally:
+            conn.close()
+        with self._lock:
+            for path in stale:
+                self.entries.pop(path, None)
+
+def cached_listdir(path, index=None):
+    """返回 (子目录名列表, 文件名列表, 实际读取的目录项数)；目录 mtime 未变时直接使用索引"""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return [], [], 0
+    if index is not None:
+        cached = index.lookup(path, mtime_ns)
+        if cached is not None:
+            return cached[0], cached[1], 1
+
+    subdirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                (subdirs if entry.is_dir() else files).append(entry.name)
+    except OSError:
+        return [], [], 1
+    if index is not None:
+        index.store(path, mtime_ns, subdirs, files)
+    return subdirs, files, 1 + len(subdirs) + len(files)
+
+MEDIA_FOLDERS = {
+    'videos': 'video',
+    'images': 'image',
+    'thumbnails': 'thumbnail',
+    'marquees': 'marquee',
+    'manuals': 'manual',
+}
+
+# RetroBat/EmulationStation 的媒体文件命名：<rom>-<类型>.<扩展名>
+MEDIA_SUFFIXES = {
+    'video': 'video',
+    'image': 'image',
+    'thumb': 'thumbnail',
+    'thumbnail': 'thumbnail',
+    'marquee': 'marquee',
+    'manual': 'manual',
+    'fanart': 'fanart',
+    'boxart': 'boxart',
+    'titleshot': 'titleshot',
+    'map': 'map',
+}
+
+# 名称匹配用的正则只在导入时编译一次
+MEDIA_SUFFIX_PATTERN = re.compile(
+    r'-(?:' + '|'.join(sorted(set(MEDIA_SUFFIXES) | {'mp4', 'avi', 'mkv', 'mov', 'flv'})) + r')$')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+# No-Intro / Redump / GoodTools 的标签：(USA) (Rev 1) (Disc 1) [!] [b1] [T+Chi]，以及中文的全角括号
+NAME_TAG_PATTERN = re.compile(r'\s*(?:\([^()]*\)|\[[^\[\]]*\]|（[^（）]*）)')
+# No-Intro 把冠词后置："Legend of Zelda, The - A Link to the Past"
+TRAILING_ARTICLE_PATTERN = re.compile(r'^(.*?),\s*the\b')
+NON_ALNUM_PATTERN = re.compile(r'[\W_]+')
+DIGITS_PATTERN = re.compile(r'\d+')
+
+@functools.lru_cache(maxsize=1 << 16)
+def clean_filename(filename):
+    """精确匹配键：去掉扩展名和 -video 等媒体后缀，小写、去标点，空格换成下划线"""
+    name = MEDIA_SUFFIX_PATTERN.sub('', os.path.splitext(filename)[0].lower())
+    return PUNCTUATION_PATTERN.sub('', name).strip().replace(' ', '_')
+
+@functools.lru_cache(maxsize=1 << 16)
+def loose_key(filename):
+    """宽松匹配键：在精确键的基础上再去掉区域/版本/光盘等标签、还原后置的冠词，只保留字母数字；
+    "Legend of Zelda, The (USA) (Rev 1).zip" 与 "The Legend of Zelda [!]-video.mp4" 得到同一个键"""
+    name = MEDIA_SUFFIX_PATTERN.sub('', os.path.splitext(filename)[0].lower())
+    name = NAME_TAG_PATTERN.sub('', name)
+    name = TRAILING_ARTICLE_PATTERN.sub(r'the \1', name)
+    return NON_ALNUM_PATTERN.sub('', name)
+
+def rom_keys(rom_path):
+    """ROM 路径的 (精确键, 宽松键)"""
+    if not rom_path:
+        return "", ""
+    name = os.path.basename(rom_path)
+    return clean_filename(name), loose_key(name)
+
+class FuzzyKeyIndex:
+    """宽松键仍对不上时的模糊匹配兜底：按三元组倒排表选出共享三元组最多的至多 CANDIDATES 个候选，
+    再用 difflib 计算相似度，不低于 THRESHOLD 且唯一最高时才算匹配，每次查找的开销有上限。
+    数字不同（续作编号）或一方是另一方的前缀/后缀（Street Fighter II 与 III、Ms. Pac-Man）的不算"""
+
+    THRESHOLD = 0.85
+    CANDIDATES = 20
+    MAX_POSTING = 2000  # 过于常见的三元组不用于挑选候选
+    MIN_LENGTH = 4
+
+    def __init__(self, keys=()):
+        self._keys = set()
+        self._postings = {}
+        self._cache = {}
+        for key in keys:
+            self.add(key)
+
+    @staticmethod
+    def _grams(key):
+        return {key[i:i + 3] for i in range(len(key) - 2)}
+
+    def add(self, key):
+        if len(key) < self.MIN_LENGTH or key in self._keys:
+            return
+        self._keys.add(key)
+        self._cache.clear()
+        for gram in self._grams(key):
+            self._postings.setdefault(gram, []).append(key)
+
+    @staticmethod
+    def _compatible(key, candidate):
+        return (DIGITS_PATTERN.findall(key) == DIGITS_PATTERN.findall(candidate)
+                and not candidate.startswith(key) and not key.startswith(candidate)
+                and not candidate.endswith(key) and not key.endswith(candidate))
+
+    def candidates(self, key):
+        """相似度不低于阈值的 [(相似度, 键)]，按相似度从高到低"""
+        if key in self._keys:
+            return [(1.0, key)]
+        if len(key) < self.MIN_LENGTH:
+            return []
+        counts = {}
+        for gram in self._grams(key):
+            posting = self._postings.get(gram)
+            if posting and len(posting) <= self.MAX_POSTING:
+                for candidate in posting:
+                    counts[candidate] = counts.get(candidate, 0) + 1
+        scored = []
+        for candidate in heapq.nlargest(self.CANDIDATES, counts, key=counts.__getitem__):
+            if not self._compatible(key, candidate):
+                continue
+            ratio = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if ratio >= self.THRESHOLD:
+                scored.append((ratio, candidate))
+        scored.sort(reverse=True)
+        return scored
+
+    def match(self, key):
+        """唯一最相似的键；没有或有并列时返回 None，结果按键缓存"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        scored = self.candidates(key)
+        result = None
+        if scored and (len(scored) == 1 or scored[0][0] > scored[1][0]):
+            result = scored[0][1]
+        self._cache[key] = result
+        return result
+
+def media_kind(filename, default_kind):
+    stem = os.path.splitext(filename)[0].lower()
+    suffix = stem.rsplit('-', 1)[-1] if '-' in stem else ''
+    return MEDIA_SUFFIXES.get(suffix, default_kind)
+
+class MediaIndex:
+    """按机种懒加载的媒体索引，键为 (机种, 规范化 ROM 名)；精确键找不到时
+    退回宽松键（去掉标签后同名的媒体，多个时取文件名排序最前的），两次都是 O(1) 的字典查找；
+    仍找不到时再在本机种的宽松键中做有上限的模糊匹配（FuzzyKeyIndex）"""
+
+    def __init__(self, scan_index=None):
+        self.scan_index = scan_index
+        self._entries = {}
+        self._loose = {}
+        self._fuzzy = {}
+        self._systems = set()
+        self._lock = threading.Lock()
+
+    @tracer.traced('media.index')
+    def ensure_system(self, system, system_dir):
+        """首次打开机种时列出其媒体目录；已建立过则直接返回"""
+        with self._lock:
+            if system in self._systems:
+                return False
+
+        entries = {}
+        loose = {}
+        for folder, default_kind in MEDIA_FOLDERS.items():
+            media_dir = os.path.join(system_dir, folder)
+            for name in sorted(cached_listdir(media_dir, self.scan_index)[1]):
+                kind = media_kind(name, default_kind)
+                path = os.path.join(media_dir, name)
+                entries.setdefault((system, clean_filename(name)), {})[kind] = path
+                key = loose_key(name)
+                if key:
+                    loose.setdefault((system, key), {}).setdefault(kind, path)
+
+        fuzzy = FuzzyKeyIndex(key for _, key in loose)
+        with self._lock:
+            self._entries.update(entries)
+            self._loose.update(loose)
+            self._fuzzy[system] = fuzzy
+            self._systems.add(system)
+        return True
+
+    def lookup(self, system, rom_key, kind='video', loose=None):
+        """rom_key 为精确键，loose 为宽松键（GameTable.loose_keys）"""
+        tracer.count('media.lookup')
+        media = self._entries.get((system, rom_key))
+        path = media.get(kind) if media else None
+        if path is None and loose:
+            media = self._loose.get((system, loose))
+            path = media.get(kind) if media else None
+            if path is not None:
+                tracer.count('media.lookup.loose')
+        if path is None and loose:
+            fuzzy = self._fuzzy.get(system)
+            key = fuzzy.match(loose) if fuzzy is not None else None
+            media = self._loose.get((system, key)) if key else None
+            path = media.get(kind) if media else None
+            if path is not None:
+                tracer.count('media.lookup.fuzzy')
+        return path
+
+    def match(self, system, rom_name, kind='video'):
+        """按 ROM 文件名查找"""
+        return self.lookup(system, clean_filename(rom_name), kind, loose_key(rom_name))
+
+    def invalidate(self, system):
+        with self._lock:
+            self._systems.discard(system)
+            self._fuzzy.pop(system, None)
+            for index in (self._entries, self._loose):
+                for key in [key for key in index if key[0] == system]:
+                    del index[key]
+
+# gamelist.xml 中记录的媒体路径字段，GameTable.media 按此顺序保存
+MEDIA_FIELDS = ('image', 'thumbnail', 'marquee', 'video', 'manual')
+# 可用于排序的统计字段，GameTable.info 按此顺序保存原文
+INFO_FIELDS = ('rating', 'releasedate', 'playcount', 'lastplayed')
+
+def iter_gamelist_rows(xml_path, cancel_event=None, progress=None):
+    """流式解析 gamelist.xml，逐个产出 (序号, rom 路径, 名称, 描述, 媒体字段元组, 统计字段元组)，
+    已处理的元素随即释放"""
+    total_size = os.path.getsize(xml_path) or 1
+    with open(xml_path, 'rb') as f:
+        context = load_etree().iterparse(f, events=('end',), tag='game', remove_blank_text=True, huge_tree=True)
+        ordinal = 0
+        for _, game in context:
+            parent = game.getparent()
+            if parent is None or parent.getparent() is not None:
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                return
+
+            rom_path = game.findtext('path') or ""
+            name_text = (game.findtext('name') or "").strip()
+            desc_text = (game.findtext('desc') or "").strip()
+            media = tuple((game.findtext(field) or "").strip() for field in MEDIA_FIELDS)
+            info = tuple((game.findtext(field) or "").strip() for field in INFO_FIELDS)
+            yield ordinal, rom_path, name_text, desc_text, media, info
+            ordinal += 1
+
+            game.clear(keep_tail=True)
+            while game.getprevious() is not None:
+                del parent[0]
+            if progress is not None:
+                progress(f.tell() / total_size)
+
+class GameTable:
+    """列式游戏表：每个字段一个并行数组，游戏 id 即行号且不会复用；
+    过滤视图只保存 id 数组，不复制行"""
+
+    def __init__(self):
+        self.roms = []
+        self.keys = []
+        self.loose_keys = []
+        self.names = []
+        self.descs = []
+        self.media = []
+        self.info = []
+        self.ordinals = array('I')
+        self.alive = bytearray()
+        self.alive_count = 0
+
+    def __len__(self):
+        return self.alive_count
+
+    def append(self, ordinal, rom_path, key, name, desc, media=(), info=(), loose=""):
+        game_id = len(self.names)
+        self.roms.append(rom_path)
+        self.keys.append(sys.intern(key))
+        self.loose_keys.append(sys.intern(loose))
+        self.names.append(name)
+        self.descs.append(desc)
+        self.media.append(media if any(media) else ())
+        self.info.append(info if any(info) else ())
+        self.ordinals.append(ordinal)
+        self.alive.append(1)
+        self.alive_count += 1
+        return game_id
+
+    def remove(self, game_id):
+        if self.alive[game_id]:
+            self.alive[game_id] = 0
+            self.alive_count -= 1
+
+    def ids(self):
+        return array('I', (game_id for game_id, flag in enumerate(self.alive) if flag))
+
+    def media_path(self, game_id, field, system_dir):
+        """gamelist.xml 中记录的媒体路径（相对机种目录），没有记录时返回 None"""
+        media = self.media[game_id]
+        value = media[MEDIA_FIELDS.index(field)] if media else ""
+        return os.path.normpath(os.path.join(system_dir, value)) if value else None
+
+CJK_PATTERN = re.compile(r'[\u3400-\u9fff]')
+QUERY_FIELD_PATTERN = re.compile(r'\b(name|desc|rom):', re.IGNORECASE)
+
+def pinyin_initials(text):
+    """中文标题的拼音首字母（需要安装 pypinyin），其它字符原样保留"""
+    if not CJK_PATTERN.search(text):
+        return ""
+    pypinyin = load_pinyin()
+    if not pypinyin:
+        return ""
+    return ''.join(pypinyin.lazy_pinyin(text, style=pypinyin.Style.FIRST_LETTER)).lower()
+
+def parse_query(query):
+    """把查询拆成 [(字段, 值)]；未指定字段的部分字段为 None，整体作为一个短语匹配"""
+    terms = []
+    parts = QUERY_FIELD_PATTERN.split(query.lower())
+    if parts[0].strip():
+        terms.append((None, parts[0].strip()))
+    for i in range(1, len(parts) - 1, 2):
+        value = parts[i + 1].strip()
+        if value:
+            terms.append((parts[i], value))
+    return terms
+
+class SearchIndex:
+    """单个机种的搜索索引：名称、ROM 名与拼音首字母建立单字/二元组倒排表；
+    描述较长，按字符和单词建立倒排表，另有一个词表的单字/二元组索引用来找出包含查询的单词"""
+
+    GRAM_FIELDS = ('name', 'rom', 'py')
+
+    def __init__(self, table):
+        self.table = table
+        self.lower = {'name': [], 'rom': [], 'py': [], 'desc': []}
+        self.grams = {field: {} for field in self.GRAM_FIELDS}
+        self.desc_chars = {}
+        self.desc_words = {}
+        self._word_grams = {}
+        self._stale = set()
+        self._last_terms = None
+        self._last_result = None
+        self._last_limit = None
+        self.updated_ids = []
+
+    @staticmethod
+    def _grams(text):
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        return grams
+
+    @staticmethod
+    def _add_postings(postings, game_id, keys):
+        # keys 已去重；update 重复追加的 id 在查询时会被集合去掉
+        get = postings.get
+        for key in keys:
+            posting = get(key)
+            if posting is None:
+                postings[key] = array('I', (game_id,))
+            else:
+                posting.append(game_id)
+
+    def _index_field(self, field, game_id, text):
+        self._add_postings(self.grams[field], game_id, self._grams(text))
+
+    def _index_desc(self, game_id, text):
+        words = set(text.split())
+        for word in words.difference(self.desc_words):
+            for gram in self._grams(word):
+                self._word_grams.setdefault(gram, []).append(word)
+        self._add_postings(self.desc_words, game_id, words)
+        # 查询不会是单个空白字符，字符表由去重后的单词得到，比直接 set(text) 快
+        self._add_postings(self.desc_chars, game_id, set(''.join(words)))
+
+    def add(self, game_id):
+        """按游戏 id 顺序追加索引（加载时调用）"""
+        table = self.table
+        values = {
+            'name': table.names[game_id].lower(),
+            'rom': os.path.basename(table.roms[game_id]).lower(),
+            'py': pinyin_initials(table.names[game_id]),
+            'desc': table.descs[game_id].lower(),
+        }
+        for field, value in values.items():
+            self.lower[field].append(value)
+            if field in self.grams and value:
+                self._index_field(field, game_id, value)
+        if values['desc']:
+            self._index_desc(game_id, values['desc'])
+        self._last_terms = None
+
+    def update(self, game_id):
+        """名称/描述修改后刷新；旧的倒排项保留，查询时会被逐条校验过滤"""
+        table = self.table
+        name = table.names[game_id]
+        self.lower['name'][game_id] = name.lower()
+        self.lower['py'][game_id] = pinyin_initials(name)
+        self.lower['desc'][game_id] = table.descs[game_id].lower()
+        for field in ('name', 'py'):
+            if self.lower[field][game_id]:
+                self._index_field(field, game_id, self.lower[field][game_id])
+        if self.lower['desc'][game_id]:
+            self._index_desc(game_id, self.lower['desc'][game_id])
+        self.updated_ids.append(game_id)
+        self._stale.add(game_id)
+        self._last_terms = None
+
+    def _gram_candidates(self, field, value):
+        postings = self.grams[field]
+        grams = [value] if len(value) == 1 else [value[i:i + 2] for i in range(len(value) - 1)]
+        smallest = None
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                return ()
+            if smallest is None or len(posting) < len(smallest):
+                smallest = posting
+        return smallest
+
+    def _word_matches(self, part):
+        """描述中含有包含 part 的单词的游戏"""
+        grams = [part] if len(part) == 1 else [part[i:i + 2] for i in range(len(part) - 1)]
+        words = min((self._word_grams.get(gram, ()) for gram in grams), key=len)
+        found = set()
+        for word in words:
+            if part in word:
+                found.update(self.desc_words[word])
+        return found
+
+    def _desc_matches(self, value):
+        """单字直接取字符倒排表；不含空白的查询必定落在某个单词（按空白切分）内部，合并包含它的单词的
+        倒排表即是精确结果；含空白的短语先按其中的单词求交集，再逐条校验"""
+        if len(value) == 1:
+            return set(self.desc_chars.get(value, ()))
+        parts = value.split()
+        if len(parts) == 1:
+            return self._word_matches(value)
+        found = None
+        for part in sorted(set(parts), key=len, reverse=True):
+            matches = self._word_matches(part)
+            found = matches if found is None else found & matches
+            if not found:
+                return found
+        descs = self.lower['desc']
+        return {game_id for game_id in found if value in descs[game_id]}
+
+    def _field_matches(self, field, value, candidates=None):
+        column = self.lower[field]
+        if candidates is not None:
+            return {game_id for game_id in candidates if value in column[game_id]}
+        if field == 'desc':
+            found = self._desc_matches(value)
+        elif len(value) <= 2:
+            # 单字/二元组的倒排表本身就是精确结果
+            found = set(self._gram_candidates(field, value))
+        else:
+            return {game_id for game_id in self._gram_candidates(field, value) if value in column[game_id]}
+        # 修改过的游戏倒排表里还留着旧的字词，逐条校验
+        for game_id in found & self._stale:
+            if value not in column[game_id]:
+                found.discard(game_id)
+        return found
+
+    def _term_matches(self, field, value, candidates=None):
+        if field is not None:
+            return self._field_matches(field, value, candidates)
+        found = self._field_matches('name', value, candidates)
+        found |= self._field_matches('desc', value, candidates)
+        # 索引过中文标题且装有 pypinyin 时才有拼音列
+        if PINYIN and value.isascii():
+            found |= self._field_matches('py', value, candidates)
+        return found
+
+    @staticmethod
+    def _implies(new_term, old_term):
+        new_field, new_value = new_term
+        old_field, old_value = old_term
+        if old_value not in new_value:
+            return False
+        return new_field == old_field or (old_field is None and new_field in ('name', 'desc'))
+
+    @tracer.traced('filter')
+    def search(self, query, limit=None):
+        """返回按游戏 id 排序的匹配结果；查询只是在上一次基础上变长时直接在旧结果里筛选"""
+        terms = parse_query(query)
+        limit = len(self.lower['name']) if limit is None else limit
+        if not terms:
+            return array('I', (game_id for game_id in range(limit) if self.table.alive[game_id]))
+
+        candidates = None
+        if self._last_terms is not None and self._last_limit == limit \
+                and all(any(self._implies(new, old) for new in terms) for old in self._last_terms):
+            candidates = self._last_result
+
+        for field, value in terms:
+            candidates = self._term_matches(field, value, candidates)
+            if not candidates:
+                break
+
+        alive = self.table.alive
+        result = array('I', sorted(game_id for game_id in candidates if game_id < limit and alive[game_id]))
+        self._last_terms = terms
+        self._last_result = result
+        self._last_limit = limit
+        return result
+
+    def matches(self, game_id, query):
+        """单条判断，用于加载过程中逐批过滤新到的行"""
+        for field, value in parse_query(query):
+            if not self._term_matches(field, value, (game_id,)):
+                return False
+        return True
+
+def fill_game_table(xml_path, table, search_index=None, cancel_event=None, on_row=None, progress=None):
+    """流式读取 gamelist.xml，填充游戏表（及搜索索引），每加入一行回调 on_row(game_id)"""
+    with tracer.span('parse', system=os.path.basename(os.path.dirname(xml_path))):
+        rows = iter_gamelist_rows(xml_path, cancel_event, progress)
+        for ordinal, rom_path, name_text, desc_text, media, info in rows:
+            key, loose = rom_keys(rom_path)
+            game_id = table.append(ordinal, rom_path, key, name_text, desc_text, media, info, loose)
+            if search_index is not None:
+                search_index.add(game_id)
+            if on_row is not None:
+                on_row(game_id)
+        tracer.count('parse.games', len(table.names))
+    return table
+
+# 排序方式：'file' 为 gamelist.xml 中的顺序（即游戏 id 顺序）
+SORT_KEYS = {
+    'file': '文件顺序',
+    'name': '名称',
+    'rom': 'ROM',
+    'rating': '评分',
+    'releasedate': '发行日期',
+    'playcount': '游玩次数',
+    'lastplayed': '最近游玩',
+}
+NATURAL_SPLIT_PATTERN = re.compile(r'(\d+)')
+
+def natural_key(text):
+    """自然排序键：数字按数值比较，Game 2 排在 Game 10 之前"""
+    parts = NATURAL_SPLIT_PATTERN.split(text)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+def collation_text(text):
+    """已小写的标题转为排序文本：中文转为全拼（需要安装 pypinyin），与英文标题按字母混排"""
+    if not CJK_PATTERN.search(text):
+        return text
+    pypinyin = load_pinyin()
+    # 未安装时中文标题按字符编码排序，排在所有英文标题之后
+    return ''.join(pypinyin.lazy_pinyin(text)) if pypinyin else text
+
+class SortOrder:
+    """一种排序键下全表的排列：order 为排好的游戏 id（没有该字段的排在最后），
+    rank[游戏 id] 为名次；present 为有值的游戏数"""
+
+    def __init__(self, values):
+        count = len(values)
+        present = sorted((game_id for game_id in range(count) if values[game_id] is not None),
+                         key=values.__getitem__)
+        self.present = len(present)
+        self.order = array('I', present)
+        self.order.extend(game_id for game_id in range(count) if values[game_id] is None)
+        self.rank = array('I', bytes(4 * count))
+        for position, game_id in enumerate(self.order):
+            self.rank[game_id] = position
+
+class SortIndex:
+    """按列缓存的排序：排序键与全表排列在第一次按该列排序时计算一次，之后重新排序、
+    过滤后排序都只比较整数名次；名称键直接取 SearchIndex 中已小写的文本"""
+
+    def __init__(self, search_index):
+        self.search_index = search_index
+        self.table = search_index.table
+        self._values = {}
+        self._orders = {}
+        self._seen_updates = {}
+        # 每列一把锁：加载线程预算其它列时，界面线程按当前列排序不必等待
+        self._locks = {key: threading.Lock() for key in SORT_KEYS}
+
+    def _value(self, key, game_id):
+        """排序键；字段为空或无法解析时返回 None"""
+        lower = self.search_index.lower
+        if key == 'name':
+            name = lower['name'][game_id]
+            return (natural_key(collation_text(name)), name) if name else None
+        if key == 'rom':
+            rom = lower['rom'][game_id]
+            return (natural_key(rom), rom) if rom else None
+        info = self.table.info[game_id]
+        text = info[INFO_FIELDS.index(key)] if info else ""
+        if not text:
+            return None
+        try:
+            if key == 'rating':
+                return float(text)
+            if key == 'playcount':
+                return int(text)
+        except ValueError:
+            return None
+        return text  # 日期为 20230101T120000 格式，按字符串比较即可
+
+    def _order(self, key):
+        """取缓存的排列；有新加入或被修改的游戏时只重算这些游戏的键"""
+        with self._locks[key]:
+            count = len(self.search_index.lower['name'])
+            values = self._values.setdefault(key, [])
+            updated_ids = self.search_index.updated_ids
+            seen = self._seen_updates.get(key, 0)
+            order = self._orders.get(key)
+            if order is not None and len(values) == count and seen == len(updated_ids):
+                return order
+
+            updated_count = len(updated_ids)
+            for game_id in updated_ids[seen:updated_count]:
+                if game_id < len(values):
+                    values[game_id] = self._value(key, game_id)
+            values.extend(self._value(key, game_id) for game_id in range(len(values), count))
+            self._seen_updates[key] = updated_count
+            order = self._orders[key] = SortOrder(values)
+            return order
+
+    def prepare(self, key):
+        """在后台线程中预先计算排序键，之后在界面线程排序时不再有停顿"""
+        if key != 'file':
+            self._order(key)
+
+    @tracer.traced('sort')
+    def sort(self, ids, key, descending=False):
+        """按 key 排序 ids（游戏 id 数组）；没有该字段的游戏始终排在最后"""
+        if key == 'file':
+            return array('I', reversed(ids)) if descending else ids
+        order = self._order(key)
+        rank = order.rank
+        if len(ids) * 8 > len(rank):
+            # 视图占全表比例较大时直接按全表排列筛选，O(n) 且不比较
+            keep = bytearray(len(rank))
+            for game_id in ids:
+                keep[game_id] = 1
+            result = array('I', (game_id for game_id in order.order if keep[game_id]))
+        else:
+            result = array('I', sorted(ids, key=rank.__getitem__))
+        if descending:
+            boundary = len(result)
+            while boundary and rank[result[boundary - 1]] >= order.present:
+                boundary -= 1
+            result = result[boundary - 1::-1] + result[boundary:] if boundary else result
+        return result
+
+class GamelistDiff:
+    """重新解析后的 gamelist.xml 与已加载游戏表的差异（按 path 对应）"""
+
+    def __init__(self):
+        self.updated = []
+        self.added = []
+        self.removed = []
+        self.moved = []
+
+    def __bool__(self):
+        return bool(self.updated or self.added or self.removed or self.moved)
+
+@tracer.traced('diff')
+def diff_gamelist(table, xml_path, cancel_event=None):
+    """流式重读 gamelist.xml 并与 table 对比：
+    updated [(游戏 id, 序号, 名称, 描述, 媒体字段, 统计字段)]，added [(序号, rom 路径, 名称, 描述, 媒体字段, 统计字段)]，
+    removed [游戏 id]，moved [(游戏 id, 新序号)]（内容未变、只是位置变了）；
+    已标记删除（尚未保存）的游戏不会被当作新增"""
+    diff = GamelistDiff()
+    by_rom = {rom_path: game_id for game_id, rom_path in enumerate(table.roms)}
+    for ordinal, rom_path, name_text, desc_text, media, info in iter_gamelist_rows(xml_path, cancel_event):
+        media = media if any(media) else ()
+        info = info if any(info) else ()
+        game_id = by_rom.pop(rom_path, None)
+        if game_id is None:
+            diff.added.append((ordinal, rom_path, name_text, desc_text, media, info))
+        elif not table.alive[game_id]:
+            continue
+        elif (table.names[game_id] != name_text or table.descs[game_id] != desc_text
+              or table.media[game_id] != media or table.info[game_id] != info):
+            diff.updated.append((game_id, ordinal, name_text, desc_text, media, info))
+        elif table.ordinals[game_id] != ordinal:
+            diff.moved.append((game_id, ordinal))
+    diff.removed = [game_id for game_id in by_rom.values() if table.alive[game_id]]
+    return diff
+
+class GamelistWriter:
+    """gamelist.xml 的写入端：持有解析后的树，批量应用修改后先写临时文件再原子替换"""
+
+    MAX_BACKUPS = 3
+
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        self.lock = threading.Lock()
+        self._tree = None
+        self._games = None
+        self._mtime_ns = None
+
+    def load(self):
+        """返回最新的树；文件被外部改动过时重新解析（调用方需持有 lock）"""
+        mtime_ns = os.stat(self.xml_path).st_mtime_ns
+        if self._tree is None or mtime_ns != self._mtime_ns:
+            etree = load_etree()
+            parser = etree.XMLParser(remove_blank_text=True, huge_tree=True)
+            self._tree = etree.parse(self.xml_path, parser)
+            self._games = self._tree.getroot().findall('game')
+            self._mtime_ns = mtime_ns
+        return self._tree
+
+    @property
+    def mtime_ns(self):
+        """最近一次由本写入端读取或写入时文件的 mtime，用于区分自己的写入与外部修改"""
+        return self._mtime_ns
+
+    def find_game(self, ordinal, rom_path):
+        """按加载时的序号定位游戏；序号对不上时按 path 查找"""
+        if ordinal < len(self._games):
+            game_elem = self._games[ordinal]
+            if (game_elem.findtext('path') or "") == rom_path:
+                return game_elem
+        for game_elem in self._games:
+            if (game_elem.findtext('path') or "") == rom_path:
+                return game_elem
+        return None
+
+    def apply(self, changes):
+        """changes: [(序号, rom 路径, 字段, 新值)]，返回找不到的 rom 路径列表"""
+        missing = []
+        for ordinal, rom_path, field, value in changes:
+            game_elem = self.find_game(ordinal, rom_path)
+            if game_elem is None:
+                missing.append(rom_path)
+                continue
+            element = game_elem.find(field)
+            if element is None:
+                element = load_etree().SubElement(game_elem, field)
+            element.text = value
+        return missing
+
+    @tracer.traced('backup')
+    def backup(self):
+        backup_dir = os.path.join(os.path.dirname(self.xml_path), "backups")
+        os.makedirs(backup_dir, exist_ok=True)
+        base_name = os.path.basename(self.xml_path)
+
+        backups = sorted(glob.glob(os.path.join(backup_dir, f"{base_name}.bak*")))
+        while len(backups) >= self.MAX_BACKUPS:
+            os.remove(backups.pop(0))
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        shutil.copyfile(self.xml_path, os.path.join(backup_dir, f"{base_name}.bak{timestamp}"))
+
+    def write(self):
+        temp_path = f"{self.xml_path}.tmp"
+        try:
+            self._tree.write(temp_path, encoding='utf-8', xml_declaration=True, pretty_print=True)
+            os.replace(temp_path, self.xml_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._games = self._tree.getroot().findall('game')
+        self._mtime_ns = os.stat(self.xml_path).st_mtime_ns
+
+    def flush(self, changes, backup=True):
+        """backup 为假时不复制整个文件（字段修改由 EditJournal 记录历史）"""
+        with self.lock, tracer.span('save', changes=len(changes)):
+            self.load()
+            missing = self.apply(changes)
+            if backup:
+                self.backup()
+            self.write()
+        return missing
+
+class EditJournal:
+    """按机种的字段修改日志：backups/ 下一个快照加一个只追加的 JSONL，每条批次记录
+    (rom 路径, 字段, 旧值, 新值)；撤销/重做也作为记录追加，快照加日志按顺序重放即得到当前内容"""
+
+    COMPACT_LINES = 2000
+    KEEP_BATCHES = 500
+
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        backup_dir = os.path.join(os.path.dirname(xml_path), "backups")
+        base_name = os.path.basename(xml_path)
+        self.journal_path = os.path.join(backup_dir, f"{base_name}.journal.jsonl")
+        self.snapshot_path = os.path.join(backup_dir, f"{base_name}.snapshot")
+        self.done = []
+        self.undone = []
+        self.lines = 0
+        self._next_id = 1
+        self._pending = []
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """读取日志，重建撤销/重做栈；只读取一次"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.journal_path):
+                return
+            batches = {}
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 写到一半的最后一行
+                    self.lines += 1
+                    self._replay_stacks(record, batches)
+
+    def _replay_stacks(self, record, batches):
+        if 'batch' in record:
+            if record['batch'] in batches:
+                return  # 压缩或重建快照时已写入的批次
+            batch = (record['batch'], [tuple(change) for change in record['changes']])
+            batches[batch[0]] = batch
+            self.done.append(batch)
+            self.undone.clear()
+            self._next_id = max(self._next_id, batch[0] + 1)
+        elif 'undo' in record and self.done and self.done[-1][0] == record['undo']:
+            self.undone.append(self.done.pop())
+        elif 'redo' in record and self.undone and self.undone[-1][0] == record['redo']:
+            self.done.append(self.undone.pop())
+
+    def record(self, changes):
+        """记录一次操作：changes 为 [(rom 路径, 字段, 旧值, 新值)]"""
+        with self._lock:
+            batch = (self._next_id, list(changes))
+            self._next_id += 1
+            self.done.append(batch)
+            self.undone.clear()
+            self._pending.append({'batch': batch[0], 'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+                                  'changes': batch[1]})
+
+    def undo(self):
+        """返回要恢复的 [(rom 路径, 字段, 值)]；没有可撤销的操作时返回 None"""
+        with self._lock:
+            if not self.done:
+                return None
+            batch = self.done.pop()
+            self.undone.append(batch)
+            self._pending.append({'undo': batch[0]})
+        return [(rom_path, field, old) for rom_path, field, old, _ in reversed(batch[1])]
+
+    def redo(self):
+        with self._lock:
+            if not self.undone:
+                return None
+            batch = self.undone.pop()
+            self.done.append(batch)
+            self._pending.append({'redo': batch[0]})
+        return [(rom_path, field, new) for rom_path, field, _, new in batch[1]]
+
+    def take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def restore_pending(self, pending):
+        with self._lock:
+            self._pending[:0] = pending
+
+    def ensure_snapshot(self):
+        """第一次写入日志前保存一份快照（调用方需持有 GamelistWriter.lock）"""
+        if not os.path.exists(self.snapshot_path):
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            shutil.copyfile(self.xml_path, f"{self.snapshot_path}.tmp")
+            os.replace(f"{self.snapshot_path}.tmp", self.snapshot_path)
+
+    @tracer.traced('journal.append')
+    def append(self, pending):
+        if not pending:
+            return
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for record in pending:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.lines += len(pending)
+
+    def commit(self, writer, rows, pending=None):
+        """保存一批字段修改：第一次写入前建快照，写回 rows（[(序号, rom 路径, 字段, 新值)]）时不再复制
+        整个文件，然后追加待写的日志记录（pending 为 None 时取出当前的待写记录）。
+        失败时待写记录放回并重新抛出异常；返回 gamelist.xml 中找不到的 rom 路径"""
+        if pending is None:
+            pending = self.take_pending()
+        try:
+            missing = []
+            if rows:
+                with writer.lock:
+                    self.ensure_snapshot()
+                missing = writer.flush(rows, backup=False)
+            self.append(pending)
+        except Exception:
+            self.restore_pending(pending)
+            raise
+        return missing
+
+    def compact_if_needed(self, writer):
+        """日志超过 COMPACT_LINES 行时压缩，返回是否压缩过"""
+        if self.lines <= self.COMPACT_LINES:
+            return False
+        with writer.lock:
+            self.compact()
+        return True
+
+    def compact(self):
+        """日志过长时以当前文件为新快照，日志只保留最近的撤销/重做栈（调用方需持有 GamelistWriter.lock）"""
+        with self._lock:
+            done = self.done[-self.KEEP_BATCHES:]
+            undone = self.undone[-self.KEEP_BATCHES:]
+            dropped = (len(self.done) - len(done), len(self.undone) - len(undone))
+        records = [{'batch': batch_id, 'changes': changes} for batch_id, changes in done + list(reversed(undone))]
+        records.extend({'undo': batch_id} for batch_id, _ in undone)
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        shutil.copyfile(self.xml_path, f"{self.snapshot_path}.tmp")
+        os.replace(f"{self.snapshot_path}.tmp", self.snapshot_path)
+        os.replace(temp_path, self.journal_path)
+        with self._lock:
+            del self.done[:dropped[0]]
+            del self.undone[:dropped[1]]
+            self.lines = len(records)
+
+    def rebase(self):
+        """gamelist.xml 被日志以外的写入改过（批量删除、外部刮削工具改写）时，以当前文件为新快照，
+        撤销/重做栈保留；还没有快照时无需处理（调用方需持有 GamelistWriter.lock）"""
+        if not os.path.exists(self.snapshot_path):
+            return
+        self.load()
+        self.compact()
+
+    def replay(self, target_path):
+        """把快照加上日志中的全部修改重放为一个新的 gamelist.xml（先写临时文件再原子替换），
+        gamelist.xml 损坏或被误改时用于恢复"""
+        etree = load_etree()
+        tree = etree.parse(self.snapshot_path, etree.XMLParser(remove_blank_text=True, huge_tree=True))
+        games = {}
+        for game in tree.getroot().findall('game'):
+            games.setdefault(game.findtext('path') or "", game)
+
+        def apply(rom_path, field, value):
+            game = games.get(rom_path)
+            if game is None:
+                return
+            element = game.find(field)
+            if element is None:
+                element = etree.SubElement(game, field)
+            element.text = value
+
+        batches = {}
+        applied = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    # 重复的批次和与当前状态不符的撤销/重做（重建快照时已经计入）跳过
+                    if 'batch' in record:
+                        if record['batch'] in batches:
+                            continue
+                        batch_id = record['batch']
+                        batches[batch_id] = record['changes']
+                        changes = [(rom_path, field, new) for rom_path, field, _, new in record['changes']]
+                        applied[batch_id] = True
+                    elif 'undo' in record:
+                        batch_id = record['undo']
+                        if not applied.get(batch_id):
+                            continue
+                        changes = [(rom_path, field, old) for rom_path, field, old, _ in reversed(batches[batch_id])]
+                        applied[batch_id] = False
+                    else:
+                        batch_id = record['redo']
+                        if applied.get(batch_id) is not False:
+                            continue
+                        changes = [(rom_path, field, new) for rom_path, field, _, new in batches[batch_id]]
+                        applied[batch_id] = True
+                    for change in changes:
+                        apply(*change)
+        temp_path = f"{target_path}.tmp"
+        try:
+            tree.write(temp_path, encoding='utf-8', xml_declaration=True, pretty_print=True)
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+class DeletionPlan:
+    """批量删除的预览结果：要移除的 <game> 与要删除的文件/文件夹"""
+
+    def __init__(self, rom_paths):
+        self.rom_paths = list(rom_paths)
+        self.files = []
+        self.total_bytes = 0
+
+    def add(self, path, is_dir, size):
+        self.files.append((path, is_dir))
+        self.total_bytes += size
+
+class BulkDeleter:
+    """批量删除引擎：一次扫描机种目录建立 名称→文件 索引，一次遍历移除 XML 元素，
+    一次原子写入，文件删除在线程池上并行执行"""
+
+    MAX_DEPTH = 2
+    RETRIES = 3
+    SKIP_DIRS = {'backups', INDEX_DIR_NAME}
+
+    def __init__(self, system_dir, writer, max_workers=8):
+        self.system_dir = system_dir
+        self.writer = writer
+        self.max_workers = max_workers
+        self.journal_error = None
+
+    def _index_entries(self):
+        """名称→[(entry, 是否文件夹)]：机种目录第一层的文件与 ROM 文件夹，以及各层子目录中的文件。
+        媒体目录本身、备份和索引目录不作为候选，名为 videos.zip 的 ROM 不会删掉整个 videos/"""
+        index = {}
+        pending = [(self.system_dir, 0)]
+        while pending:
+            directory, depth = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name == 'gamelist.xml' and depth == 0:
+                    continue
+                is_dir = entry.is_dir()
+                if is_dir:
+                    if depth == 0 and entry.name in self.SKIP_DIRS:
+                        continue
+                    if depth < self.MAX_DEPTH:
+                        pending.append((entry.path, depth + 1))
+                    # 多文件 ROM 文件夹只会在机种目录第一层，媒体目录及子目录中的文件夹不是候选
+                    if depth > 0 or entry.name in MEDIA_FOLDERS:
+                        continue
+                index.setdefault(clean_filename(entry.name), []).append((entry, is_dir))
+        return index
+
+    @staticmethod
+    def _path_size(path, is_dir):
+        try:
+            if not is_dir:
+                return os.path.getsize(path)
+            total = 0
+            for root, _, files in os.walk(path):
+                for name in files:
+                    total += os.path.getsize(os.path.join(root, name))
+            return total
+        except OSError:
+            return 0
+
+    @tracer.traced('delete.plan')
+    def plan(self, rom_paths, keep_rom_paths=(), media_only=False):
+        """只扫描不删除：返回 DeletionPlan，keep_rom_paths 中的 ROM（仍保留的游戏）不会被波及。
+        media_only 用于 ROM 已不存在的游戏：只删除媒体目录中的文件，机种目录下的文件和文件夹一律不动"""
+        plan = DeletionPlan(rom_paths)
+        keep = {os.path.normpath(os.path.join(self.system_dir, path)) for path in keep_rom_paths}
+        keep_keys = {clean_filename(os.path.basename(path)) for path in keep_rom_paths}
+        root = os.path.normpath(self.system_dir)
+        media_dirs = tuple(os.path.join(self.system_dir, folder) + os.sep for folder in MEDIA_FOLDERS)
+        index = self._index_entries()
+        seen = set()
+        removed_dirs = []
+
+        def add(path, is_dir):
+            # 已整体删除的文件夹里的内容无需再单独删除
+            if path in seen or path in keep or any(path.startswith(d + os.sep) for d in removed_dirs):
+                return
+            seen.add(path)
+            if is_dir:
+                removed_dirs.append(path)
+            plan.add(path, is_dir, self._path_size(path, is_dir))
+
+        for rom_path in plan.rom_paths:
+            key = clean_filename(os.path.basename(rom_path))
+            entries = index.get(key, ())
+            if media_only:
+                # 机种目录中还有同名的 ROM（如 gamelist 里没有的 Sonic.7z）时，同名媒体归它所有
+                if any(os.path.dirname(entry.path) == root for entry, _ in entries):
+                    continue
+                entries = [(entry, is_dir) for entry, is_dir in entries if entry.path.startswith(media_dirs)]
+            # 与保留的游戏同名时（Sonic.zip 与 Sonic.7z），同名媒体仍属于保留的游戏，只删 ROM 本身
+            if key not in keep_keys:
+                # 浅层的文件夹先处理，其中的文件就不会重复列出
+                for entry, is_dir in sorted(entries, key=lambda item: item[0].path.count(os.sep)):
+                    add(os.path.normpath(entry.path), is_dir)
+            full_rom_path = os.path.normpath(os.path.join(self.system_dir, rom_path))
+            if not media_only and os.path.exists(full_rom_path):
+                add(full_rom_path, os.path.isdir(full_rom_path))
+        return plan
+
+    def _remove(self, path, is_dir):
+        for retry in range(self.RETRIES):
+            try:
+                if is_dir:
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+                return None
+            except OSError as e:
+                # Windows 下文件可能仍被播放器短暂占用
+                if retry == self.RETRIES - 1:
+                    return f"{path} - {str(e)}"
+                time.sleep(0.2)
+
+    @tracer.traced('delete')
+    def execute(self, plan, progress=None, journal=None):
+        """执行删除计划，返回 (已删除文件数, 删除失败的文件错误列表)；progress(已完成, 总数)。
+        journal 为该机种已加载的 EditJournal，不传时从磁盘读取；其快照更新失败时记在 journal_error"""
+        errors = []
+        self.journal_error = None
+        removed_paths = set(plan.rom_paths)
+        if removed_paths:
+            with self.writer.lock:
+                tree = self.writer.load()
+                root = tree.getroot()
+                for game in root.findall('game'):
+                    if (game.findtext('path') or "") in removed_paths:
+                        root.remove(game)
+                self.writer.backup()
+                self.writer.write()
+                # 移除游戏不经过修改日志，快照要跟上，否则重放会把删掉的游戏加回来
+                try:
+                    (journal or EditJournal(self.writer.xml_path)).rebase()
+                except OSError as e:
+                    self.journal_error = f"修改日志快照更新失败 - {str(e)}"
+
+        done = 0
+        total = len(plan.files)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._remove, path, is_dir) for path, is_dir in plan.files]
+            for future in as_completed(futures):
+                error = future.result()
+                if error:
+                    errors.append(error)
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        return total - len(errors), errors
+
+class SystemAudit:
+    """单个机种的审计结果：ROM 已不存在的游戏，以及没有对应游戏的媒体文件"""
+
+    def __init__(self, system, xml_path):
+        self.system = system
+        self.xml_path = xml_path
+        self.games = 0
+        self.missing_roms = []
+        self.present_roms = []
+        self.orphaned_media = []
+        self.orphaned_bytes = 0
+        self.error = None
+
+    def __bool__(self):
+        return bool(self.missing_roms or self.orphaned_media)
+
+class LibraryAuditor:
+    """孤立媒体 / 缺失 ROM 审计：gamelist.xml 的路径与实际目录列表按规范化文件名做哈希连接，
+    各机种在线程池上并行"""
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _listing(directory):
+        try:
+            with os.scandir(directory) as it:
+                return list(it)
+        except OSError:
+            return []
+
+    def audit_system(self, system, xml_path, cancel_event=None):
+        audit = SystemAudit(system, xml_path)
+        system_dir = os.path.dirname(xml_path)
+        # RetroBat 运行在 Windows 上，gamelist.xml 中的大小写与实际文件名不一定一致
+        rom_names = {entry.name.casefold() for entry in self._listing(system_dir)}
+
+        keys = set()
+        loose_keys = set()
+        referenced = set()
+        for _, rom_path, _, _, media, _ in iter_gamelist_rows(xml_path, cancel_event):
+            audit.games += 1
+            if not rom_path:
+                continue
+            key, loose = rom_keys(rom_path)
+            keys.add(key)
+            if loose:
+                loose_keys.add(loose)
+            for value in media:
+                if value:
+                    referenced.add(os.path.normpath(os.path.join(system_dir, value)))
+            # 机种目录第一层的 ROM 直接查列表，其余情况才 stat
+            parent, base_name = os.path.split(os.path.normpath(rom_path))
+            if parent in ('', '.') and not os.path.isabs(rom_path):
+                exists = base_name.casefold() in rom_names
+            else:
+                exists = os.path.exists(os.path.join(system_dir, rom_path))
+            if not exists:
+                audit.missing_roms.append(rom_path)
+            else:
+                audit.present_roms.append(rom_path)
+
+        candidates = []
+        for folder in MEDIA_FOLDERS:
+            for entry in self._listing(os.path.join(system_dir, folder)):
+                if cancel_event is not None and cancel_event.is_set():
+                    return audit
+                try:
+                    if not entry.is_file():
+                        continue
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
+                path = os.path.normpath(entry.path)
+                # 与预览时的匹配规则一致：宽松键或模糊匹配能对上的媒体也不算孤立
+                if (clean_filename(entry.name) not in keys and loose_key(entry.name) not in loose_keys
+                        and path not in referenced):
+                    candidates.append((entry.name, path, size))
+
+        fuzzy = FuzzyKeyIndex(loose_keys) if candidates else None
+        for name, path, size in candidates:
+            if not fuzzy.candidates(loose_key(name)):
+                audit.orphaned_media.append((path, size))
+                audit.orphaned_bytes += size
+        return audit
+
+    def run(self, category_dirs, on_system=None, cancel_event=None):
+        """并行审计所有机种，每完成一个回调 on_system(SystemAudit)；返回按机种名排序的结果"""
+        audits = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.audit_system, name, xml_path, cancel_event): (name, xml_path)
+                       for name, xml_path in category_dirs.items()}
+            for future in as_completed(futures):
+                try:
+                    audit = future.result()
+                except Exception as e:
+                    audit = SystemAudit(*futures[future])
+                    audit.error = str(e)
+                audits.append(audit)
+                if on_system is not None:
+                    on_system(audit)
+        return sorted(audits, key=lambda audit: audit.system)
+
+    @staticmethod
+    def plan_cleanup(audit, deleter):
+        """把审计结果转成删除计划：移除缺失 ROM 的 <game> 及其媒体目录中的文件，再加上孤立媒体；
+        机种目录下的 ROM 文件和文件夹不会被删除"""
+        if audit.missing_roms:
+            # ROM 仍在的游戏不能被同名媒体的删除波及
+            plan = deleter.plan(audit.missing_roms, audit.present_roms, media_only=True)
+        else:
+            plan = DeletionPlan([])
+        planned = {path for path, _ in plan.files}
+        for path, size in audit.orphaned_media:
+            if path not in planned:
+                plan.add(path, False, size)
+        return plan
+
+class HashCache:
+    """ROM 内容哈希缓存：按 (路径, 大小, mtime) 失效，重复查找时无需重新读取文件"""
+
+    FILE_NAME = 'hash_cache.sqlite3'
+
+    def __init__(self, root):
+        self.path = os.path.join(root, INDEX_DIR_NAME, self.FILE_NAME)
+        self.entries = {}
+        self.hits = 0
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                     "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, partial TEXT, full TEXT)")
+        return conn
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        conn = self._connect()
+        try:
+            for path, size, mtime_ns, partial, full in conn.execute(
+                    "SELECT path, size, mtime_ns, partial, full FROM hashes"):
+                self.entries[path] = (size, mtime_ns, partial, full)
+        finally:
+            conn.close()
+
+    def lookup(self, path, size, mtime_ns, kind):
+        """kind 为 'partial' 或 'full'；文件变化过或尚未计算时返回 None"""
+        with self._lock:
+            cached = self.entries.get(path)
+            if cached is None or cached[0] != size or cached[1] != mtime_ns:
+                return None
+            value = cached[2] if kind == 'partial' else cached[3]
+            if value is not None:
+                self.hits += 1
+            return value
+
+    def store(self, path, size, mtime_ns, kind, value):
+        with self._lock:
+            cached = self.entries.get(path)
+            if cached is None or cached[0] != size or cached[1] != mtime_ns:
+                cached = (size, mtime_ns, None, None)
+            if kind == 'partial':
+                cached = (size, mtime_ns, value, cached[3])
+            else:
+                cached = (size, mtime_ns, cached[2], value)
+            self.entries[path] = cached
+            self._dirty.add(path)
+
+    def save(self):
+        with self._lock:
+            dirty = {path: self.entries[path] for path in self._dirty}
+            self._dirty.clear()
+        if not dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, partial, full) VALUES (?, ?, ?, ?, ?)",
+                    [(path, *entry) for path, entry in dirty.items()]
+                )
+        finally:
+            conn.close()
+
+class DuplicateFinder:
+    """内容重复的 ROM 查找：先按文件大小分组，只对大小相同的候选计算首尾部分哈希，
+    部分哈希仍相同的再用内存映射计算完整哈希"""
+
+    PARTIAL_BYTES = 64 * 1024
+    CHUNK_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, hash_cache=None, max_workers=4):
+        self.hash_cache = hash_cache
+        self.max_workers = max_workers
+        self.hashed_bytes = 0
+        self._count_lock = threading.Lock()
+
+    def _count(self, n):
+        with self._count_lock:
+            self.hashed_bytes += n
+
+    def _hash(self, path, size, mtime_ns, kind):
+        if self.hash_cache is not None:
+            cached = self.hash_cache.lookup(path, size, mtime_ns, kind)
+            if cached is not None:
+                return cached
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            if size == 0:
+                pass
+            elif kind == 'partial':
+                digest.update(f.read(self.PARTIAL_BYTES))
+                if size > self.PARTIAL_BYTES:
+                    f.seek(max(self.PARTIAL_BYTES, size - self.PARTIAL_BYTES))
+                    digest.update(f.read(self.PARTIAL_BYTES))
+                self._count(min(size, 2 * self.PARTIAL_BYTES))
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, size, self.CHUNK_BYTES):
+                            digest.update(view[offset:offset + self.CHUNK_BYTES])
+                    finally:
+                        view.release()
+                self._count(size)
+        value = digest.hexdigest()
+        if self.hash_cache is not None:
+            self.hash_cache.store(path, size, mtime_ns, kind, value)
+        return value
+
+    @staticmethod
+    def collect(category_dirs, cancel_event=None):
+        """gamelist.xml 引用的 ROM 文件：[(机种, rom 路径, 绝对路径, 大小, mtime)]，同一文件只出现一次"""
+        files = []
+        seen = set()
+        for category_name, xml_path in sorted(category_dirs.items()):
+            system_dir = os.path.dirname(xml_path)
+            for _, rom_path, _, _, _, _ in iter_gamelist_rows(xml_path, cancel_event):
+                if not rom_path:
+                    continue
+                full_path = os.path.normpath(os.path.join(system_dir, rom_path))
+                if full_path in seen:
+                    continue
+                seen.add(full_path)
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                if os.path.isdir(full_path):
+                    continue
+                files.append((category_name, rom_path, full_path, stat.st_size, stat.st_mtime_ns))
+        return files
+
+    def _refine(self, groups, kind, pool, cancel_event):
+        """在每个候选组内按哈希再分组，丢弃只剩一个文件的组"""
+        futures = {}
+        for group in groups:
+            for entry in group:
+                futures[pool.submit(self._hash, entry[2], entry[3], entry[4], kind)] = entry
+        buckets = {}
+        for future in as_completed(futures):
+            if cancel_event is not None and cancel_event.is_set():
+                return []
+            entry = futures[future]
+            try:
+                buckets.setdefault((entry[3], future.result()), []).append(entry)
+            except OSError:
+                continue
+        return [group for group in buckets.values() if len(group) > 1]
+
+    def find(self, category_dirs, progress=None, cancel_event=None):
+        """返回重复组列表，每组为 [(机种, rom 路径, 绝对路径, 大小, mtime)]，组内按机种和路径排序"""
+        self.hashed_bytes = 0
+        files = self.collect(category_dirs, cancel_event)
+        by_size = {}
+        for entry in files:
+            # 空文件（下载失败或占位文件）内容都相同，不算重复
+            if entry[3] == 0:
+                continue
+            by_size.setdefault(entry[3], []).append(entry)
+        groups = [group for group in by_size.values() if len(group) > 1]
+        if progress is not None:
+            progress(f"共{len(files)}个ROM，{sum(len(group) for group in groups)}个大小相同的候选")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            groups = self._refine(groups, 'partial', pool, cancel_event)
+            # 部分哈希已覆盖整个文件的小文件无需再算完整哈希
+            small = [group for group in groups if group[0][3] <= 2 * self.PARTIAL_BYTES]
+            large = [group for group in groups if group[0][3] > 2 * self.PARTIAL_BYTES]
+            if progress is not None and large:
+                progress(f"部分哈希相同：{sum(len(group) for group in large)}个文件需要计算完整哈希")
+            groups = small + self._refine(large, 'full', pool, cancel_event)
+
+        if self.hash_cache is not None:
+            self.hash_cache.save()
+        return sorted((sorted(group, key=lambda entry: (entry[0], entry[1])) for group in groups),
+                      key=lambda group: (group[0][0], group[0][1]))
+
+class ImportSummary:
+    def __init__(self):
+        self.rows = 0
+        self.matched = 0
+        self.loose_matched = 0
+        self.unmatched = 0
+        self.changed_games = 0
+        self.changed_fields = 0
+        self.unmatched_samples = []
+
+class MetadataImporter:
+    """流式导入 CSV/XLSX 元数据：逐行读取，按规范化 ROM 名在哈希表中 O(1) 查找游戏"""
+
+    HEADER_ALIASES = {
+        'rom': {'rom', 'path', 'rom_name', 'romname', 'file', 'filename', 'rom名', '文件名'},
+        'name': {'name', 'title', 'game', '名称', '游戏名称', '游戏名'},
+        'desc': {'desc', 'description', '描述', '简介', '游戏描述'},
+    }
+    UNMATCHED_SAMPLES = 20
+
+    def __init__(self, table):
+        self.table = table
+        self.key_index = {}
+        self.loose_index = {}
+        for game_id in table.ids():
+            self.key_index.setdefault(table.keys[game_id], []).append(game_id)
+            self.loose_index.setdefault(table.loose_keys[game_id], []).append(game_id)
+
+    def match(self, rom_cell):
+        """返回 (游戏 id 列表, 是否为宽松匹配)；宽松键只在对应唯一游戏时才采用，避免把元数据写到别的版本上"""
+        name = os.path.basename(rom_cell)
+        game_ids = self.key_index.get(clean_filename(name))
+        if game_ids:
+            return game_ids, False
+        game_ids = self.loose_index.get(loose_key(name))
+        if game_ids and len(game_ids) == 1:
+            return game_ids, True
+        return None, False
+
+    @staticmethod
+    def iter_rows(file_path):
+        if file_path.lower().endswith('.xlsx'):
+            openpyxl = load_openpyxl()
+            if openpyxl is None:
+                raise RuntimeError("导入 .xlsx 文件需要安装 openpyxl")
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                for row in workbook.active.iter_rows(values_only=True):
+                    yield ["" if cell is None else str(cell) for cell in row]
+            finally:
+                workbook.close()
+        else:
+            with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+                yield from csv.reader(f)
+
+    @classmethod
+    def _columns(cls, header):
+        """识别表头；认不出时按 rom,名称,描述 的顺序取前三列"""
+        columns = {}
+        for position, cell in enumerate(header):
+            label = cell.strip().lower()
+            for field, aliases in cls.HEADER_ALIASES.items():
+                if label in aliases and field not in columns:
+                    columns[field] = position
+        if 'rom' not in columns:
+            columns = {'rom': 0, 'name': 1, 'desc': 2}
+        return columns
+
+    @tracer.traced('import')
+    def run(self, file_path):
+        """返回 (修改列表 [(游戏 id, 字段, 新值)], ImportSummary)；空单元格不会覆盖原值"""
+        summary = ImportSummary()
+        changes = []
+        changed_games = set()
+        table = self.table
+        current = {'name': table.names, 'desc': table.descs}
+
+        rows = self.iter_rows(file_path)
+        header = next(rows, None)
+        if header is None:
+            return changes, summary
+        columns = self._columns(header)
+        rom_column = columns['rom']
+
+        for row in rows:
+            if rom_column >= len(row) or not row[rom_column].strip():
+                continue
+            summary.rows += 1
+            rom_cell = row[rom_column].strip()
+            game_ids, loose = self.match(rom_cell)
+            if not game_ids:
+                summary.unmatched += 1
+                if len(summary.unmatched_samples) < self.UNMATCHED_SAMPLES:
+                    summary.unmatched_samples.append(rom_cell)
+                continue
+            summary.matched += 1
+            summary.loose_matched += loose
+
+            for field in ('name', 'desc'):
+                position = columns.get(field)
+                if position is None or position >= len(row):
+                    continue
+                value = row[position].strip()
+                if not value:
+                    continue
+                for game_id in game_ids:
+                    if current[field][game_id] != value:
+                        changes.append((game_id, field, value))
+                        changed_games.add(game_id)
+
+        summary.changed_games = len(changed_games)
+        summary.changed_fields = len(changes)
+        return changes, summary
+
+EXPORT_FIELDS = {
+    'system': '机种',
+    'rom': 'ROM',
+    'name': '名称',
+    'desc': '描述',
+    'video': '有视频',
+    'size': '文件大小',
+}
+
+class GameListExporter:
+    """流式导出游戏列表到 CSV / JSONL / XLSX：逐行写出，内存占用与游戏数量无关"""
+
+    FORMATS = {'csv': 'CSV', 'jsonl': 'JSON Lines', 'xlsx': 'Excel'}
+
+    def __init__(self, file_path, fmt, fields):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"不支持的导出格式：{fmt}")
+        if fmt == 'xlsx' and load_openpyxl() is None:
+            raise RuntimeError("导出 .xlsx 文件需要安装 openpyxl")
+        self.file_path = file_path
+        self.fmt = fmt
+        self.fields = [field for field in EXPORT_FIELDS if field in fields]
+
+    @staticmethod
+    def table_rows(table, ids):
+        """已加载（或过滤后）的列表：(rom, 名称, 描述)"""
+        for game_id in ids:
+            yield table.roms[game_id], table.names[game_id], table.descs[game_id]
+
+    @staticmethod
+    def gamelist_rows(xml_path, cancel_event=None):
+        """直接流式读取 gamelist.xml，不建立游戏表"""
+        for _, rom_path, name_text, desc_text, _, _ in iter_gamelist_rows(xml_path, cancel_event):
+            yield rom_path, name_text, desc_text
+
+    def _records(self, sources, cancel_event):
+        """sources: [(机种, 机种目录, 视频查询函数, 行迭代器)]"""
+        want_video = 'video' in self.fields
+        want_size = 'size' in self.fields
+        for system, system_dir, has_video, rows in sources:
+            for rom_path, name_text, desc_text in rows:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                record = {'system': system, 'rom': rom_path, 'name': name_text, 'desc': desc_text}
+                if want_video:
+                    record['video'] = bool(rom_path) and has_video(os.path.basename(rom_path))
+                if want_size:
+                    # 没有 rom 路径时 join 得到的是机种目录本身，不能取它的大小
+                    try:
+                        record['size'] = os.path.getsize(os.path.join(system_dir, rom_path)) if rom_path else None
+                    except OSError:
+                        record['size'] = None
+                yield record
+
+    def export(self, sources, progress=None, cancel_event=None):
+        """写入临时文件后替换目标文件，返回导出的行数"""
+        temp_path = f"{self.file_path}.tmp"
+        count = 0
+        try:
+            if self.fmt == 'xlsx':
+                workbook = load_openpyxl().Workbook(write_only=True)
+                sheet = workbook.create_sheet("games")
+                sheet.append([EXPORT_FIELDS[field] for field in self.fields])
+                for record in self._records(sources, cancel_event):
+                    sheet.append([record[field] for field in self.fields])
+                    count += 1
+                    if progress is not None and count % 5000 == 0:
+                        progress(count)
+                workbook.save(temp_path)
+            else:
+                with open(temp_path, 'w', encoding='utf-8-sig' if self.fmt == 'csv' else 'utf-8',
+                          newline='') as f:
+                    if self.fmt == 'csv':
+                        writer = csv.writer(f)
+                        writer.writerow([EXPORT_FIELDS[field] for field in self.fields])
+                    for record in self._records(sources, cancel_event):
+                        if self.fmt == 'csv':
+                            writer.writerow(["" if record[field] is None else record[field]
+                                             for field in self.fields])
+                        else:
+                            f.write(json.dumps({field: record[field] for field in self.fields},
+                                               ensure_ascii=False) + '\n')
+                        count += 1
+                        if progress is not None and count % 5000 == 0:
+                            progress(count)
+            if cancel_event is not None and cancel_event.is_set():
+                return count
+            os.replace(temp_path, self.file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return count
+
+def video_key_lookup(system_dir, scan_index=None):
+    """单个机种 videos 目录的匹配键集合，返回按 ROM 文件名判断是否有视频的函数；导出时逐个机种建立、用完即弃"""
+    names = cached_listdir(os.path.join(system_dir, 'videos'), scan_index)[1]
+    keys = {clean_filename(name) for name in names}
+    loose_keys = {key for key in map(loose_key, names) if key}
+    fuzzy = FuzzyKeyIndex(loose_keys)
+
+    def has_video(rom_name):
+        if clean_filename(rom_name) in keys:
+            return True
+        loose = loose_key(rom_name)
+        return bool(loose) and (loose in loose_keys or fuzzy.match(loose) is not None)
+    return has_video
+
+class EditSession:
+    """尚未写回磁盘的字段修改，按 (游戏 id, 字段) 合并，同一字段只保留最后一次的值"""
+
+    def __init__(self, table, xml_path):
+        self.table = table
+        self.xml_path = xml_path
+        self._changes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._changes)
+
+    def __contains__(self, key):
+        """key 为 (游戏 id, 字段)"""
+        return key in self._changes
+
+    def set(self, game_id, field, value):
+        with self._lock:
+            self._changes[(game_id, field)] = value
+
+    def take(self):
+        """取出全部修改并清空，返回 GamelistWriter.apply 需要的列表"""
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        return changes
+
+    def restore(self, changes):
+        """写入失败时放回，不覆盖之后又产生的修改"""
+        with self._lock:
+            for key, value in changes.items():
+                self._changes.setdefault(key, value)
+
+    def as_rows(self, changes):
+        table = self.table
+        return [(table.ordinals[game_id], table.roms[game_id], field, value)
+                for (game_id, field), value in changes.items()]
+
+class GlobalSearchIndex:
+    """跨机种搜索：每个机种一份 GameTable + SearchIndex，按 gamelist.xml 的 mtime 逐个刷新"""
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.systems = {}
+        self._lock = threading.Lock()
+
+    def _build_system(self, category_name, xml_path, mtime_ns, cancel_event):
+        table = GameTable()
+        search_index = SearchIndex(table)
+        fill_game_table(xml_path, table, search_index, cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        with self._lock:
+            self.systems[category_name] = (xml_path, mtime_ns, table, search_index)
+
+    def refresh(self, category_dirs, cancel_event=None, on_error=None):
+        """只重建 gamelist.xml 有变化的机种，返回重建的机种数"""
+        with self._lock:
+            for category_name in [name for name in self.systems if name not in category_dirs]:
+                del self.systems[category_name]
+
+        pending = []
+        for category_name, xml_path in list(category_dirs.items()):
+            try:
+                mtime_ns = os.stat(xml_path).st_mtime_ns
+            except OSError:
+                continue
+            cached = self.systems.get(category_name)
+            if cached is None or cached[0] != xml_path or cached[1] != mtime_ns:
+                pending.append((category_name, xml_path, mtime_ns))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._build_system, name, path, mtime_ns, cancel_event): name
+                       for name, path, mtime_ns in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(futures[future], e)
+        return len(pending)
+
+    def game_count(self):
+        return sum(len(entry[2]) for entry in list(self.systems.values()))
+
+    def search(self, query, limit=500):
+        """返回 [(机种, 游戏 id, 名称, rom 路径)]，最多 limit 条"""
+        results = []
+        if not parse_query(query):
+            return results
+        for category_name, (_, _, table, search_index) in sorted(list(self.systems.items())):
+            for game_id in search_index.search(query):
+                results.append((category_name, game_id, table.names[game_id], table.roms[game_id]))
+                if len(results) >= limit:
+                    return results
+        return results
+
+class LibraryScanner:
+    """按深度剪枝的机种扫描器：只探测根目录下 1~2 层，不再遍历 ROM/媒体子目录"""
+
+    def __init__(self, max_workers=8, index=None):
+        self.max_workers = max_workers
+        self.index = index
+        self.entries_visited = 0
+        self._count_lock = threading.Lock()
+
+    def _count(self, n):
+        with self._count_lock:
+            self.entries_visited += n
+
+    def _listdir(self, path):
+        subdirs, files, visited = cached_listdir(path, self.index)
+        self._count(visited)
+        return subdirs, files
+
+    def _has_gamelist(self, path):
+        """第 2 层只做 stat，不列出 ROM 目录本身"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        self._count(1)
+        if self.index is not None:
+            cached = self.index.lookup(path, mtime_ns)
+            if cached is not None:
+                return 'gamelist.xml' in cached[1]
+
+        found = os.path.isfile(os.path.join(path, 'gamelist.xml'))
+        if self.index is not None:
+            self.index.store(path, mtime_ns, [], ['gamelist.xml'] if found else [])
+        return found
+
+    def _probe_level1(self, level1_dir):
+        """列出第 1 层目录，返回其中的机种目录（自身或第 2 层子目录）"""
+        systems = []
+        subdirs, files = self._listdir(level1_dir)
+        if 'gamelist.xml' in files:
+            systems.append(level1_dir)
+        for name in subdirs:
+            child = os.path.join(level1_dir, name)
+            if self._has_gamelist(child):
+                systems.append(child)
+        return systems
+
+    @tracer.traced('scan')
+    def scan(self, folder_path, on_system=None):
+        """扫描 RetroBat 根目录，每找到一个机种就回调 on_system(name, xml_path)"""
+        self.entries_visited = 0
+        results = {}
+        level1_dirs = [os.path.join(folder_path, name)
+                       for name in self._listdir(folder_path)[0] if name != INDEX_DIR_NAME]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            level1_futures = [pool.submit(self._probe_level1, d) for d in level1_dirs]
+            for future in as_completed(level1_futures):
+                for system_dir in future.result():
+                    category_name = os.path.basename(system_dir)
+                    xml_path = os.path.join(system_dir, 'gamelist.xml')
+                    results[category_name] = xml_path
+                    if on_system is not None:
+                        on_system(category_name, xml_path)
+        tracer.count('scan.entries', self.entries_visited)
+        return results
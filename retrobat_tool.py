@@ -0,0 +1,350 @@
+"""RetroBat 工具的命令行模式：不加载 PyQt，可在服务器上脚本化执行
+
+用法:
+  python retrobat_tool.py scan <RetroBat 根目录>
+  python retrobat_tool.py search <RetroBat 根目录> <关键词> [--limit N]
+  python retrobat_tool.py export <RetroBat 根目录> <输出文件> [--system 机种] [--fields rom,name] [--format csv]
+  python retrobat_tool.py import <gamelist.xml> <CSV/XLSX 文件> [--dry-run]
+  python retrobat_tool.py prune <gamelist.xml> [rom 路径 ...] [--from-file 列表文件] [--dry-run]
+  python retrobat_tool.py replay <gamelist.xml> [--output 输出文件]
+  python retrobat_tool.py audit <RetroBat 根目录> [--system 机种] [--clean [--dry-run]]
+  python retrobat_tool.py dupes <RetroBat 根目录> [--system 机种]
+
+全局选项 --trace <文件> 记录各步骤耗时并导出为 Chrome trace JSON（放在子命令之前）
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+from retrobat_core import (CURRENT_VERSION, EXPORT_FIELDS, ScanIndex, GameTable, fill_game_table,
+                           iter_gamelist_rows, GamelistWriter, BulkDeleter, MetadataImporter, GameListExporter,
+                           video_key_lookup, EditSession, GlobalSearchIndex, LibraryScanner,
+                           LibraryAuditor, HashCache, DuplicateFinder, EditJournal, tracer)
+
+
+def error(message):
+    print(message, file=sys.stderr)
+
+
+def scan_library(root):
+    """扫描 RetroBat 根目录，返回 ({机种: gamelist.xml}, ScanIndex)"""
+    if not os.path.isdir(root):
+        raise SystemExit(f"目录不存在：{root}")
+    index = ScanIndex(root)
+    try:
+        index.load()
+    except sqlite3.Error as e:
+        error(f"扫描索引损坏，将重新扫描：{str(e)}")
+        index = ScanIndex(root)
+    category_dirs = LibraryScanner(index=index).scan(root)
+    try:
+        index.save()
+    except (OSError, sqlite3.Error) as e:
+        error(f"扫描索引保存失败：{str(e)}")
+    return category_dirs, index
+
+
+def select_systems(category_dirs, systems):
+    """按 --system 参数（逗号分隔）筛选机种；有不存在的机种时返回 None"""
+    if not systems:
+        return category_dirs
+    wanted = set(systems.split(','))
+    missing = wanted - set(category_dirs)
+    if missing:
+        error(f"找不到机种：{', '.join(sorted(missing))}")
+        return None
+    return {name: path for name, path in category_dirs.items() if name in wanted}
+
+
+def cmd_scan(args):
+    category_dirs, index = scan_library(args.root)
+    for category_name, xml_path in sorted(category_dirs.items()):
+        print(f"{category_name}\t{xml_path}")
+    error(f"扫描完成，共找到{len(category_dirs)}个机种（{index.hits}个目录未变化，直接使用索引）")
+    return 0
+
+
+def cmd_search(args):
+    category_dirs, _ = scan_library(args.root)
+    global_index = GlobalSearchIndex()
+    global_index.refresh(category_dirs, on_error=lambda name, e: error(f"解析失败：{name} - {str(e)}"))
+    results = global_index.search(args.query, args.limit)
+    for category_name, _, name_text, rom_path in results:
+        print(f"{category_name}\t{name_text}\t{rom_path}")
+    error(f"共{len(results)}个结果（{len(global_index.systems)}个机种，{global_index.game_count()}个游戏）")
+    return 0
+
+
+def cmd_export(args):
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    fields = [field.strip() for field in args.fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in EXPORT_FIELDS]
+    if unknown:
+        error(f"未知字段：{', '.join(unknown)}（可选：{', '.join(EXPORT_FIELDS)}）")
+        return 1
+
+    category_dirs, index = scan_library(args.root)
+    category_dirs = select_systems(category_dirs, args.system)
+    if category_dirs is None:
+        return 1
+    if len(category_dirs) > 1 and 'system' not in fields:
+        fields.insert(0, 'system')
+
+    try:
+        exporter = GameListExporter(args.output, fmt, fields)
+    except (ValueError, RuntimeError) as e:
+        error(f"导出失败：{str(e)}")
+        return 1
+    sources = (
+        (name, os.path.dirname(xml_path), video_key_lookup(os.path.dirname(xml_path), index),
+         GameListExporter.gamelist_rows(xml_path))
+        for name, xml_path in sorted(category_dirs.items())
+    )
+    count = exporter.export(sources, lambda n: error(f"正在导出：已写入{n}个游戏"))
+    error(f"游戏列表导出成功：{count}个游戏 → {args.output}")
+    return 0
+
+
+def cmd_import(args):
+    table = GameTable()
+    try:
+        fill_game_table(args.xml, table)
+    except (OSError, SyntaxError) as e:
+        error(f"读取失败：{args.xml} - {str(e)}")
+        return 1
+    try:
+        changes, summary = MetadataImporter(table).run(args.file)
+    except (OSError, RuntimeError, ValueError) as e:
+        error(f"导入失败：{str(e)}")
+        return 1
+
+    error(f"共{summary.rows}行，匹配{summary.matched}行"
+          f"（其中{summary.loose_matched}行忽略区域/版本标签后匹配），未匹配{summary.unmatched}行，"
+          f"修改{summary.changed_games}个游戏（{summary.changed_fields}个字段）")
+    for rom_cell in summary.unmatched_samples:
+        print(f"未匹配\t{rom_cell}")
+    if args.dry_run or not changes:
+        return 0
+
+    session = EditSession(table, args.xml)
+    columns = {'name': table.names, 'desc': table.descs}
+    for game_id, field, value in changes:
+        session.set(game_id, field, value)
+    journal = EditJournal(args.xml)
+    writer = GamelistWriter(args.xml)
+    try:
+        journal.load()
+        journal.record([(table.roms[game_id], field, columns[field][game_id], value)
+                        for game_id, field, value in changes])
+        missing = journal.commit(writer, session.as_rows(session.take()))
+    except (OSError, ValueError, SyntaxError) as e:
+        error(f"保存失败：{str(e)}")
+        return 1
+    try:
+        journal.compact_if_needed(writer)
+    except OSError as e:
+        error(f"修改日志压缩失败：{str(e)}")
+    for rom_path in missing:
+        error(f"游戏不存在：{rom_path}")
+    error(f"已保存到 {args.xml}")
+    return 0
+
+
+def cmd_prune(args):
+    rom_paths = list(args.roms)
+    if args.from_file:
+        with open(args.from_file, 'r', encoding='utf-8-sig') as f:
+            rom_paths.extend(line.strip() for line in f if line.strip())
+    if not rom_paths:
+        error("没有指定要删除的游戏")
+        return 1
+
+    # 仍保留的游戏不能被同名的文件/文件夹波及（如删除 Sonic.zip 时保留 Sonic.7z）
+    pruned = {os.path.normpath(path) for path in rom_paths}
+    keep_rom_paths = [rom_path for _, rom_path, *_ in iter_gamelist_rows(args.xml)
+                      if rom_path and os.path.normpath(rom_path) not in pruned]
+    deleter = BulkDeleter(os.path.dirname(os.path.abspath(args.xml)), GamelistWriter(args.xml))
+    plan = deleter.plan(rom_paths, keep_rom_paths)
+    for path, is_dir in plan.files:
+        print(f"{'目录' if is_dir else '文件'}\t{path}")
+    error(f"将删除{len(plan.rom_paths)}个游戏，{len(plan.files)}个文件/文件夹，"
+          f"共{plan.total_bytes / 1024 / 1024:.1f} MB")
+    if args.dry_run:
+        return 0
+
+    removed, errors = deleter.execute(plan)
+    for message in errors:
+        error(f"删除失败：{message}")
+    if deleter.journal_error:
+        error(deleter.journal_error)
+    error(f"删除完成：已删除{removed}个文件/文件夹")
+    return 1 if errors or deleter.journal_error else 0
+
+
+def cmd_replay(args):
+    journal = EditJournal(args.xml)
+    if not os.path.exists(journal.snapshot_path):
+        error(f"没有修改日志快照：{journal.snapshot_path}")
+        return 1
+    output = args.output or args.xml
+    writer = GamelistWriter(args.xml)
+    try:
+        with writer.lock:
+            if output == args.xml and os.path.exists(args.xml):
+                writer.backup()
+            journal.replay(output)
+    except (OSError, ValueError, SyntaxError) as e:
+        error(f"重放失败：{str(e)}")
+        return 1
+    error(f"已由快照和修改日志重建 {output}")
+    return 0
+
+
+def cmd_audit(args):
+    category_dirs, _ = scan_library(args.root)
+    category_dirs = select_systems(category_dirs, args.system)
+    if category_dirs is None:
+        return 1
+
+    audits = LibraryAuditor().run(category_dirs)
+    failed = 0
+    for audit in audits:
+        if audit.error:
+            error(f"审计失败：{audit.system} - {audit.error}")
+            failed += 1
+            continue
+        for rom_path in audit.missing_roms:
+            print(f"{audit.system}\t缺失ROM\t{rom_path}")
+        for path, size in audit.orphaned_media:
+            print(f"{audit.system}\t孤立媒体\t{path}\t{size}")
+    error(f"审计完成：{len(audits)}个机种，缺失ROM {sum(len(a.missing_roms) for a in audits)}个，"
+          f"孤立媒体 {sum(len(a.orphaned_media) for a in audits)}个"
+          f"（{sum(a.orphaned_bytes for a in audits) / 1048576:.1f} MB）")
+    if not args.clean:
+        return 1 if failed else 0
+
+    # 先列出实际的删除计划，--dry-run 时到此为止
+    cleanups = []
+    for audit in audits:
+        if audit.error or not audit:
+            continue
+        deleter = BulkDeleter(os.path.dirname(audit.xml_path), GamelistWriter(audit.xml_path))
+        plan = LibraryAuditor.plan_cleanup(audit, deleter)
+        for rom_path in plan.rom_paths:
+            print(f"{audit.system}	移除游戏	{rom_path}")
+        for path, is_dir in plan.files:
+            print(f"{audit.system}	{'删除目录' if is_dir else '删除文件'}	{path}")
+        cleanups.append((audit, deleter, plan))
+    error(f"将移除{sum(len(plan.rom_paths) for _, _, plan in cleanups)}个游戏，"
+          f"删除{sum(len(plan.files) for _, _, plan in cleanups)}个文件，"
+          f"共{sum(plan.total_bytes for _, _, plan in cleanups) / 1048576:.1f} MB")
+    if args.dry_run:
+        return 1 if failed else 0
+
+    for audit, deleter, plan in cleanups:
+        removed, errors = deleter.execute(plan)
+        for message in errors:
+            error(f"删除失败：{message}")
+        if deleter.journal_error:
+            error(f"{audit.system}：{deleter.journal_error}")
+        failed += bool(errors or deleter.journal_error)
+        error(f"{audit.system}：移除{len(plan.rom_paths)}个游戏，删除{removed}个文件，"
+              f"释放{plan.total_bytes / 1048576:.1f} MB")
+    return 1 if failed else 0
+
+
+def cmd_dupes(args):
+    category_dirs, _ = scan_library(args.root)
+    category_dirs = select_systems(category_dirs, args.system)
+    if category_dirs is None:
+        return 1
+
+    hash_cache = HashCache(args.root)
+    try:
+        hash_cache.load()
+    except sqlite3.Error as e:
+        error(f"哈希缓存损坏，将重新计算：{str(e)}")
+        hash_cache = HashCache(args.root)
+    finder = DuplicateFinder(hash_cache)
+    groups = finder.find(category_dirs, error)
+    for number, group in enumerate(groups, 1):
+        for category_name, rom_path, _, size, _ in group:
+            print(f"{number}\t{category_name}\t{rom_path}\t{size}")
+    error(f"找到{len(groups)}组重复ROM，共{sum(len(group) - 1 for group in groups)}个多余文件"
+          f"（读取{finder.hashed_bytes / 1048576:.1f} MB，缓存命中{hash_cache.hits}次）")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='retrobat-tool', description="RetroBat 游戏列表工具（命令行模式）")
+    parser.add_argument('--version', action='version', version=CURRENT_VERSION)
+    parser.add_argument('--trace', metavar='FILE', help="记录各步骤耗时，结束后导出为 Chrome trace JSON")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help="扫描机种目录")
+    scan.add_argument('root', help="RetroBat 根目录")
+    scan.set_defaults(func=cmd_scan)
+
+    search = commands.add_parser('search', help="跨机种搜索游戏")
+    search.add_argument('root', help="RetroBat 根目录")
+    search.add_argument('query', help="关键词，支持 name:/desc:/rom: 限定字段")
+    search.add_argument('--limit', type=int, default=500)
+    search.set_defaults(func=cmd_search)
+
+    export = commands.add_parser('export', help="导出游戏列表")
+    export.add_argument('root', help="RetroBat 根目录")
+    export.add_argument('output', help="输出文件（.csv/.jsonl/.xlsx）")
+    export.add_argument('--system', help="只导出指定机种，多个用逗号分隔")
+    export.add_argument('--fields', default='rom,name', help=f"导出字段：{','.join(EXPORT_FIELDS)}")
+    export.add_argument('--format', choices=sorted(GameListExporter.FORMATS), help="默认按扩展名判断")
+    export.set_defaults(func=cmd_export)
+
+    import_ = commands.add_parser('import', help="从 CSV/XLSX 导入名称和描述")
+    import_.add_argument('xml', help="gamelist.xml 路径")
+    import_.add_argument('file', help="CSV/XLSX 文件")
+    import_.add_argument('--dry-run', action='store_true', help="只统计，不写回")
+    import_.set_defaults(func=cmd_import)
+
+    prune = commands.add_parser('prune', help="删除游戏及其媒体文件")
+    prune.add_argument('xml', help="gamelist.xml 路径")
+    prune.add_argument('roms', nargs='*', help="要删除的 rom 路径（与 gamelist.xml 中的 <path> 一致）")
+    prune.add_argument('--from-file', help="从文件读取 rom 路径，每行一个")
+    prune.add_argument('--dry-run', action='store_true', help="只列出将删除的内容")
+    prune.set_defaults(func=cmd_prune)
+
+    replay = commands.add_parser('replay', help="由快照和修改日志重建 gamelist.xml（文件损坏或被误改时恢复）")
+    replay.add_argument('xml', help="gamelist.xml 路径")
+    replay.add_argument('--output', help="写到其它文件，默认覆盖 gamelist.xml（原文件先备份到 backups/）")
+    replay.set_defaults(func=cmd_replay)
+
+    audit = commands.add_parser('audit', help="检查缺失的 ROM 和孤立的媒体文件")
+    audit.add_argument('root', help="RetroBat 根目录")
+    audit.add_argument('--system', help="只检查指定机种，多个用逗号分隔")
+    audit.add_argument('--clean', action='store_true', help="移除缺失 ROM 的游戏并删除孤立媒体")
+    audit.add_argument('--dry-run', action='store_true', help="与 --clean 一起使用时只列出将删除的内容")
+    audit.set_defaults(func=cmd_audit)
+
+    dupes = commands.add_parser('dupes', help="按文件内容查找重复的 ROM")
+    dupes.add_argument('root', help="RetroBat 根目录")
+    dupes.add_argument('--system', help="只检查指定机种，多个用逗号分隔")
+    dupes.set_defaults(func=cmd_dupes)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.trace:
+        return args.func(args)
+    tracer.enabled = True
+    try:
+        return args.func(args)
+    finally:
+        try:
+            tracer.dump_chrome_trace(args.trace)
+        except OSError as e:
+            error(f"Trace 导出失败：{str(e)}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import os
+import sys
+from xml.sax.saxutils import escape
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retrobat_core as tool  # noqa: E402
+
+
+def write_gamelist(xml_path, games):
+    """games: [{'path': './a.zip', 'name': ..., 其它字段: 值}]"""
+    os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+    with open(xml_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0"?>\n<gameList>\n')
+        for game in games:
+            f.write('  <game>\n')
+            for field, value in game.items():
+                f.write(f'    <{field}>{escape(value)}</{field}>\n')
+            f.write('  </game>\n')
+        f.write('</gameList>\n')
+
+
+def touch(path, data=b''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.fixture
+def system_dir(tmp_path):
+    path = tmp_path / 'roms' / 'snes'
+    path.mkdir(parents=True)
+    return str(path)
+
+
+def load_gamelist(system_dir, games):
+    """写出 gamelist.xml 并载入游戏表，返回建好的 SearchIndex（表在 .table 上）"""
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, games)
+    table = tool.GameTable()
+    search_index = tool.SearchIndex(table)
+    tool.fill_game_table(xml_path, table, search_index)
+    return search_index
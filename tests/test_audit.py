@@ -0,0 +1,68 @@
+import os
+
+from conftest import tool, touch, write_gamelist
+import retrobat_tool
+
+
+def audit_and_clean(system_dir, games):
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, games)
+    audit = tool.LibraryAuditor().audit_system('snes', xml_path)
+    deleter = tool.BulkDeleter(system_dir, tool.GamelistWriter(xml_path))
+    return audit, deleter, tool.LibraryAuditor.plan_cleanup(audit, deleter)
+
+
+def test_cleanup_of_missing_rom_never_touches_system_root(system_dir):
+    for name in ('Sonic.7z', 'videos/Sonic-video.mp4', 'videos/Tetris-video.mp4'):
+        touch(os.path.join(system_dir, name))
+    audit, deleter, plan = audit_and_clean(system_dir, [{'path': './Sonic.zip'}, {'path': './Tetris.zip'}])
+
+    assert audit.missing_roms == ['./Sonic.zip', './Tetris.zip']
+    # Sonic.7z 仍在机种目录中，同名视频归它所有；Tetris 只删媒体目录中的视频
+    assert [os.path.relpath(path, system_dir) for path, _ in plan.files] == [
+        os.path.join('videos', 'Tetris-video.mp4')]
+
+    deleter.execute(plan)
+    assert sorted(os.listdir(system_dir)) == ['Sonic.7z', 'backups', 'gamelist.xml', 'videos']
+    assert os.listdir(os.path.join(system_dir, 'videos')) == ['Sonic-video.mp4']
+    assert list(tool.iter_gamelist_rows(os.path.join(system_dir, 'gamelist.xml'))) == []
+
+
+def test_rom_existence_ignores_case(system_dir):
+    touch(os.path.join(system_dir, 'Sonic The Hedgehog (USA).zip'))
+    touch(os.path.join(system_dir, 'videos', 'Sonic The Hedgehog (USA)-video.mp4'))
+    audit, _, plan = audit_and_clean(system_dir, [{'path': './sonic the hedgehog (usa).ZIP'}])
+
+    assert audit.missing_roms == []
+    assert audit.present_roms == ['./sonic the hedgehog (usa).ZIP']
+    assert plan.files == []
+
+
+def test_clean_command_lists_the_plan_it_executes(system_dir, tmp_path, capsys):
+    touch(os.path.join(system_dir, 'Contra.nes'))
+    touch(os.path.join(system_dir, 'videos', 'Tetris-video.mp4'))
+    touch(os.path.join(system_dir, 'images', 'Orphan-image.png'))
+    write_gamelist(os.path.join(system_dir, 'gamelist.xml'), [{'path': './Contra.nes'}, {'path': './Tetris.zip'}])
+    video = os.path.join(system_dir, 'videos', 'Tetris-video.mp4')
+    image = os.path.join(system_dir, 'images', 'Orphan-image.png')
+
+    assert retrobat_tool.main(['audit', str(tmp_path), '--clean', '--dry-run']) == 0
+    listed = capsys.readouterr().out.splitlines()
+    assert 'snes\t移除游戏\t./Tetris.zip' in listed
+    assert sorted(line for line in listed if '删除文件' in line) == [f'snes\t删除文件\t{image}',
+                                                                   f'snes\t删除文件\t{video}']
+    assert os.path.exists(video) and os.path.exists(image)
+
+    assert retrobat_tool.main(['audit', str(tmp_path), '--clean']) == 0
+    assert not os.path.exists(video) and not os.path.exists(image)
+    assert os.path.exists(os.path.join(system_dir, 'Contra.nes'))
+
+
+def test_media_referenced_by_any_path_field_is_not_orphaned(system_dir):
+    touch(os.path.join(system_dir, 'Contra.nes'))
+    for name in ('videos/intro.mp4', 'manuals/booklet.pdf', 'images/cover.png', 'videos/stray.mp4'):
+        touch(os.path.join(system_dir, name))
+    audit, _, _ = audit_and_clean(system_dir, [{'path': './Contra.nes', 'video': './videos/intro.mp4',
+                                                'manual': './manuals/booklet.pdf', 'image': './images/cover.png'}])
+
+    assert [os.path.basename(path) for path, _ in audit.orphaned_media] == ['stray.mp4']
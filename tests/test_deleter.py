@@ -0,0 +1,84 @@
+import os
+
+from conftest import tool, touch, write_gamelist
+
+
+def make_deleter(system_dir, games):
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, games)
+    return tool.BulkDeleter(system_dir, tool.GamelistWriter(xml_path)), xml_path
+
+
+def planned(plan, system_dir):
+    return sorted((os.path.relpath(path, system_dir).replace(os.sep, '/'), is_dir) for path, is_dir in plan.files)
+
+
+def test_plan_collects_rom_and_media(system_dir):
+    touch(os.path.join(system_dir, 'Contra (USA).nes'))
+    touch(os.path.join(system_dir, 'videos', 'Contra (USA)-video.mp4'))
+    touch(os.path.join(system_dir, 'images', 'Contra (USA)-image.png'), b'1234')
+    touch(os.path.join(system_dir, 'Mario.nes'))
+    deleter, _ = make_deleter(system_dir, [{'path': './Contra (USA).nes'}, {'path': './Mario.nes'}])
+
+    plan = deleter.plan(['./Contra (USA).nes'], ['./Mario.nes'])
+
+    assert planned(plan, system_dir) == [('Contra (USA).nes', False),
+                                         ('images/Contra (USA)-image.png', False),
+                                         ('videos/Contra (USA)-video.mp4', False)]
+    assert plan.total_bytes == 4
+
+
+def test_plan_spares_kept_rom_with_same_name(system_dir):
+    for name in ('Sonic.zip', 'Sonic.7z', 'videos/Sonic-video.mp4'):
+        touch(os.path.join(system_dir, name))
+    deleter, _ = make_deleter(system_dir, [{'path': './Sonic.zip'}, {'path': './Sonic.7z'}])
+
+    plan = deleter.plan(['./Sonic.zip'], ['./Sonic.7z'])
+
+    assert planned(plan, system_dir) == [('Sonic.zip', False)]
+
+
+def test_plan_never_matches_media_or_backup_folders(system_dir):
+    for name in ('videos.zip', 'backups.zip', 'videos/Other-video.mp4', 'backups/gamelist.xml.bak1'):
+        touch(os.path.join(system_dir, name))
+    deleter, _ = make_deleter(system_dir, [{'path': './videos.zip'}, {'path': './backups.zip'}])
+
+    plan = deleter.plan(['./videos.zip', './backups.zip'])
+
+    assert planned(plan, system_dir) == [('backups.zip', False), ('videos.zip', False)]
+
+
+def test_plan_removes_multi_file_rom_folder_once(system_dir):
+    touch(os.path.join(system_dir, 'Final Fantasy VII', 'Final Fantasy VII.bin'))
+    touch(os.path.join(system_dir, 'Final Fantasy VII', 'Final Fantasy VII.cue'))
+    deleter, _ = make_deleter(system_dir, [{'path': './Final Fantasy VII/Final Fantasy VII.cue'}])
+
+    plan = deleter.plan(['./Final Fantasy VII/Final Fantasy VII.cue'])
+
+    assert planned(plan, system_dir) == [('Final Fantasy VII', True)]
+
+
+def test_execute_removes_games_and_files(system_dir):
+    touch(os.path.join(system_dir, 'Contra.nes'))
+    touch(os.path.join(system_dir, 'Mario.nes'))
+    deleter, xml_path = make_deleter(system_dir, [{'path': './Contra.nes'}, {'path': './Mario.nes'}])
+
+    removed, errors = deleter.execute(deleter.plan(['./Contra.nes'], ['./Mario.nes']))
+
+    assert (removed, errors) == (1, [])
+    assert not os.path.exists(os.path.join(system_dir, 'Contra.nes'))
+    assert [row[1] for row in tool.iter_gamelist_rows(xml_path)] == ['./Mario.nes']
+
+
+def test_journal_failure_is_reported_apart_from_file_errors(system_dir):
+    class BrokenJournal:
+        def rebase(self):
+            raise OSError("磁盘已满")
+
+    touch(os.path.join(system_dir, 'Contra.nes'))
+    deleter, _ = make_deleter(system_dir, [{'path': './Contra.nes'}])
+
+    removed, errors = deleter.execute(deleter.plan(['./Contra.nes']), journal=BrokenJournal())
+
+    assert (removed, errors) == (1, [])
+    assert '磁盘已满' in deleter.journal_error
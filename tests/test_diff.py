@@ -0,0 +1,32 @@
+import os
+
+from conftest import load_gamelist, tool, write_gamelist
+
+
+def test_diff_reports_updated_added_removed_and_moved(system_dir):
+    table = load_gamelist(system_dir, [
+        {'path': './a.zip', 'name': 'A'},
+        {'path': './b.zip', 'name': 'B'},
+        {'path': './c.zip', 'name': 'C'},
+        {'path': './d.zip', 'name': 'D'},
+    ]).table
+    table.remove(3)  # 已标记删除、尚未保存
+
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, [
+        {'path': './c.zip', 'name': 'C'},
+        {'path': './a.zip', 'name': 'A2', 'rating': '0.8'},
+        {'path': './new.zip', 'name': 'New'},
+        {'path': './d.zip', 'name': 'D'},
+    ])
+    diff = tool.diff_gamelist(table, xml_path)
+
+    assert diff.updated == [(0, 1, 'A2', '', (), ('0.8', '', '', ''))]
+    assert diff.added == [(2, './new.zip', 'New', '', (), ())]
+    assert diff.removed == [1]
+    assert diff.moved == [(2, 0)]
+
+
+def test_unchanged_file_gives_empty_diff(system_dir):
+    table = load_gamelist(system_dir, [{'path': './a.zip', 'name': 'A', 'image': './images/a.png'}]).table
+    assert not tool.diff_gamelist(table, os.path.join(system_dir, 'gamelist.xml'))
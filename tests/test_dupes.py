@@ -0,0 +1,16 @@
+import os
+
+from conftest import tool, touch, write_gamelist
+
+
+def test_find_groups_identical_roms_and_skips_empty_files(system_dir):
+    for name, data in (('a.zip', b'same'), ('b.zip', b'same'), ('c.zip', b'diff'),
+                       ('empty1.zip', b''), ('empty2.zip', b'')):
+        touch(os.path.join(system_dir, name), data)
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, [{'path': f'./{name}'} for name in
+                              ('a.zip', 'b.zip', 'c.zip', 'empty1.zip', 'empty2.zip')])
+
+    groups = tool.DuplicateFinder().find({'snes': xml_path})
+
+    assert [[entry[1] for entry in group] for group in groups] == [['./a.zip', './b.zip']]
@@ -0,0 +1,94 @@
+import csv
+import json
+import os
+import threading
+
+import pytest
+
+from conftest import load_gamelist, tool, touch
+
+GAMES = [
+    {'path': './Contra (USA).nes', 'name': 'Contra', 'desc': 'Run and gun'},
+    {'path': './Mario.nes', 'name': '超级马里奥', 'desc': ''},
+]
+
+
+@pytest.fixture
+def table(system_dir):
+    touch(os.path.join(system_dir, 'Contra (USA).nes'), b'12345')
+    touch(os.path.join(system_dir, 'videos', 'Contra (USA)-video.mp4'))
+    return load_gamelist(system_dir, GAMES).table
+
+
+def sources(system_dir, rows):
+    return [('snes', system_dir, tool.video_key_lookup(system_dir), rows)]
+
+
+def test_csv_export_writes_header_and_every_row(table, system_dir, tmp_path):
+    file_path = str(tmp_path / 'games.csv')
+    exporter = tool.GameListExporter(file_path, 'csv', ['system', 'rom', 'name', 'video', 'size'])
+
+    count = exporter.export(sources(system_dir, tool.GameListExporter.table_rows(table, table.ids())))
+
+    with open(file_path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+    assert count == 2
+    assert rows == [['机种', 'ROM', '名称', '有视频', '文件大小'],
+                    ['snes', './Contra (USA).nes', 'Contra', 'True', '5'],
+                    ['snes', './Mario.nes', '超级马里奥', 'False', '']]
+    assert not os.path.exists(file_path + '.tmp')
+
+
+def test_jsonl_export_streams_gamelist_and_keeps_field_order(table, system_dir, tmp_path):
+    file_path = str(tmp_path / 'games.jsonl')
+    # 字段按 EXPORT_FIELDS 的顺序输出，与传入顺序无关
+    exporter = tool.GameListExporter(file_path, 'jsonl', ['name', 'rom'])
+
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    count = exporter.export(sources(system_dir, tool.GameListExporter.gamelist_rows(xml_path)))
+
+    with open(file_path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert count == 2
+    assert lines[1] == '{"rom": "./Mario.nes", "name": "超级马里奥"}'
+    assert [json.loads(line)['name'] for line in lines] == ['Contra', '超级马里奥']
+
+
+def test_filtered_ids_export_only_those_rows(table, system_dir, tmp_path):
+    file_path = str(tmp_path / 'games.csv')
+    exporter = tool.GameListExporter(file_path, 'csv', ['name'])
+    count = exporter.export(sources(system_dir, tool.GameListExporter.table_rows(table, [1])))
+    with open(file_path, encoding='utf-8-sig', newline='') as f:
+        assert list(csv.reader(f)) == [['名称'], ['超级马里奥']]
+    assert count == 1
+
+
+def test_cancel_keeps_existing_file(table, system_dir, tmp_path):
+    file_path = str(tmp_path / 'games.csv')
+    with open(file_path, 'w') as f:
+        f.write('old')
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    exporter = tool.GameListExporter(file_path, 'csv', ['name'])
+    exporter.export(sources(system_dir, tool.GameListExporter.table_rows(table, table.ids())),
+                    cancel_event=cancel_event)
+
+    with open(file_path) as f:
+        assert f.read() == 'old'
+    assert not os.path.exists(file_path + '.tmp')
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        tool.GameListExporter(str(tmp_path / 'games.txt'), 'txt', ['name'])
+
+
+def test_game_without_rom_path_has_no_size(system_dir, tmp_path):
+    file_path = str(tmp_path / 'games.jsonl')
+    exporter = tool.GameListExporter(file_path, 'jsonl', ['name', 'size'])
+
+    exporter.export(sources(system_dir, [('', 'No ROM', '')]))
+
+    with open(file_path, encoding='utf-8') as f:
+        assert json.loads(f.read()) == {'name': 'No ROM', 'size': None}
@@ -0,0 +1,74 @@
+import csv
+
+import pytest
+
+import retrobat_tool
+from conftest import load_gamelist, tool, write_gamelist
+
+
+@pytest.fixture
+def table(system_dir):
+    return load_gamelist(system_dir, [
+        {'path': './Contra (USA).nes', 'name': 'Contra', 'desc': 'old'},
+        {'path': './subdir/Mario.nes', 'name': 'Mario', 'desc': ''},
+        {'path': './Sonic (USA).md', 'name': 'Sonic', 'desc': ''},
+        {'path': './Sonic (Japan).md', 'name': 'Sonic', 'desc': ''},
+        {'path': './Zelda (USA).nes', 'name': 'Zelda', 'desc': ''},
+    ]).table
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        csv.writer(f).writerows(rows)
+    return str(path)
+
+
+def test_run_matches_exact_and_unique_loose_keys(table, tmp_path):
+    csv_path = write_csv(tmp_path / 'import.csv', [
+        ['文件名', '游戏名称', '简介'],
+        ['Contra (USA).nes', '魂斗罗', 'old'],   # 描述未变，不产生修改
+        ['Mario.nes', '超级马里奥', ''],          # 只比较文件名，空单元格不覆盖
+        ['Zelda (Europe) [!].nes', '塞尔达', '新描述'],  # 去掉标签后唯一对应
+        ['Sonic (Europe).md', '索尼克', ''],     # 宽松键对应两个版本，不导入
+        ['Missing.zip', '不存在', ''],
+        ['', '没有 rom', ''],
+    ])
+
+    changes, summary = tool.MetadataImporter(table).run(csv_path)
+
+    assert sorted(changes) == [(0, 'name', '魂斗罗'), (1, 'name', '超级马里奥'),
+                               (4, 'desc', '新描述'), (4, 'name', '塞尔达')]
+    assert (summary.rows, summary.matched, summary.loose_matched, summary.unmatched) == (5, 3, 1, 2)
+    assert (summary.changed_games, summary.changed_fields) == (3, 4)
+    assert summary.unmatched_samples == ['Sonic (Europe).md', 'Missing.zip']
+
+
+def test_exact_key_updates_every_game_with_that_rom(table, tmp_path):
+    csv_path = write_csv(tmp_path / 'import.csv', [['rom', 'name'], ['Sonic (USA).md', 'Sonic US']])
+    changes, summary = tool.MetadataImporter(table).run(csv_path)
+    assert changes == [(2, 'name', 'Sonic US')]
+    assert summary.loose_matched == 0
+
+
+def test_unknown_header_falls_back_to_column_order(table, tmp_path):
+    csv_path = write_csv(tmp_path / 'import.csv', [['a', 'b', 'c'], ['Contra (USA).nes', 'Contra', 'new']])
+    changes, _ = tool.MetadataImporter(table).run(csv_path)
+    assert changes == [(0, 'desc', 'new')]
+
+
+def test_import_command_reports_unreadable_gamelist(system_dir, tmp_path, capsys):
+    csv_path = write_csv(tmp_path / 'meta.csv', [['rom', 'name'], ['Contra (USA).nes', 'Contra Force']])
+    xml_path = f"{system_dir}/gamelist.xml"
+    assert retrobat_tool.main(['import', xml_path, csv_path]) == 1
+    assert '读取失败' in capsys.readouterr().err
+    with open(xml_path, 'w', encoding='utf-8') as f:
+        f.write('<gameList><game>')
+    assert retrobat_tool.main(['import', xml_path, csv_path]) == 1
+
+
+def test_import_command_saves_changes(system_dir, tmp_path):
+    xml_path = f"{system_dir}/gamelist.xml"
+    write_gamelist(xml_path, [{'path': './Contra (USA).nes', 'name': 'Contra'}])
+    csv_path = write_csv(tmp_path / 'meta.csv', [['rom', 'name'], ['Contra (USA).nes', 'Contra Force']])
+    assert retrobat_tool.main(['import', xml_path, csv_path]) == 0
+    assert [row[2] for row in tool.iter_gamelist_rows(xml_path)] == ['Contra Force']
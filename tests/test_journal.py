@@ -0,0 +1,104 @@
+import os
+
+from conftest import tool, write_gamelist
+import retrobat_tool
+
+
+def names(xml_path):
+    return {rom_path: name for _, rom_path, name, *_ in tool.iter_gamelist_rows(xml_path)}
+
+
+def make_gamelist(system_dir):
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, [{'path': './a.zip', 'name': 'A'}, {'path': './b.zip', 'name': 'B'}])
+    return xml_path
+
+
+def test_commit_writes_changes_and_snapshot(system_dir):
+    xml_path = make_gamelist(system_dir)
+    writer = tool.GamelistWriter(xml_path)
+    journal = tool.EditJournal(xml_path)
+    journal.record([('./a.zip', 'name', 'A', 'A2')])
+
+    assert journal.commit(writer, [(0, './a.zip', 'name', 'A2'), (5, './gone.zip', 'name', 'X')]) == ['./gone.zip']
+    assert names(xml_path) == {'./a.zip': 'A2', './b.zip': 'B'}
+    assert names(journal.snapshot_path) == {'./a.zip': 'A', './b.zip': 'B'}
+    assert journal.lines == 1
+    assert not any('.bak' in name for name in os.listdir(os.path.join(system_dir, 'backups')))
+
+
+def test_undo_redo_replay_round_trip(system_dir, tmp_path):
+    xml_path = make_gamelist(system_dir)
+    writer = tool.GamelistWriter(xml_path)
+    journal = tool.EditJournal(xml_path)
+
+    journal.record([('./a.zip', 'name', 'A', 'A2'), ('./b.zip', 'name', 'B', 'B2')])
+    journal.commit(writer, [(0, './a.zip', 'name', 'A2'), (1, './b.zip', 'name', 'B2')])
+    journal.record([('./a.zip', 'name', 'A2', 'A3')])
+    journal.commit(writer, [(0, './a.zip', 'name', 'A3')])
+
+    assert journal.undo() == [('./a.zip', 'name', 'A2')]
+    assert journal.undo() == [('./b.zip', 'name', 'B'), ('./a.zip', 'name', 'A')]
+    assert journal.undo() is None
+    assert journal.redo() == [('./a.zip', 'name', 'A2'), ('./b.zip', 'name', 'B2')]
+    journal.commit(writer, [(0, './a.zip', 'name', 'A2'), (1, './b.zip', 'name', 'B2')])
+
+    replayed = str(tmp_path / 'replayed.xml')
+    journal.replay(replayed)
+    assert names(replayed) == names(xml_path) == {'./a.zip': 'A2', './b.zip': 'B2'}
+
+    reloaded = tool.EditJournal(xml_path)
+    reloaded.load()
+    assert [batch_id for batch_id, _ in reloaded.done] == [1]
+    assert [batch_id for batch_id, _ in reloaded.undone] == [2]
+    assert reloaded.redo() == [('./a.zip', 'name', 'A3')]
+
+
+def test_compact_keeps_history_replayable(system_dir, tmp_path):
+    xml_path = make_gamelist(system_dir)
+    writer = tool.GamelistWriter(xml_path)
+    journal = tool.EditJournal(xml_path)
+    journal.COMPACT_LINES = 3
+    for i in range(5):
+        journal.record([('./a.zip', 'name', f'A{i}' if i else 'A', f'A{i + 1}')])
+        journal.commit(writer, [(0, './a.zip', 'name', f'A{i + 1}')])
+    journal.undo()
+    journal.commit(writer, [(0, './a.zip', 'name', 'A4')])
+
+    assert journal.compact_if_needed(writer)
+    assert journal.lines == 6
+    replayed = str(tmp_path / 'replayed.xml')
+    journal.replay(replayed)
+    assert names(replayed)['./a.zip'] == 'A4'
+    assert journal.redo() == [('./a.zip', 'name', 'A5')]
+
+
+def test_bulk_delete_rebases_snapshot(system_dir, tmp_path):
+    xml_path = make_gamelist(system_dir)
+    writer = tool.GamelistWriter(xml_path)
+    journal = tool.EditJournal(xml_path)
+    journal.record([('./a.zip', 'name', 'A', 'A2')])
+    journal.commit(writer, [(0, './a.zip', 'name', 'A2')])
+
+    deleter = tool.BulkDeleter(system_dir, writer)
+    deleter.execute(deleter.plan(['./b.zip'], ['./a.zip']))
+
+    replayed = str(tmp_path / 'replayed.xml')
+    journal.replay(replayed)
+    assert names(replayed) == names(xml_path) == {'./a.zip': 'A2'}
+    reloaded = tool.EditJournal(xml_path)
+    reloaded.load()
+    assert reloaded.undo() == [('./a.zip', 'name', 'A')]
+
+
+def test_replay_command_restores_damaged_gamelist(system_dir):
+    xml_path = make_gamelist(system_dir)
+    journal = tool.EditJournal(xml_path)
+    journal.record([('./b.zip', 'name', 'B', 'B2')])
+    journal.commit(tool.GamelistWriter(xml_path), [(1, './b.zip', 'name', 'B2')])
+    with open(xml_path, 'w', encoding='utf-8') as f:
+        f.write('<gameList><game><path>./a.zip')
+
+    assert retrobat_tool.main(['replay', xml_path]) == 0
+    assert names(xml_path) == {'./a.zip': 'A', './b.zip': 'B2'}
+    assert any('.bak' in name for name in os.listdir(os.path.join(system_dir, 'backups')))
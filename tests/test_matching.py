@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from conftest import tool, touch, write_gamelist
+
+
+def test_loose_key_ignores_tags_and_trailing_article():
+    assert tool.loose_key("Legend of Zelda, The (USA) (Rev 1).zip") == tool.loose_key("The Legend of Zelda [!]-video.mp4")
+    assert tool.clean_filename("Contra (USA)-video.mp4") == tool.clean_filename("Contra (USA).nes")
+
+
+@pytest.mark.parametrize('key, expected', [
+    ('castelvania', 'castlevania'),
+    ('sonichedgehog', 'sonicthehedgehog'),
+    ('megaman4', None),          # 续作编号不同
+    ('streetfighteri', None),    # 前缀：Street Fighter II / III
+    ('pacman', None),            # 后缀：Ms. Pac-Man
+    ('tetris', None),
+])
+def test_fuzzy_match(key, expected):
+    index = tool.FuzzyKeyIndex(['castlevania', 'sonicthehedgehog', 'megaman3', 'streetfighterii', 'mspacman'])
+    assert index.match(key) == expected
+
+
+def test_fuzzy_match_rejects_ties():
+    index = tool.FuzzyKeyIndex(['abcdefghix', 'abcdefghiy'])
+    assert index.match('abcdefghiz') is None
+    assert len(index.candidates('abcdefghiz')) == 2
+
+
+def test_media_index_falls_back_to_fuzzy_match(system_dir):
+    touch(os.path.join(system_dir, 'videos', 'Castlevania (USA)-video.mp4'))
+    touch(os.path.join(system_dir, 'videos', 'Mega Man 3-video.mp4'))
+    index = tool.MediaIndex()
+    index.ensure_system('nes', system_dir)
+
+    assert index.match('nes', 'Castelvania.nes').endswith('Castlevania (USA)-video.mp4')
+    assert index.match('nes', 'Mega Man 4.nes') is None
+    assert index.match('nes', 'Castelvania.nes', 'image') is None
+
+
+def test_audit_keeps_fuzzy_matched_media(system_dir):
+    touch(os.path.join(system_dir, 'Castelvania.nes'))
+    touch(os.path.join(system_dir, 'videos', 'Castlevania (USA)-video.mp4'))
+    touch(os.path.join(system_dir, 'videos', 'Mega Man 3-video.mp4'), b'12')
+    xml_path = os.path.join(system_dir, 'gamelist.xml')
+    write_gamelist(xml_path, [{'path': './Castelvania.nes'}, {'path': './Mega Man 4.nes'}])
+
+    audit = tool.LibraryAuditor().audit_system('nes', xml_path)
+
+    assert audit.missing_roms == ['./Mega Man 4.nes']
+    assert [os.path.basename(path) for path, _ in audit.orphaned_media] == ['Mega Man 3-video.mp4']
+    assert audit.orphaned_bytes == 2
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from conftest import tool, touch, write_gamelist
+
+
+@pytest.fixture
+def library(tmp_path):
+    """roms/<机种>/ 下各 50 个 ROM 与视频，另有扫描时应跳过的深层目录"""
+    root = str(tmp_path)
+    for system in ('nes', 'snes'):
+        system_dir = os.path.join(root, 'roms', system)
+        write_gamelist(os.path.join(system_dir, 'gamelist.xml'), [])
+        for i in range(50):
+            touch(os.path.join(system_dir, f'game{i}.zip'))
+            touch(os.path.join(system_dir, 'videos', f'game{i}-video.mp4'))
+    for i in range(50):
+        touch(os.path.join(root, 'bios', 'a', 'b', f'file{i}.bin'))
+    write_gamelist(os.path.join(root, 'ports', 'gamelist.xml'), [])
+    return root
+
+
+def test_scan_finds_systems_on_both_levels(library):
+    found = tool.LibraryScanner().scan(library)
+    assert sorted(found) == ['nes', 'ports', 'snes']
+    assert found['nes'] == os.path.join(library, 'roms', 'nes', 'gamelist.xml')
+
+
+def test_scan_does_not_list_rom_or_unrelated_folders(library):
+    scanner = tool.LibraryScanner()
+    scanner.scan(library)
+    # 根目录、两个第 1 层目录以及机种目录的 stat，不包括 ROM、视频与 bios 下的文件
+    assert scanner.entries_visited < 150
+
+
+def test_on_system_callback(library):
+    seen = []
+    tool.LibraryScanner().scan(library, lambda name, xml_path: seen.append(name))
+    assert sorted(seen) == ['nes', 'ports', 'snes']
+
+
+def indexed_scan(root):
+    index = tool.ScanIndex(root)
+    index.load()
+    scanner = tool.LibraryScanner(index=index)
+    found = scanner.scan(root)
+    index.save()
+    return found, index, scanner
+
+
+def test_rescan_reuses_unchanged_directories(library):
+    first, index, cold = indexed_scan(library)
+    assert index.hits == 0
+    second, index, warm = indexed_scan(library)
+    assert second == first
+    assert index.hits > 0
+    assert warm.entries_visited < cold.entries_visited
+
+
+def test_rescan_picks_up_changed_directories(library):
+    indexed_scan(library)
+    write_gamelist(os.path.join(library, 'roms', 'gb', 'gamelist.xml'), [])
+    found, _, _ = indexed_scan(library)
+    assert sorted(found) == ['gb', 'nes', 'ports', 'snes']
+
+
+def test_save_drops_directories_that_disappeared(library):
+    _, index, _ = indexed_scan(library)
+    ports_dir = os.path.join(library, 'ports')
+    assert ports_dir in index.entries
+    os.remove(os.path.join(ports_dir, 'gamelist.xml'))
+    os.rmdir(ports_dir)
+    found, index, _ = indexed_scan(library)
+    assert 'ports' not in found
+    reloaded = tool.ScanIndex(library)
+    reloaded.load()
+    assert ports_dir not in reloaded.entries
@@ -0,0 +1,80 @@
+import pytest
+
+from conftest import load_gamelist, tool
+
+
+@pytest.fixture
+def search_index(system_dir):
+    return load_gamelist(system_dir, [
+        {'path': './smw.sfc', 'name': 'Super Mario World', 'desc': 'Dinosaur land adventure'},
+        {'path': './smb (Japan).nes', 'name': 'Super Mario Bros', 'desc': 'Rescue the princess'},
+        {'path': './dq.sfc', 'name': 'Dragon Quest V', 'desc': 'A super long journey'},
+        {'path': './sf2.sfc', 'name': 'Street Fighter II', 'desc': ''},
+    ])
+
+
+def test_parse_query_splits_field_prefixes():
+    assert tool.parse_query('Mario desc:Land rom:SFC') == [(None, 'mario'), ('desc', 'land'), ('rom', 'sfc')]
+    assert tool.parse_query('  ') == []
+
+
+def test_empty_query_returns_all_alive_games(search_index):
+    search_index.table.remove(2)
+    assert list(search_index.search('')) == [0, 1, 3]
+
+
+def test_plain_query_matches_name_and_description(search_index):
+    assert list(search_index.search('super')) == [0, 1, 2]
+    assert list(search_index.search('SUPER MARIO')) == [0, 1]
+    assert list(search_index.search('zelda')) == []
+
+
+def test_field_prefixes(search_index):
+    assert list(search_index.search('desc:land')) == [0]
+    assert list(search_index.search('name:super')) == [0, 1]
+    assert list(search_index.search('rom:japan')) == [1]
+    assert list(search_index.search('super rom:sfc')) == [0, 2]
+
+
+def test_narrowing_matches_fresh_search(search_index):
+    typed = [search_index.search(query) for query in ('s', 'su', 'sup', 'super', 'super m', 'super ma')]
+    fresh = tool.SearchIndex(search_index.table)
+    for game_id in range(len(search_index.table.names)):
+        fresh.add(game_id)
+    assert list(typed[-1]) == list(fresh.search('super ma')) == [0, 1]
+    # 查询变短或换了字段时不能沿用上一次的结果
+    assert list(search_index.search('desc:super')) == [2]
+    assert list(search_index.search('fighter')) == [3]
+
+
+def test_limit_only_counts_loaded_rows(search_index):
+    assert list(search_index.search('super', limit=2)) == [0, 1]
+    assert list(search_index.search('super')) == [0, 1, 2]
+
+
+def test_update_and_matches(search_index):
+    table = search_index.table
+    search_index.search('mario')
+    table.names[3] = 'Mario Kart'
+    search_index.update(3)
+    assert list(search_index.search('mario')) == [0, 1, 3]
+    assert search_index.matches(3, 'kart')
+    assert not search_index.matches(3, 'fighter')
+
+
+def test_description_matches_inside_words_and_phrases(search_index):
+    assert list(search_index.search('desc:u')) == [0, 1, 2]
+    assert list(search_index.search('desc:ventur')) == [0]
+    assert list(search_index.search('desc:ur land adv')) == [0]
+    # 每个单词都出现但不相邻时不算短语匹配
+    assert list(search_index.search('desc:journey long')) == []
+
+
+def test_updated_description_drops_old_words(search_index):
+    table = search_index.table
+    table.descs[0] = 'Island hopping'
+    search_index.update(0)
+    assert list(search_index.search('desc:dinosaur')) == []
+    assert list(search_index.search('desc:o')) == [0, 2]
+    assert list(search_index.search('desc:d')) == [0]
+    assert list(search_index.search('desc:hopping')) == [0]
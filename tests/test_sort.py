@@ -0,0 +1,66 @@
+from array import array
+
+import pytest
+
+from conftest import load_gamelist, tool
+
+
+@pytest.fixture
+def sort_index(system_dir):
+    return tool.SortIndex(load_gamelist(system_dir, [
+        {'path': './game10.zip', 'name': 'Game 10', 'rating': '0.4', 'playcount': '3'},
+        {'path': './game2.zip', 'name': 'Game 2', 'rating': '0.9'},
+        {'path': './nameless.zip', 'name': '', 'rating': 'bad'},
+        {'path': './alpha.zip', 'name': 'alpha', 'rating': '0.4', 'playcount': '12'},
+        {'path': './zeta.zip', 'name': 'Zeta'},
+    ]))
+
+
+def names(sort_index, ids):
+    return [sort_index.table.names[game_id] for game_id in ids]
+
+
+def test_file_order_is_identity(sort_index):
+    ids = sort_index.table.ids()
+    assert sort_index.sort(ids, 'file') == ids
+    assert list(sort_index.sort(ids, 'file', descending=True)) == [4, 3, 2, 1, 0]
+
+
+def test_name_sort_is_natural_and_case_insensitive(sort_index):
+    ids = sort_index.table.ids()
+    assert names(sort_index, sort_index.sort(ids, 'name')) == ['alpha', 'Game 2', 'Game 10', 'Zeta', '']
+
+
+def test_missing_values_stay_last_when_descending(sort_index):
+    ids = sort_index.table.ids()
+    assert list(sort_index.sort(ids, 'rating', descending=True))[:1] == [1]
+    assert list(sort_index.sort(ids, 'rating', descending=True))[3:] == [2, 4]
+    assert list(sort_index.sort(ids, 'playcount')) == [0, 3, 1, 2, 4]
+    assert list(sort_index.sort(ids, 'playcount', descending=True)) == [3, 0, 1, 2, 4]
+
+
+def test_rating_ties_keep_file_order(sort_index):
+    ids = sort_index.table.ids()
+    assert list(sort_index.sort(ids, 'rating'))[:2] == [0, 3]
+
+
+def test_filtered_subset_uses_same_order(sort_index):
+    # 视图很小时按名次排序，与全表筛选路径结果一致
+    subset = array('I', [4, 0])
+    assert list(sort_index.sort(subset, 'name')) == [0, 4]
+    assert list(sort_index.sort(subset, 'name', descending=True)) == [4, 0]
+
+
+def test_updated_and_added_games_are_resorted(sort_index):
+    table = sort_index.table
+    search_index = sort_index.search_index
+    ids = table.ids()
+    sort_index.sort(ids, 'name')
+
+    table.names[4] = 'Aardvark'
+    search_index.update(4)
+    game_id = table.append(5, './beta.zip', 'beta', 'Beta', '')
+    search_index.add(game_id)
+
+    assert names(sort_index, sort_index.sort(table.ids(), 'name')) == [
+        'Aardvark', 'alpha', 'Beta', 'Game 2', 'Game 10', '']
@@ -0,0 +1,82 @@
+import json
+from collections import deque
+
+from conftest import tool
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = tool.Tracer()
+    assert tracer.span('scan') is tool.NULL_SPAN
+    with tracer.span('scan'):
+        pass
+    tracer.count('media.hit')
+
+    @tracer.traced('parse')
+    def parse(value):
+        return value * 2
+
+    assert parse(21) == 42
+    assert list(tracer.spans) == [] and tracer.counters == {}
+
+
+def test_spans_counters_and_summary():
+    tracer = tool.Tracer(enabled=True)
+    for i in range(3):
+        with tracer.span('filter', query=f'q{i}'):
+            pass
+    with tracer.span('save'):
+        pass
+    tracer.count('media.hit')
+    tracer.count('media.hit', 4)
+
+    summary = tracer.summary()
+    assert {name: entry[0] for name, entry in summary.items()} == {'filter': 3, 'save': 1}
+    count, total, longest = summary['filter']
+    assert 0 <= longest <= total
+    assert tracer.counters == {'media.hit': 5}
+    assert [span[5] for span in tracer.recent(2)] == [{'query': 'q2'}, {}]
+
+    tracer.clear()
+    assert tracer.summary() == {} and tracer.counters == {}
+
+
+def test_ring_buffer_keeps_latest_spans():
+    tracer = tool.Tracer(enabled=True)
+    tracer.spans = deque(maxlen=5)
+    for i in range(8):
+        with tracer.span('list.rebuild', batch=i):
+            pass
+    assert [span[5]['batch'] for span in tracer.recent()] == [3, 4, 5, 6, 7]
+
+
+def test_profile_next_runs_once_even_when_disabled():
+    tracer = tool.Tracer()
+    profiled = []
+    tracer.profile_next('import', lambda name, profiler: profiled.append(name))
+
+    for _ in range(2):
+        with tracer.span('save'):
+            pass
+        with tracer.span('import'):
+            pass
+
+    assert profiled == ['import']
+    assert tracer.span('import') is tool.NULL_SPAN
+
+
+def test_dump_chrome_trace(tmp_path):
+    tracer = tool.Tracer(enabled=True)
+    with tracer.span('diff', system='snes'):
+        pass
+    tracer.count('diff.updated', 2)
+
+    file_path = str(tmp_path / 'trace.json')
+    assert tracer.dump_chrome_trace(file_path) == 1
+
+    with open(file_path, encoding='utf-8') as f:
+        events = json.load(f)['traceEvents']
+    span, thread_name, counters = events
+    assert (span['name'], span['ph'], span['args']) == ('diff', 'X', {'system': 'snes'})
+    assert span['dur'] >= 0
+    assert thread_name['ph'] == 'M' and thread_name['tid'] == span['tid']
+    assert counters['args'] == {'diff.updated': 2}